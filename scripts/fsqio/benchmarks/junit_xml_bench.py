@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+"""Compare PytestRun's old DOM-based junit xml processing with the single streaming pass, on a synthetic junit xml.
+
+Run from the buildroot:
+  ./scripts/fsqio/benchmarks/junit_xml_bench.py [--testcases 50000] [--files 200] [--repeat 3]
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from xml.dom.minidom import parse as parse_dom
+
+
+BUILDROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir))
+sys.path.insert(0, os.path.join(BUILDROOT, 'src', 'python'))
+
+from fsqio.pants.python.tasks.junit_xml import parse_junit_xml  # noqa
+
+
+def write_junit_xml(path, testcases, files, fail_every):
+  failures = 0
+  with open(path, 'w') as f:
+    f.write('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>\n')
+    lines = []
+    for i in range(testcases):
+      test_file = 'test/python/pkg{}/test_mod{}.py'.format(i % files // 50, i % files)
+      classname = test_file[:-3].replace('/', '.')
+      if i % fail_every == 0:
+        failures += 1
+        body = '><failure message="boom">Traceback</failure></testcase>'
+      else:
+        body = '/>'
+      lines.append('<testcase classname="{}" file="{}" line="{}" name="test_{}" time="0.{:03d}"{}\n'.format(
+        classname, test_file, i, i, i % 1000, body,
+      ))
+    f.write('<testsuite errors="0" failures="{}" name="pytest" tests="{}">\n'.format(failures, testcases))
+    f.writelines(lines)
+    f.write('</testsuite>\n</testsuites>\n')
+
+
+def relsrc_to_target_map(files):
+  # Stands in for PytestRun._map_relsrc_to_targets: every test file under both its chroot and buildroot paths.
+  relsrc_to_target = {}
+  for i in range(files):
+    src = 'pkg{}/test_mod{}.py'.format(i // 50, i)
+    relsrc_to_target[os.path.join('.pants.d/chroot', src)] = 'target{}'.format(i // 10)
+    relsrc_to_target[os.path.join('test/python', src)] = 'target{}'.format(i // 10)
+  return relsrc_to_target
+
+
+def old_pass(xml_path, files):
+  """The previous implementation: two DOM parses, and the source map is rebuilt for every testcase."""
+  xml = parse_dom(xml_path)
+  failed_targets = set()
+  suite = xml.getElementsByTagName('testsuite')[0]
+  if int(suite.getAttribute('failures')) or int(suite.getAttribute('errors')):
+    relsrc_to_target = relsrc_to_target_map(files)
+    for testcase in xml.getElementsByTagName('testcase'):
+      if testcase.getElementsByTagName('failure') or testcase.getElementsByTagName('error'):
+        failed_targets.add(relsrc_to_target.get(testcase.getAttribute('file')))
+
+  xml = parse_dom(xml_path)
+  tests = []
+  for testcase in xml.getElementsByTagName('testcase'):
+    test_info = {attr: testcase.getAttribute(attr) for attr in ('file', 'name', 'classname')}
+    tests.append((relsrc_to_target_map(files).get(test_info['file']), test_info))
+  return failed_targets, len(tests)
+
+
+def new_pass(xml_path, files):
+  relsrc_to_target = relsrc_to_target_map(files)
+  report = parse_junit_xml(xml_path, ['file', 'name', 'classname'])
+  failed_targets = {relsrc_to_target.get(test_file) for test_file in report.failed_files}
+  tests = [(relsrc_to_target.get(info['file']), info) for info in report.tests_info.values()]
+  return failed_targets, len(tests)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--testcases', type=int, default=50000, help='Number of testcases in the synthetic xml.')
+  parser.add_argument('--files', type=int, default=200, help='Number of distinct test files.')
+  parser.add_argument('--fail-every', type=int, default=97, help='Every Nth testcase fails.')
+  parser.add_argument('--repeat', type=int, default=3, help='Timed passes for each implementation.')
+  args = parser.parse_args()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    xml_path = os.path.join(tmpdir, 'TEST-synthetic.xml')
+    write_junit_xml(xml_path, args.testcases, args.files, args.fail_every)
+    if old_pass(xml_path, args.files) != new_pass(xml_path, args.files):
+      print('The two implementations disagree.')
+      return 1
+
+    print('Processing {} testcases over {} files, best of {} passes:'.format(args.testcases, args.files, args.repeat))
+    results = {}
+    for label, impl in (('dom', old_pass), ('streaming', new_pass)):
+      results[label] = min(timeit.repeat(lambda: impl(xml_path, args.files), number=1, repeat=args.repeat))
+      print('  {:<12} {:8.3f}s'.format(label, results[label]))
+    print('  speedup      {:8.2f}x'.format(results['dom'] / results['streaming']))
+    return 0
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
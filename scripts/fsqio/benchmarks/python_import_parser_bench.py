@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+"""Compare the token-scanning and AST paths of PythonImportParser over a tree of python sources.
+
+Run from the buildroot:
+  ./scripts/fsqio/benchmarks/python_import_parser_bench.py [--root src/python] [--repeat 5]
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+
+BUILDROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir))
+sys.path.insert(0, os.path.join(BUILDROOT, 'src', 'python'))
+
+from fsqio.pants.buildgen.python.source_analysis.python_import_parser import PythonImportParser  # noqa
+
+
+def collect_sources(root):
+  sources = []
+  for dirpath, _, filenames in os.walk(root):
+    sources.extend(os.path.join(dirpath, f) for f in filenames if f.endswith('.py'))
+  return sorted(sources)
+
+
+def parse_all(sources, scan_tokens):
+  for source in sources:
+    try:
+      PythonImportParser(source, (), scan_tokens=scan_tokens).lint_and_collect_imports
+    except Exception:
+      # Sources that cannot be parsed by the running interpreter are skipped by both modes.
+      pass
+
+
+def normalized(source, scan_tokens):
+  try:
+    errors, imports = PythonImportParser(source, (), scan_tokens=scan_tokens).lint_and_collect_imports
+  except Exception:
+    return None
+  return sorted(errors), sorted((imp.module or '', imp.aliases, imp.comments) for imp in imports)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--root', default=os.path.join(BUILDROOT, 'src', 'python'), help='Tree of sources to parse.')
+  parser.add_argument('--repeat', type=int, default=5, help='Timed passes over the tree for each mode.')
+  args = parser.parse_args()
+
+  sources = collect_sources(args.root)
+  mismatches = [s for s in sources if normalized(s, True) != normalized(s, False)]
+  if mismatches:
+    print('The two parsing modes disagree on:\n  {}'.format('\n  '.join(mismatches)))
+    return 1
+
+  print('Parsing {} sources under {}, best of {} passes:'.format(len(sources), args.root, args.repeat))
+  results = {}
+  for label, scan_tokens in (('ast', False), ('token scan', True)):
+    results[label] = min(timeit.repeat(lambda: parse_all(sources, scan_tokens), number=1, repeat=args.repeat))
+    print('  {:<12} {:8.3f}s'.format(label, results[label]))
+  print('  speedup      {:8.2f}x'.format(results['ast'] / results['token scan']))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -4,6 +4,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import ast
+from collections import OrderedDict, defaultdict, namedtuple
 from difflib import unified_diff
 import logging
 import os
@@ -12,7 +13,7 @@ import sys
 
 import colors
 from pants.build_graph.address import Address
-from typing import List
+from typing import DefaultDict, Dict, List
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +23,38 @@ class BuildTargetParseError(Exception):
   pass
 
 
+# The parts of a BUILD file that are shared by the manipulators of all of its targets.
+ParsedBuildFile = namedtuple('ParsedBuildFile', ['source_lines', 'indent', 'tree'])
+
+
+def format_diff_msg(header, diff_lines, dry_run=True, use_colors=True):
+  """The terminal message for a BUILD file diff, under a header naming what was changed."""
+
+  def maybe_color(color_fn, msg):
+    return color_fn(msg) if use_colors else msg
+
+  msg = ('\n\n')
+  if dry_run:
+    msg += maybe_color(colors.yellow, 'DRY RUN, would have written this diff:')
+  else:
+    msg += maybe_color(colors.blue, 'REAL RUN, wrote the following diff:')
+  msg += maybe_color(colors.yellow, ('\n' + '*' * 40 + '\n'))
+  msg += header + '\n'
+
+  for line in diff_lines:
+    color_fn = str
+    if line.startswith('+') and not line.startswith('+++'):
+      color_fn = colors.green
+    elif line.startswith('-') and not line.startswith('---'):
+      color_fn = colors.red
+    msg += maybe_color(color_fn, (line + '\n'))
+  msg += maybe_color(colors.yellow, ('*' * 40 + '\n'))
+  return msg
+
+
+_FAIL_ON_DIFF_MSG = "Buildgen wrote a diff. Run `./pants buildgen` locally and commit the buildfile diff with your changes."
+
+
 class DependencySpec(object):
   """A representation of a single dependency spec, including comments around it.
 
@@ -102,7 +135,15 @@ class BuildFileManipulator(object):
     return guess or DEFAULT_INDENT
 
   @classmethod
-  def load(cls, address, target_aliases, artifact_type=None, provides=None):
+  def parse_build_file(cls, rel_path):
+    # type: (str) -> ParsedBuildFile
+    with open(rel_path, 'r') as f:
+      source = f.read()
+    source_lines = source.split('\n')
+    return ParsedBuildFile(source_lines, cls.detect_indentation(source_lines), ast.parse(source))
+
+  @classmethod
+  def load(cls, address, target_aliases, artifact_type=None, provides=None, parsed_build_file=None):
     """A BuildFileManipulator factory class method.
 
     Note that BuildFileManipulator requires a very strict formatting of target declaration.
@@ -118,13 +159,11 @@ class BuildFileManipulator(object):
     :provides list[string]: A list of provides lines provided by the buildgen task.
       Will be codegen into the target unless an existing provides is preceded by a comment string.
       Additional opt-outs by target type or path are offered by the task options.
+    :parsed_build_file: The already parsed BUILD file of the address, see BuildFileSession. If None, the BUILD file
+      is read and parsed.
     """
     name = address.target_name
-    with open(address.rel_path, 'r') as f:
-      source = f.read()
-    source_lines = source.split('\n')
-    indent = cls.detect_indentation(source_lines)
-    tree = ast.parse(source)
+    source_lines, indent, tree = parsed_build_file or cls.parse_build_file(address.rel_path)
 
     # Since we're not told what the last line of an expression is, we have
     # to figure it out based on the start of the expression after it.
@@ -440,6 +479,11 @@ class BuildFileManipulator(object):
                                             address=address))
       self._dependencies_by_address[dep_address] = dep
 
+  @property
+  def target_interval(self):
+    """The [begin, end) lines of the BUILD file that hold this target."""
+    return self._target_interval
+
   def get_dependency_addresses(self):
     return self._dependencies_by_address.keys()
 
@@ -537,46 +581,92 @@ class BuildFileManipulator(object):
                                   lineterm='')
     return list(diff_generator)
 
-  def write(self, dry_run=True, use_colors=True, fail_on_diff=False):
-    """Write out the changes made to the BUILD file, and print the diff to stderr.
 
-    :param dry_run: Don't actually write out the BUILD file, but do print the diff to stderr.
-    :param colors: If False, no colors will be used in the terminal output.
+class BuildFileSession(object):
+  """Batches the edits to many targets so that each BUILD file is parsed once and written once.
+
+  The manipulators handed out by `load` share a single parse of their BUILD file, and none of their edits touch the
+  disk until `write`. That splices every edited target back into its BUILD file and writes each changed file, with
+  its diff, exactly once.
+  """
+
+  def __init__(self):
+    self._parsed_build_files = {}  # type: Dict[str, ParsedBuildFile]
+    self._manipulators = defaultdict(OrderedDict)  # type: DefaultDict[str, OrderedDict]
+
+  def load(self, address, target_aliases, artifact_type=None, provides=None):
+    """Return a BuildFileManipulator for the address, see BuildFileManipulator.load.
+
+    An address that is already loaded gets its existing manipulator back, so that the edits made through each load
+    are all kept. The edits are written by this session.
     """
+    rel_path = address.rel_path
+    if address.target_name in self._manipulators[rel_path]:
+      return self._manipulators[rel_path][address.target_name]
+    if rel_path not in self._parsed_build_files:
+      self._parsed_build_files[rel_path] = BuildFileManipulator.parse_build_file(rel_path)
+    manipulator = BuildFileManipulator.load(
+      address,
+      target_aliases,
+      artifact_type=artifact_type,
+      provides=provides,
+      parsed_build_file=self._parsed_build_files[rel_path],
+    )
+    self._manipulators[rel_path][address.target_name] = manipulator
+    return manipulator
+
+  def build_file_lines(self, rel_path):
+    """The lines of the BUILD file after the edits to all of its loaded targets."""
+    build_file_lines = self._parsed_build_files[rel_path].source_lines[:]
+    # Splice from the bottom of the file up, so that the intervals of the targets above are still valid.
+    manipulators = sorted(self._manipulators[rel_path].values(), key=lambda m: m.target_interval[0], reverse=True)
+    for manipulator in manipulators:
+      target_begin, target_end = manipulator.target_interval
+      build_file_lines[target_begin:target_end] = manipulator.target_lines()
+    return build_file_lines
 
-    def terminal_msg(diff_lines):
+  def diff_lines(self, rel_path):
+    """A diff between the original BUILD file and the BUILD file after all edits."""
+    return list(unified_diff(
+      self._parsed_build_files[rel_path].source_lines,
+      self.build_file_lines(rel_path),
+      fromfile=rel_path,
+      tofile=rel_path,
+      lineterm='',
+    ))
+
+  def diffs(self):
+    """Yield (rel_path, diff_lines) for every BUILD file that the edits change, in sorted order."""
+    for rel_path in sorted(self._manipulators):
+      diff_lines = self.diff_lines(rel_path)
+      if diff_lines:
+        yield rel_path, diff_lines
+
+  def clear(self):
+    """Drop every parse and edit held by the session."""
+    self._parsed_build_files.clear()
+    self._manipulators.clear()
 
-      def maybe_color(color_fn, msg):
-        return color_fn(msg) if use_colors else msg
+  def write(self, dry_run=True, use_colors=True, fail_on_diff=False):
+    """Write out every changed BUILD file, in sorted order, and print each diff to stderr.
 
-      msg = ('\n\n')
-      if dry_run:
-        msg += maybe_color(colors.yellow, 'DRY RUN, would have written this diff:')
-      else:
-        msg += maybe_color(colors.blue, 'REAL RUN, wrote the following diff:')
-      msg += maybe_color(colors.yellow, ('\n' + '*' * 40 + '\n'))
-      msg += 'target at: '
-      msg += str(self.target_address) + '\n'
-
-      for line in diff_lines:
-        color_fn = str
-        if line.startswith('+') and not line.startswith('+++'):
-          color_fn = colors.green
-        elif line.startswith('-') and not line.startswith('---'):
-          color_fn = colors.red
-        msg += maybe_color(color_fn, (line + '\n'))
-      msg += maybe_color(colors.yellow, ('*' * 40 + '\n'))
-      return msg
-
-    diff_lines = self.diff_lines()
-    if diff_lines:
-      sys.stderr.write(terminal_msg(diff_lines))
-      # In CI we want the option to fail the build if buildgen writes a diff.
-      # Note: This will write out the diff for the first incorrect build file and then exit. There may be other changes
-      # which will be picked up if --fail-on-diff is not passed.
-      if fail_on_diff:
-        print("Buildgen wrote a diff. Run `./pants buildgen` locally and commit the buildfile diff with your changes.")
-        sys.exit(1)
-      if not dry_run:
-        with open(self.target_address.rel_path, 'w') as f:
-          f.write('\n'.join(self.build_file_lines()))
+    The session is empty afterwards.
+
+    :param dry_run: Don't actually write out the BUILD files, but do print the diffs to stderr.
+    :param use_colors: If False, no colors will be used in the terminal output.
+    :param fail_on_diff: Exit with a failure at the first BUILD file that would change.
+    """
+    try:
+      for rel_path, diff_lines in self.diffs():
+        header = 'build file at: {}'.format(rel_path)
+        sys.stderr.write(format_diff_msg(header, diff_lines, dry_run=dry_run, use_colors=use_colors))
+        # In CI we want the option to fail the build if buildgen writes a diff. This stops at the first changed BUILD
+        # file, so there may be other changes which will be picked up if --fail-on-diff is not passed.
+        if fail_on_diff:
+          print(_FAIL_ON_DIFF_MSG)
+          sys.exit(1)
+        if not dry_run:
+          with open(rel_path, 'w') as f:
+            f.write('\n'.join(self.build_file_lines(rel_path)))
+    finally:
+      self.clear()
@@ -57,3 +57,4 @@ class BuildgenAggregateTargets(BuildgenTask):
         target_bag=target.address.spec,
         ignored_targets_regex=target.ignored_targets_regex,
       )
+    self.write_build_files()
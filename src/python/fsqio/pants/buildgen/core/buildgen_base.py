@@ -3,9 +3,13 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
+
+from pants.base.exceptions import TaskError
 from pants.task.task import Task
 from pants.util.memo import memoized_property
 
+from fsqio.pants.buildgen.core.buildgen_report import BuildgenReport
 from fsqio.pants.buildgen.core.subsystems.buildgen_subsystem import BuildgenSubsystem
 
 
@@ -25,3 +29,27 @@ class BuildgenBase(Task):
     # TODO(pl): When pants is a proper library dep, remove this ignore.
     # pylint: disable=no-member
     return BuildgenSubsystem.Factory.global_instance().create()
+
+  @memoized_property
+  def check_report(self):
+    """The BuildgenReport that collects this task's problems when buildgen runs with --check, else None."""
+    if not self.buildgen_subsystem.check:
+      return None
+    report_dir = self.buildgen_subsystem.check_report_dir or os.path.join(
+      self.context.options.for_global_scope().pants_distdir,
+      'buildgen-check',
+    )
+    return BuildgenReport(report_dir, self.options_scope, self.context.run_tracker.run_info.get_info('id'))
+
+  def write_check_report(self):
+    """Writes the check_report, if there is one, and prints where to find the report for the whole run.
+
+    :raises: :class:`pants.base.exceptions.TaskError` if the report has any problem, so that CI can gate on --check.
+    """
+    if self.check_report is None:
+      return
+    merged_report_path = self.check_report.write()
+    self.context.log.info(self.check_report.summary())
+    self.context.log.info('Buildgen check report for this run: {}'.format(merged_report_path))
+    if self.check_report.has_problems:
+      raise TaskError('Buildgen check failed. {} See {}'.format(self.check_report.summary(), merged_report_path))
@@ -0,0 +1,134 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import json
+import os
+
+from builtins import str
+from typing import Any, Dict, List, Text
+
+
+class BuildgenReport(object):
+  """The problems that one buildgen task found in check mode: BUILD file diffs and symbols without a provider.
+
+  Each task writes its own `buildgen-task-<name>.json` and `.diff` into the report dir, and then merges the reports of every
+  task in the same run into `buildgen-report.json` and `buildgen-report.diff`. So after a single buildgen run, those
+  two files cover every problem that every task found, and reports left over from earlier runs are dropped.
+  """
+
+  MERGED_NAME = 'buildgen-report'
+  # Each task's own report is `<TASK_PREFIX><name>.json`, so that no other file in the report dir is taken for one.
+  TASK_PREFIX = 'buildgen-task-'
+
+  def __init__(self, report_dir, name, run_id):
+    # type: (Text, Text, Text) -> None
+    self.report_dir = report_dir
+    self.name = name
+    self.run_id = run_id
+    self._diffs = {}  # type: Dict[Text, List[Text]]
+    self._unmapped_symbols = []  # type: List[Dict[Text, Text]]
+
+  def add_diff(self, rel_path, diff_lines):
+    # type: (Text, List[Text]) -> None
+    self._diffs[rel_path] = diff_lines
+
+  def add_unmapped_symbol(self, target_spec, symbol, reason):
+    # type: (Text, Text, Text) -> None
+    self._unmapped_symbols.append({'target': target_spec, 'symbol': symbol, 'reason': reason})
+
+  @property
+  def unmapped_symbols(self):
+    # type: () -> List[Dict[Text, Text]]
+    """The symbols without a providing target added so far, in the order they were added."""
+    return list(self._unmapped_symbols)
+
+  @property
+  def has_problems(self):
+    # type: () -> bool
+    return bool(self._diffs or self._unmapped_symbols)
+
+  def _as_json(self):
+    # type: () -> Dict[Text, Any]
+    return {
+      'run_id': self.run_id,
+      'diffs': {rel_path: '\n'.join(diff_lines) for rel_path, diff_lines in self._diffs.items()},
+      'unmapped_symbols': sorted(self._unmapped_symbols, key=lambda u: (u['target'], u['symbol'])),
+    }
+
+  @staticmethod
+  def _write(path, content):
+    # type: (Text, Text) -> None
+    tmp_path = '{}.tmp'.format(path)
+    with io.open(tmp_path, 'w', encoding='utf-8') as f:
+      f.write(content)
+    os.rename(tmp_path, path)
+
+  def _task_reports(self):
+    # type: () -> Dict[Text, Dict[Text, Any]]
+    """Read the reports of every task in this run, and delete any that are left over from earlier runs."""
+    reports = {}
+    for filename in os.listdir(self.report_dir):
+      basename, ext = os.path.splitext(filename)
+      if ext != '.json' or not basename.startswith(self.TASK_PREFIX):
+        continue
+      with io.open(os.path.join(self.report_dir, filename), 'r', encoding='utf-8') as f:
+        try:
+          report = json.load(f)
+        except ValueError:
+          report = None
+      if isinstance(report, dict) and report.get('run_id') == self.run_id:
+        reports[basename[len(self.TASK_PREFIX):]] = report
+      else:
+        for stale_ext in ('.json', '.diff'):
+          stale = os.path.join(self.report_dir, basename + stale_ext)
+          if os.path.exists(stale):
+            os.remove(stale)
+    return reports
+
+  @staticmethod
+  def _diff_text(diffs):
+    # type: (Dict[Text, Text]) -> Text
+    return ''.join('{}\n'.format(diffs[rel_path]) for rel_path in sorted(diffs))
+
+  def write(self):
+    # type: () -> Text
+    """Write this task's report, then merge it with the others from this run. Returns the merged json path."""
+    if not os.path.isdir(self.report_dir):
+      os.makedirs(self.report_dir)
+    report = self._as_json()
+    report_json = str(json.dumps(report, indent=2, sort_keys=True))
+    task_path = os.path.join(self.report_dir, '{}{}'.format(self.TASK_PREFIX, self.name))
+    self._write('{}.json'.format(task_path), report_json)
+    self._write('{}.diff'.format(task_path), self._diff_text(report['diffs']))
+
+    reports = self._task_reports()
+    # Tasks do not see each other's edits in check mode, so each one's diff of a shared BUILD file is kept.
+    merged_diffs = []
+    merged_unmapped_symbols = []
+    for name in sorted(reports):
+      merged_diffs.extend(
+        {'task': name, 'path': rel_path, 'diff': diff} for rel_path, diff in sorted(reports[name]['diffs'].items())
+      )
+      merged_unmapped_symbols.extend(dict(u, task=name) for u in reports[name]['unmapped_symbols'])
+    merged = {
+      'run_id': self.run_id,
+      'tasks': sorted(reports),
+      'diffs': merged_diffs,
+      'unmapped_symbols': merged_unmapped_symbols,
+    }
+    merged_path = os.path.join(self.report_dir, '{}.json'.format(self.MERGED_NAME))
+    self._write(merged_path, str(json.dumps(merged, indent=2, sort_keys=True)))
+    self._write(
+      os.path.join(self.report_dir, '{}.diff'.format(self.MERGED_NAME)),
+      ''.join('{}\n'.format(entry['diff']) for entry in merged_diffs),
+    )
+    return merged_path
+
+  def summary(self):
+    # type: () -> Text
+    return '{}: {} BUILD files with a diff, {} symbols without a providing target.'.format(
+      self.name, len(self._diffs), len(self._unmapped_symbols),
+    )
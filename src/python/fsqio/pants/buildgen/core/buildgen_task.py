@@ -5,22 +5,45 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from copy import deepcopy
 from itertools import chain
+from multiprocessing import Pool
 
 from pants.base.exceptions import TaskError
+from pants.build_graph.address import Address
 from pants.util.memo import memoized_property
 
-from fsqio.pants.buildgen.core.build_file_manipulator import BuildFileManipulator
+from fsqio.pants.buildgen.core.build_file_manipulator import BuildFileSession
 from fsqio.pants.buildgen.core.buildgen_base import BuildgenBase
 from fsqio.pants.buildgen.core.third_party_map_util import merge_map
 
 
+# The task and targets that the forked workers of `BuildgenTask.buildgen_targets_in_parallel` process.
+_forked_task_and_targets = None
+
+
+def _buildgen_target_in_fork(index):
+  """Compute the BUILD file edit of one target. Runs inside of a worker process forked from the task."""
+  task, targets = _forked_task_and_targets
+  return task._compute_build_file_edit(targets[index])
+
+
 class BuildgenTask(BuildgenBase):
+  """A base task that computes the dependencies of each of its targets and writes them to the BUILD files.
+
+  Subclasses implement `buildgen_target`, which computes the dependencies of one target and passes them to
+  `adjust_target_build_file`. With more than one worker, the dependencies are computed in forked processes, so
+  `buildgen_target` must not change any state other than through `adjust_target_build_file` and the check_report.
+  """
 
   @classmethod
   def prepare(cls, options, round_manager):
     round_manager.require('concrete_target_to_derivatives')
     round_manager.require('source_to_addresses_mapper')
 
+  def __init__(self, *args, **kwargs):
+    super(BuildgenTask, self).__init__(*args, **kwargs)
+    # In a forked worker, this holds the BUILD file edit of the target being processed.
+    self._deferred_build_file_edits = None
+
   @memoized_property
   def dryrun(self):
     return self.buildgen_subsystem.dry_run
@@ -80,8 +103,20 @@ class BuildgenTask(BuildgenBase):
     ))
     return {addr for addr in included_addresses if addr != target.address}
 
+  @memoized_property
+  def build_file_session(self):
+    """Holds the edits to every BUILD file until write_build_files is called."""
+    return BuildFileSession()
+
   def adjust_target_build_file(self, target, computed_dep_addresses, allowlist=None):
-    """Makes a BuildFileManipulator and adjusts the BUILD file to reflect the computed addresses"""
+    """Makes a BuildFileManipulator and adjusts the BUILD file to reflect the computed addresses.
+
+    The edit is held in the build_file_session, and written out by write_build_files.
+    """
+    if self._deferred_build_file_edits is not None:
+      self._deferred_build_file_edits[target] = (computed_dep_addresses, allowlist)
+      return
+
     alias_allowlist = allowlist or self.buildgen_subsystem.target_alias_allowlist
 
     # Tasks can add publication support by overriding `get_provides` and `artifact_type`,
@@ -91,7 +126,7 @@ class BuildgenTask(BuildgenBase):
 
     if provides and self.artifact_type is None:
       raise TaskError
-    manipulator = BuildFileManipulator.load(
+    manipulator = self.build_file_session.load(
       target.address,
       alias_allowlist,
       artifact_type=self.artifact_type,
@@ -114,13 +149,27 @@ class BuildgenTask(BuildgenBase):
     for address in computed_dep_addresses:
       manipulator.add_dependency(address)
 
-    manipulator.write(
+  def write_build_files(self):
+    """Writes every BUILD file edited by adjust_target_build_file, once each.
+
+    With --check, no BUILD file is written and the diffs go to the check_report instead.
+    """
+    if self.check_report is not None:
+      try:
+        for rel_path, diff_lines in self.build_file_session.diffs():
+          self.check_report.add_diff(rel_path, diff_lines)
+      finally:
+        self.build_file_session.clear()
+      self.write_check_report()
+      return
+    self.build_file_session.write(
       dry_run=self.dryrun,
       use_colors=self.get_options().colors,
       fail_on_diff=self.get_options().fail_on_diff
     )
 
-  def execute(self):
+  def buildgen_targets(self):
+    """Returns the sorted target roots that this task will buildgen."""
     def task_targets():
       for target in self.context.target_roots:
         # TODO(mateo): Rework these type checks now that they have all settled on string comparisons.
@@ -132,10 +181,68 @@ class BuildgenTask(BuildgenBase):
 
         if target.type_alias in self.supported_target_aliases and target.type_alias not in self.target_alias_blocklist:
           yield target
-    targets = sorted(list(task_targets()))
+    return sorted(list(task_targets()))
+
+  def execute(self):
+    targets = self.buildgen_targets()
     if self.get_options().level == 'debug':
       print('\n{0} will operate on the following targets:'.format(type(self).__name__))
       for target in targets:
         print('* {0}'.format(target.address.reference()))
-    for target in targets:
+    workers = min(self.buildgen_subsystem.workers, len(targets))
+    if workers > 1:
+      self.buildgen_targets_in_parallel(targets, workers)
+    else:
+      for target in targets:
+        self.buildgen_target(target)
+    self.write_build_files()
+
+  def prepare_buildgen_in_parallel(self, targets):
+    """Build any state that the targets share, before it is forked to the workers of buildgen_targets_in_parallel.
+
+    Subclasses should override this to build their memoized lookup structures once, instead of once per worker, and
+    to fill any cache that they persist, since what a worker adds to a cache is lost.
+    """
+    _ = self.check_report
+
+  def _compute_build_file_edit(self, target):
+    """Returns the picklable (dependency specs, allowlist, unmapped symbols) that buildgen_target computes."""
+    check_report = self.check_report
+    unmapped_count = len(check_report.unmapped_symbols) if check_report is not None else 0
+    self._deferred_build_file_edits = {}
+    try:
       self.buildgen_target(target)
+      edit = self._deferred_build_file_edits.get(target)
+    finally:
+      self._deferred_build_file_edits = None
+    unmapped_symbols = check_report.unmapped_symbols[unmapped_count:] if check_report is not None else []
+    if edit is None:
+      return None, None, unmapped_symbols
+    computed_dep_addresses, allowlist = edit
+    return sorted(address.spec for address in computed_dep_addresses), allowlist, unmapped_symbols
+
+  def buildgen_targets_in_parallel(self, targets, workers):
+    """Computes the dependencies of the targets in forked processes, then edits their BUILD files serially in order.
+
+    Computing dependencies is CPU-bound python, so threads would not run it any faster. Only the picklable results
+    come back from the workers.
+    """
+    global _forked_task_and_targets
+    self.prepare_buildgen_in_parallel(targets)
+    _forked_task_and_targets = (self, targets)
+    try:
+      pool = Pool(processes=workers)
+      try:
+        edits = pool.map(_buildgen_target_in_fork, range(len(targets)),
+                         chunksize=max(1, len(targets) // (workers * 4)))
+      finally:
+        pool.close()
+        pool.join()
+    finally:
+      _forked_task_and_targets = None
+
+    for target, (dep_specs, allowlist, unmapped_symbols) in zip(targets, edits):
+      for unmapped in unmapped_symbols:
+        self.check_report.add_unmapped_symbol(unmapped['target'], unmapped['symbol'], unmapped['reason'])
+      if dep_specs is not None:
+        self.adjust_target_build_file(target, [Address.parse(spec) for spec in dep_specs], allowlist=allowlist)
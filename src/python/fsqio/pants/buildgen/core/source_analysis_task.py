@@ -3,38 +3,57 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from itertools import chain
+from hashlib import sha1
 import json
 import os
 
+from pants.invalidation.cache_manager import VersionedTargetSet
 from pants.task.task import Task
+from pants.util.dirutil import safe_mkdir
 
 
 class SourceAnalysisTask(Task):
   """A parent Task for buildgen upstream analysis tasks which provide source -> analysis products.
 
   SourceAnalysisTask factors out a large amount of boilerplate and handles caching logic.
+
+  Each target's analysis.json records a content fingerprint for every source alongside its analysis. When a target
+  is invalidated, only the sources whose bytes changed since its previous results are passed to analyze_sources.
+
+  The merged analysis of all targets is also written to a single file keyed by their combined fingerprint, so a run
+  where every target is valid loads the product with one read instead of one read per target.
   """
 
   @classmethod
   def implementation_version(cls):
-    return super(SourceAnalysisTask, cls).implementation_version() + [('SourceAnalysisTask', 4)]
+    return super(SourceAnalysisTask, cls).implementation_version() + [('SourceAnalysisTask', 5)]
 
   @classmethod
   def product_types(cls):
     return [
       cls.analysis_product_name(),
+      cls.analysis_fingerprint_product_name(),
     ]
 
   @property
   def cache_target_dirs(self):
     return True
 
+  @property
+  def incremental(self):
+    # The previous results of an invalid target are consulted for the analysis of its unchanged sources.
+    return True
+
   @classmethod
   def analysis_product_name(cls):
     """A string that names the product type this task produces."""
     raise NotImplementedError()
 
+  @classmethod
+  def analysis_fingerprint_product_name(cls):
+    """Names a product holding a string that changes whenever this task's analysis product does."""
+    return '{}_fingerprint'.format(cls.analysis_product_name())
+
   @property
   def claimed_target_types(self):
     """A tuple of target types that the implementing class will do source analysis on."""
@@ -62,11 +81,70 @@ class SourceAnalysisTask(Task):
   def __init__(self, *args, **kwargs):
     super(SourceAnalysisTask, self).__init__(*args, **kwargs)
 
+  @staticmethod
+  def source_fingerprint(source_relpath):
+    hasher = sha1()
+    with open(source_relpath, 'rb') as f:
+      hasher.update(f.read())
+    return hasher.hexdigest()
+
+  @staticmethod
+  def _read_analysis_file(analysis_file):
+    """Returns the (fingerprints, analysis) maps stored in an analysis.json."""
+    with open(analysis_file, 'rb') as f:
+      analysis_bytes = f.read()
+    target_analysis = json.loads(analysis_bytes)
+    # Files written before per-source fingerprints existed are just the analysis map, none of it can be reused.
+    if set(target_analysis.keys()) != {'fingerprints', 'analysis'}:
+      return {}, target_analysis
+    return target_analysis['fingerprints'], target_analysis['analysis']
+
+  def _previous_analysis(self, vt):
+    if not vt.has_previous_results_dir:
+      return {}, {}
+    previous_file = os.path.join(vt.previous_results_dir, 'analysis.json')
+    if not os.path.isfile(previous_file):
+      return {}, {}
+    try:
+      return self._read_analysis_file(previous_file)
+    except ValueError:
+      return {}, {}
+
+  @property
+  def _aggregated_analysis_dir(self):
+    return os.path.join(self.workdir, 'aggregated_analysis')
+
+  def _write_aggregated_analysis(self, aggregated_file, analysis_product):
+    # Only the analysis for the current fingerprint is ever read, so drop any older aggregates.
+    aggregated_dir = os.path.dirname(aggregated_file)
+    safe_mkdir(aggregated_dir, clean=True)
+    tmp_file = '{}.tmp'.format(aggregated_file)
+    with open(tmp_file, 'wb') as f:
+      f.write(json.dumps(analysis_product))
+    os.rename(tmp_file, aggregated_file)
+
+  def _create_products(self, analysis_product, fingerprint):
+    products = self.context.products
+    products.safe_create_data(self.analysis_product_name(), lambda: analysis_product)
+    products.safe_create_data(self.analysis_fingerprint_product_name(), lambda: fingerprint)
+
   def execute(self):
     with self.invalidated(self.targets(), invalidate_dependents=False) as invalidation_check:
       def target_analysis_file(vt):
         return os.path.join(vt.results_dir, 'analysis.json')
 
+      if not invalidation_check.all_vts:
+        self._create_products({}, 'empty')
+        return
+
+      global_vts = VersionedTargetSet.from_versioned_targets(invalidation_check.all_vts)
+      aggregated_file = os.path.join(self._aggregated_analysis_dir, '{}.json'.format(global_vts.cache_key.hash))
+      if not invalidation_check.invalid_vts and os.path.isfile(aggregated_file):
+        with open(aggregated_file, 'rb') as f:
+          analysis_product = json.loads(f.read())
+        self._create_products(analysis_product, global_vts.cache_key.hash)
+        return
+
       analyzable_sources_by_target = {
         vt.target: set(
           source for source in vt.target.sources_relative_to_buildroot()
@@ -75,15 +153,22 @@ class SourceAnalysisTask(Task):
         for vt in invalidation_check.all_vts
       }
 
-      invalid_targets = [vt.target for vt in invalidation_check.invalid_vts]
-      invalid_analyzable_sources = set(
-        chain.from_iterable(
-          [source for source in t.sources_relative_to_buildroot() if self.is_analyzable(source)]
-          for t in invalid_targets
-        )
-      )
-      calculated_analysis = self.analyze_sources(list(invalid_analyzable_sources))
-      uncalculated_analysis = invalid_analyzable_sources - set(calculated_analysis.keys())
+      # Fingerprint the sources of invalid targets, and reuse the previous analysis of any that are unchanged.
+      source_fingerprints = {}
+      source_analysis = {}
+      for vt in invalidation_check.invalid_vts:
+        previous_fingerprints, previous_analysis = self._previous_analysis(vt)
+        for source in analyzable_sources_by_target[vt.target]:
+          fingerprint = source_fingerprints.get(source) or self.source_fingerprint(source)
+          source_fingerprints[source] = fingerprint
+          if previous_fingerprints.get(source) == fingerprint and source in previous_analysis:
+            source_analysis[source] = previous_analysis[source]
+      changed_analyzable_sources = set(source_fingerprints) - set(source_analysis)
+
+      calculated_analysis = {}
+      if changed_analyzable_sources:
+        calculated_analysis = self.analyze_sources(list(changed_analyzable_sources))
+      uncalculated_analysis = changed_analyzable_sources - set(calculated_analysis.keys())
       if uncalculated_analysis:
         raise Exception(
           '{0} failed to calculate analysis for the following sources:\n * {1}\n'
@@ -92,22 +177,22 @@ class SourceAnalysisTask(Task):
             '\n * '.join(sorted(uncalculated_analysis))
           )
         )
+      source_analysis.update(calculated_analysis)
 
-      # This writes the per-target analysis to json for the cache. We should consider making a synthetic
-      # target to hold an aggregated bag and speed up the noop case.
+      # This writes the per-target analysis to json for the artifact cache, the aggregated file is written below.
       analysis_product = {}
       for vt in invalidation_check.all_vts:
-        target_analysis = {}
         if not vt.valid:
-          for source in analyzable_sources_by_target[vt.target]:
-            target_analysis[source] = calculated_analysis[source]
+          sources = analyzable_sources_by_target[vt.target]
+          target_analysis = {
+            'fingerprints': {source: source_fingerprints[source] for source in sources},
+            'analysis': {source: source_analysis[source] for source in sources},
+          }
           target_analysis_bytes = json.dumps(target_analysis)
           with open(target_analysis_file(vt), 'wb') as f:
             f.write(target_analysis_bytes)
 
-        with open(target_analysis_file(vt), 'rb') as f:
-          analysis_bytes = f.read()
-        target_analysis = json.loads(analysis_bytes)
-
+        _, target_analysis = self._read_analysis_file(target_analysis_file(vt))
         analysis_product.update(target_analysis)
-      self.context.products.safe_create_data(self.analysis_product_name(), lambda: analysis_product)
+      self._write_aggregated_analysis(aggregated_file, analysis_product)
+      self._create_products(analysis_product, global_vts.cache_key.hash)
@@ -63,6 +63,30 @@ class BuildgenSubsystem(object):
         type=bool,
         help='When True, buildgen will exit non 0. This is used for failing builds in CI.',
       )
+      register(
+        '--workers',
+        default=1,
+        advanced=True,
+        type=int,
+        help='Number of processes to compute the dependencies of targets in. BUILD files are still edited '
+             'afterwards, one target at a time in sorted order, so the diffs do not depend on this setting.',
+      )
+      register(
+        '--check',
+        default=False,
+        type=bool,
+        help='When True, buildgen writes no BUILD files and does not stop at the first problem. Every BUILD file diff '
+             'and every symbol without a providing target is collected into buildgen-report.json and '
+             'buildgen-report.diff under --check-report-dir, which CI can read once the goal finishes. A task that '
+             'finds any problem fails the goal once its report is written, so later tasks do not run.',
+      )
+      register(
+        '--check-report-dir',
+        default=None,
+        advanced=True,
+        type=str,
+        help='Where --check writes its reports. Defaults to buildgen-check under the pants distdir.',
+      )
 
     def create(self):
       options = self.get_options()
@@ -74,6 +98,9 @@ class BuildgenSubsystem(object):
         options.buildgen_target_bags,
         options.dry_run,
         options.fail_on_diff,
+        options.workers,
+        options.check,
+        options.check_report_dir,
       )
 
   def __init__(
@@ -85,6 +112,9 @@ class BuildgenSubsystem(object):
     buildgen_target_bags,
     dry_run,
     fail_on_diff,
+    workers=1,
+    check=False,
+    check_report_dir=None,
   ):
     self.source_dirs = source_dirs
     self.test_dirs = test_dirs
@@ -93,3 +123,6 @@ class BuildgenSubsystem(object):
     self.buildgen_target_bags = buildgen_target_bags
     self.dry_run = dry_run
     self.fail_on_diff = fail_on_diff
+    self.workers = workers
+    self.check = check
+    self.check_report_dir = check_report_dir
@@ -3,7 +3,11 @@
 
 from __future__ import absolute_import, division, print_function
 
+from array import array
 from itertools import chain
+import mmap
+import os
+import struct
 
 
 class SymbolTreeNode(object):
@@ -89,3 +93,291 @@ class SymbolTreeNode(object):
       v.render(nindent + 1, indent, lines)
     if top:
       return '\n'.join(map(' '.join, lines))
+
+
+class _CompactSymbolTreeNode(object):
+  __slots__ = ('children', 'values', 'flattened')
+
+  # Values are kept in a tuple until there are more than this many, since most nodes only hold one or two.
+  _MAX_TUPLE_VALUES = 8
+
+  def __init__(self):
+    # Children and values are lazily created: most nodes of a JVM symbol tree are leaves with a single value.
+    self.children = None
+    self.values = ()
+    self.flattened = None
+
+  def add_value(self, value):
+    if isinstance(self.values, tuple):
+      if value in self.values:
+        return
+      if len(self.values) < self._MAX_TUPLE_VALUES:
+        self.values += (value,)
+        return
+      self.values = set(self.values)
+    self.values.add(value)
+
+
+class CompactSymbolTree(object):
+  """A memory-lean drop-in for SymbolTreeNode, for trees holding millions of symbols.
+
+  Nodes use __slots__ and only allocate their children (and a set of values) when needed, every symbol segment and
+  value is interned once per tree, insert and get walk the tree iteratively, and flattened subtrees are cached on the
+  node they were computed for. An insert clears the cache of every node on its path, since those are the only
+  subtrees that it changes.
+  """
+
+  def __init__(self):
+    self._root = _CompactSymbolTreeNode()
+    self._interned = {}
+
+  def _intern(self, string):
+    return self._interned.setdefault(string, string)
+
+  def insert(self, symbol, value):
+    """Insert value into the tree at symbol.
+
+    :param string symbol: This symbol will be split on '.' to create nodes in the prefix tree.
+    :param string value: This value (generally a source path) will be inserted into the set of
+      values provided at the node produced by `symbol`.
+    """
+    node = self._root
+    for part in symbol.split('.'):
+      node.flattened = None
+      if node.children is None:
+        node.children = {}
+      child = node.children.get(part)
+      if child is None:
+        child = node.children[self._intern(part)] = _CompactSymbolTreeNode()
+      node = child
+    node.flattened = None
+    node.add_value(self._intern(value))
+
+  def _flattened(self, node):
+    if node.flattened is None:
+      flattened = set()
+      stack = [node]
+      while stack:
+        current = stack.pop()
+        if current is not node and current.flattened is not None:
+          flattened.update(current.flattened)
+          continue
+        if current.values:
+          flattened.update(current.values)
+        if current.children:
+          stack.extend(current.children.values())
+      node.flattened = frozenset(flattened)
+    return node.flattened
+
+  def flattened_subtree(self):
+    """Returns the set of all values provided by the tree."""
+    return set(self._flattened(self._root))
+
+  def get(self, symbol, allow_prefix_imports=False, exact=False):
+    """Returns the values at the node inferred from `symbol`.
+
+    See SymbolTreeNode.get, which this matches exactly.
+    """
+    if allow_prefix_imports and exact:
+      raise ValueError('Cannot call CompactSymbolTree.get() with both allow_prefix_imports=True and'
+                       ' exact=True.  Symbol was: {0}'.format(symbol))
+    parts = symbol.split('.')
+    last = len(parts) - 1
+    node = self._root
+    for i, part in enumerate(parts):
+      if i == last and part == '_':
+        return set(self._flattened(node))
+      child = node.children.get(part) if node.children else None
+      if child is None:
+        return set() if exact else set(node.values)
+      node = child
+    if not node.values and allow_prefix_imports:
+      return set(self._flattened(node))
+    return set(node.values)
+
+  def render(self, indent='  '):
+    "Render the tree as a string, in the same format as SymbolTreeNode.render."
+    lines = []
+    stack = [(None, self._root, 0)]
+    while stack:
+      key, node, nindent = stack.pop()
+      if key is not None:
+        lines.append(((nindent - 1) * indent, key))
+      for val in node.values:
+        lines.append((nindent * indent, val))
+      # Children are pushed in reverse so that they pop (and render) in iteration order.
+      for k, v in reversed(list((node.children or {}).items())):
+        stack.append((k, v, nindent + 1))
+    return '\n'.join(map(' '.join, lines))
+
+
+class MappedSymbolTree(object):
+  """A read-only CompactSymbolTree that is memory-mapped from a file, so it can be reused between runs.
+
+  The file is laid out so that lookups never need to deserialize the tree:
+    * header: magic, then the number of strings, nodes, edges and values.
+    * string offsets and blob: every segment and value, utf-8 encoded and sorted bytewise.
+    * nodes, in depth-first pre-order: (first edge, edge count, first value, end of subtree). A sentinel node at the
+      end holds the total value count, so that node i owns values [first value(i), first value(i + 1)).
+    * edges: (segment string id, child node), grouped by parent and sorted by segment.
+    * values: string ids, in node order.
+  Because of the pre-order layout, the flattened subtree of node i is the contiguous run of values between
+  first value(i) and first value(end of subtree(i)).
+  """
+
+  MAGIC = b'FSQSYMT1'
+  _HEADER = struct.Struct('=8sIIII')
+  _UINT = struct.Struct('=I')
+  _NODE = struct.Struct('=IIII')
+  _EDGE = struct.Struct('=II')
+
+  @classmethod
+  def write(cls, tree, path):
+    """Serialize a CompactSymbolTree to path. The file is written to a temp file and then moved into place."""
+    strings = set()
+    stack = [tree._root]
+    while stack:
+      node = stack.pop()
+      strings.update(node.values)
+      if node.children:
+        strings.update(node.children)
+        stack.extend(node.children.values())
+    encoded = sorted((string.encode('utf-8'), string) for string in strings)
+    string_ids = dict((string, i) for i, (_, string) in enumerate(encoded))
+
+    nodes = []
+    edges = []
+    values = array('I')
+    parents = []
+    # Each stack entry holds a node and the index of the edge that points to it from its parent.
+    stack = [(tree._root, None)]
+    while stack:
+      node, parent_edge = stack.pop()
+      index = len(nodes)
+      if parent_edge is not None:
+        edges[parent_edge][1] = index
+        parents.append(edges[parent_edge][2])
+      else:
+        parents.append(None)
+      values.extend(sorted(string_ids[value] for value in node.values))
+      children = sorted((string_ids[key], child) for key, child in (node.children or {}).items())
+      first_edge = len(edges)
+      nodes.append([first_edge, len(children), len(values) - len(node.values), index + 1])
+      for string_id, _ in children:
+        edges.append([string_id, None, index])
+      # Push in reverse so that children are laid out in segment order.
+      for offset in reversed(range(len(children))):
+        stack.append((children[offset][1], first_edge + offset))
+
+    # Children always come after their parents, so walking backwards can roll the subtree ends up.
+    for index in reversed(range(1, len(nodes))):
+      parent = parents[index]
+      nodes[parent][3] = max(nodes[parent][3], nodes[index][3])
+
+    offsets = array('I', [0])
+    for string_bytes, _ in encoded:
+      offsets.append(offsets[-1] + len(string_bytes))
+
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as f:
+      f.write(cls._HEADER.pack(cls.MAGIC, len(encoded), len(nodes), len(edges), len(values)))
+      f.write(offsets.tostring() if hasattr(offsets, 'tostring') else offsets.tobytes())
+      f.write(b''.join(string_bytes for string_bytes, _ in encoded))
+      for node in nodes:
+        f.write(cls._NODE.pack(*node))
+      f.write(cls._NODE.pack(0, 0, len(values), len(nodes)))
+      for string_id, child, _ in edges:
+        f.write(cls._EDGE.pack(string_id, child))
+      f.write(values.tostring() if hasattr(values, 'tostring') else values.tobytes())
+    os.rename(tmp_path, path)
+
+  @classmethod
+  def load(cls, path):
+    """Memory-map a tree written by MappedSymbolTree.write. Returns None if the file is not a valid tree."""
+    with open(path, 'rb') as f:
+      try:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      except (ValueError, mmap.error):
+        return None
+    if len(buf) < cls._HEADER.size or cls._HEADER.unpack_from(buf, 0)[0] != cls.MAGIC:
+      buf.close()
+      return None
+    return cls(buf)
+
+  def __init__(self, buf):
+    self._buf = buf
+    _, num_strings, num_nodes, num_edges, num_values = self._HEADER.unpack_from(buf, 0)
+    self._offsets_start = self._HEADER.size
+    self._blob_start = self._offsets_start + (num_strings + 1) * self._UINT.size
+    self._nodes_start = self._blob_start + self._UINT.unpack_from(buf, self._offsets_start + num_strings * 4)[0]
+    self._edges_start = self._nodes_start + (num_nodes + 1) * self._NODE.size
+    self._values_start = self._edges_start + num_edges * self._EDGE.size
+    self._num_nodes = num_nodes
+    self._decoded = {}
+
+  def _string_bytes(self, string_id):
+    start, end = struct.unpack_from('=II', self._buf, self._offsets_start + string_id * 4)
+    return self._buf[self._blob_start + start:self._blob_start + end]
+
+  def _string(self, string_id):
+    string = self._decoded.get(string_id)
+    if string is None:
+      string = self._decoded[string_id] = self._string_bytes(string_id).decode('utf-8')
+    return string
+
+  def _node(self, index):
+    return self._NODE.unpack_from(self._buf, self._nodes_start + index * self._NODE.size)
+
+  def _child(self, index, segment):
+    first_edge, edge_count, _, _ = self._node(index)
+    lo, hi = first_edge, first_edge + edge_count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      string_id, child = self._EDGE.unpack_from(self._buf, self._edges_start + mid * self._EDGE.size)
+      candidate = self._string_bytes(string_id)
+      if candidate == segment:
+        return child
+      elif candidate < segment:
+        lo = mid + 1
+      else:
+        hi = mid
+    return None
+
+  def _values_between(self, start, end):
+    return set(
+      self._string(self._UINT.unpack_from(self._buf, self._values_start + i * self._UINT.size)[0])
+      for i in range(start, end)
+    )
+
+  def _values(self, index):
+    return self._values_between(self._node(index)[2], self._node(index + 1)[2])
+
+  def _flattened(self, index):
+    return self._values_between(self._node(index)[2], self._node(self._node(index)[3])[2])
+
+  def flattened_subtree(self):
+    """Returns the set of all values provided by the tree."""
+    return self._flattened(0)
+
+  def get(self, symbol, allow_prefix_imports=False, exact=False):
+    """Returns the values at the node inferred from `symbol`.
+
+    See SymbolTreeNode.get, which this matches exactly.
+    """
+    if allow_prefix_imports and exact:
+      raise ValueError('Cannot call MappedSymbolTree.get() with both allow_prefix_imports=True and'
+                       ' exact=True.  Symbol was: {0}'.format(symbol))
+    parts = symbol.split('.')
+    last = len(parts) - 1
+    node = 0
+    for i, part in enumerate(parts):
+      if i == last and part == '_':
+        return self._flattened(node)
+      child = self._child(node, part.encode('utf-8'))
+      if child is None:
+        return set() if exact else self._values(node)
+      node = child
+    values = self._values(node)
+    if not values and allow_prefix_imports:
+      return self._flattened(node)
+    return values
@@ -3,13 +3,25 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import os
+
+from pants.backend.jvm.targets.java_library import JavaLibrary
+from pants.backend.jvm.targets.scala_library import ScalaLibrary
+from pants.base.hash_utils import stable_json_hash
+from pants.invalidation.cache_manager import VersionedTargetSet
 from pants.task.task import Task
+from pants.util.dirutil import safe_mkdir
 
-from fsqio.pants.buildgen.core.symbol_tree import SymbolTreeNode
+from fsqio.pants.buildgen.core.symbol_tree import CompactSymbolTree, MappedSymbolTree
+from fsqio.pants.buildgen.jvm.core.map_java_exported_symbols import MapJavaExportedSymbols
 
 
 class MapJvmSymbolToSourceTree(Task):
-  """A prefix tree mapping JVM symbols to sources that export that symbol."""
+  """A prefix tree mapping JVM symbols to sources that export that symbol.
+
+  The tree is written to the workdir keyed by the fingerprints of the exported symbol products, and memory-mapped
+  on later runs instead of being rebuilt from those products.
+  """
 
   @classmethod
   def product_types(cls):
@@ -22,15 +34,16 @@ class MapJvmSymbolToSourceTree(Task):
     round_manager.require_data('scala')
     round_manager.require_data('java_source_to_exported_symbols')
     round_manager.require_data('scala_source_to_exported_symbols')
+    round_manager.require_data('scala_source_to_exported_symbols_fingerprint')
 
   @classmethod
   def implementation_version(cls):
-    return super(MapJvmSymbolToSourceTree, cls).implementation_version() + [('MapJvmSymbolToSourceTree', 2)]
+    return super(MapJvmSymbolToSourceTree, cls).implementation_version() + [('MapJvmSymbolToSourceTree', 4)]
 
-  def execute(self):
+  def build_tree(self):
     products = self.context.products
     scala_source_to_exported_symbols = products.get_data('scala_source_to_exported_symbols')
-    jvm_symbol_to_source_tree = SymbolTreeNode()
+    jvm_symbol_to_source_tree = CompactSymbolTree()
     for source, analysis in scala_source_to_exported_symbols.items():
       exported_symbols = analysis['exported_symbols']
       for symbol in exported_symbols:
@@ -39,6 +52,29 @@ class MapJvmSymbolToSourceTree(Task):
     for source, symbols in java_source_to_exported_symbols.items():
       for symbol in symbols:
         jvm_symbol_to_source_tree.insert(symbol, source)
+    return jvm_symbol_to_source_tree
+
+  def execute(self):
+    # The java symbols are derived from these targets' source paths alone, see MapJavaExportedSymbols.
+    java_targets = self.context.build_graph.targets(lambda t: isinstance(t, (JavaLibrary, ScalaLibrary)))
+    with self.invalidated(java_targets, invalidate_dependents=False) as invalidation_check:
+      java_vts = VersionedTargetSet.from_versioned_targets(invalidation_check.all_vts)
+      java_fingerprint = java_vts.cache_key.hash if invalidation_check.all_vts else 'empty'
+    fingerprint = stable_json_hash([
+      self.context.products.get_data('scala_source_to_exported_symbols_fingerprint'),
+      java_fingerprint,
+      MapJavaExportedSymbols.implementation_version(),
+      self.fingerprint,
+    ])
+    tree_file = os.path.join(self.workdir, 'jvm_symbol_to_source_tree-{}.bin'.format(fingerprint))
+    jvm_symbol_to_source_tree = None
+    if os.path.isfile(tree_file):
+      jvm_symbol_to_source_tree = MappedSymbolTree.load(tree_file)
+    if jvm_symbol_to_source_tree is None:
+      jvm_symbol_to_source_tree = self.build_tree()
+      # Only the tree for the current fingerprint is ever read, so drop any older ones.
+      safe_mkdir(self.workdir, clean=True)
+      MappedSymbolTree.write(jvm_symbol_to_source_tree, tree_file)
 
-    products.safe_create_data('jvm_symbol_to_source_tree',
-                              lambda: jvm_symbol_to_source_tree)
+    self.context.products.safe_create_data('jvm_symbol_to_source_tree',
+                                           lambda: jvm_symbol_to_source_tree)
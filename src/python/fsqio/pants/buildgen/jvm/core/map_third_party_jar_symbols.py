@@ -23,6 +23,7 @@ class MapThirdPartyJarSymbols(Task):
   def product_types(cls):
     return [
       'third_party_jar_symbols',
+      'third_party_jar_symbols_fingerprint',
     ]
 
   @classmethod
@@ -107,6 +108,7 @@ class MapThirdPartyJarSymbols(Task):
         v['fully_qualified_classes'] for v in analysis['jar_to_symbols_exported'].values()
       ))
       products.safe_create_data('third_party_jar_symbols', lambda: third_party_jar_symbols)
+      products.safe_create_data('third_party_jar_symbols_fingerprint', lambda: global_vts.cache_key.hash)
 
   def check_artifact_cache_for(self, invalidation_check):
     global_vts = VersionedTargetSet.from_versioned_targets(invalidation_check.all_vts)
@@ -136,7 +136,7 @@ class MapScalaLibraryUsedAddresses(BuildgenBase):
             self._manually_defined_spec_to_address(manually_defined_target).reference(),
           )
         )
-        errors.append((target.address.reference(), symbol))
+        errors.append((target.address.reference(), symbol, 'provided by both sources and the third party map'))
         continue
       elif exact_matching_sources:
         addresses = set(chain.from_iterable(
@@ -148,7 +148,7 @@ class MapScalaLibraryUsedAddresses(BuildgenBase):
       elif manually_defined_target:
         addresses = [self._manually_defined_spec_to_address(manually_defined_target)]
       else:
-        errors.append((target.address.reference(), symbol))
+        errors.append((target.address.reference(), symbol, 'no providing target'))
         continue
       for address in addresses:
         dep = self.context.build_graph.get_target(address)
@@ -167,9 +167,12 @@ class MapScalaLibraryUsedAddresses(BuildgenBase):
           # consumers normalize this to a concrete target if necessary.
           used_addresses.add(dep.address)
 
-    if errors:
+    if errors and self.check_report is not None:
+      for spec, symbol, reason in errors:
+        self.check_report.add_unmapped_symbol(spec, symbol, reason)
+    elif errors:
       err_msg = []
-      for spec, symbol in errors:
+      for spec, symbol, _ in errors:
         err_msg.append("")
         err_msg.append("Symbol: " + symbol)
         err_msg.append("Target: " + spec)
@@ -187,3 +190,4 @@ class MapScalaLibraryUsedAddresses(BuildgenBase):
       scala_library_to_used_addresses[target].update(self._scala_library_used_addresses(target))
     products.safe_create_data('scala_library_to_used_addresses',
                               lambda: scala_library_to_used_addresses)
+    self.write_check_report()
@@ -34,6 +34,7 @@ class MapScalaExportedSymbols(NailgunTask, SourceAnalysisTask, ScalacBuildgenTas
   def register_options(cls, register):
     super(MapScalaExportedSymbols, cls).register_options(register)
     cls.register_scalac_buildgen_jvm_tools(register)
+    cls.register_scalac_buildgen_options(register)
 
   def is_analyzable(self, source):
     return os.path.splitext(source)[1] == '.scala'
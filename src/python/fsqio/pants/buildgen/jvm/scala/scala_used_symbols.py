@@ -3,11 +3,16 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import heapq
+from itertools import chain
+import os
 from os import path as P
 
 from pants.backend.jvm.targets.junit_tests import JUnitTests
 from pants.backend.jvm.targets.scala_library import ScalaLibrary
 from pants.backend.jvm.tasks.nailgun_task import NailgunTask
+from pants.base.hash_utils import stable_json_hash
+from pants.util.dirutil import safe_mkdir
 from pants.util.memo import memoized_property
 
 from fsqio.pants.buildgen.core.source_analysis_task import SourceAnalysisTask
@@ -29,26 +34,50 @@ class MapScalaUsedSymbols(ScalacBuildgenTaskMixin, SourceAnalysisTask, NailgunTa
   def prepare(cls, options, round_manager):
     super(MapScalaUsedSymbols, cls).prepare(options, round_manager)
     round_manager.require_data('scala_source_to_exported_symbols')
+    round_manager.require_data('scala_source_to_exported_symbols_fingerprint')
     round_manager.require_data('third_party_jar_symbols')
+    round_manager.require_data('third_party_jar_symbols_fingerprint')
 
   @classmethod
   def register_options(cls, register):
     super(MapScalaUsedSymbols, cls).register_options(register)
     cls.register_scalac_buildgen_jvm_tools(register)
+    cls.register_scalac_buildgen_options(register)
 
   @property
   def claimed_target_types(self):
     return (ScalaLibrary, JUnitTests)
 
   @memoized_property
-  def symbol_whitelist(self):
+  def symbol_whitelist_path(self):
+    """A sorted, deduplicated file of every third party and exported scala symbol, one per line.
+
+    The file is keyed by the fingerprints of the two products it is built from, so it is only rewritten when
+    the third party jars or the exported scala symbols change.
+    """
     products = self.context.products
-    scala_source_to_exported_symbols = products.get_data('scala_source_to_exported_symbols')
-    third_party_jar_symbols = products.get_data('third_party_jar_symbols')
-    symbol_whitelist = third_party_jar_symbols.copy()
-    for _, symbols in scala_source_to_exported_symbols.items():
-      symbol_whitelist.update(set(symbols['exported_symbols']))
-    return symbol_whitelist
+    fingerprint = stable_json_hash([
+      products.get_data('third_party_jar_symbols_fingerprint'),
+      products.get_data('scala_source_to_exported_symbols_fingerprint'),
+    ])
+    whitelist_dir = os.path.join(self.workdir, 'symbol_whitelist')
+    whitelist_path = os.path.join(whitelist_dir, '{}.txt'.format(fingerprint))
+    if not os.path.isfile(whitelist_path):
+      third_party_jar_symbols = products.get_data('third_party_jar_symbols')
+      scala_source_to_exported_symbols = products.get_data('scala_source_to_exported_symbols')
+      exported_symbols = set(chain.from_iterable(
+        symbols['exported_symbols'] for symbols in scala_source_to_exported_symbols.values()
+      ))
+      exported_symbols.difference_update(third_party_jar_symbols)
+      # Only the whitelist for the current fingerprint is ever read, so drop any older ones.
+      safe_mkdir(whitelist_dir, clean=True)
+      tmp_path = '{}.tmp'.format(whitelist_path)
+      with open(tmp_path, 'wb') as f:
+        for symbol in heapq.merge(sorted(third_party_jar_symbols), sorted(exported_symbols)):
+          f.write(symbol.encode('utf-8'))
+          f.write(b'\n')
+      os.rename(tmp_path, whitelist_path)
+    return whitelist_path
 
   def is_analyzable(self, source):
     return P.splitext(source)[1] == '.scala'
@@ -57,5 +86,5 @@ class MapScalaUsedSymbols(ScalacBuildgenTaskMixin, SourceAnalysisTask, NailgunTa
     return self.map_used_symbols(
       sources=sources,
       java_runner=self.runjava,
-      whitelist=self.symbol_whitelist,
+      whitelist_path=self.symbol_whitelist_path,
     )
@@ -3,22 +3,65 @@
 
 from __future__ import absolute_import, division, print_function
 
+from functools import partial
 import json
+import math
 import os
-import re
 import shutil
 import tempfile
 
 from pants.backend.jvm.subsystems.scala_platform import ScalaPlatform
 from pants.backend.jvm.tasks.jvm_tool_task_mixin import JvmToolTaskMixin
 from pants.base.build_environment import get_buildroot
+from pants.base.worker_pool import Work, WorkerPool
+from pants.base.workunit import WorkUnitLabel
+from pants.java.distribution.distribution import DistributionLocator
+from pants.java.executor import SubprocessExecutor
+from pants.java.util import execute_java
+
+from fsqio.pants.buildgen.jvm.scala.scalac_plugin_output import PluginOutputIngester, strip_root_prefix
 
 
 class ScalacBuildgenTaskMixin(JvmToolTaskMixin):
-  """A utility for invoking the scalac compiler with a custom plugin that short-circuits."""
+  """A utility for invoking the scalac compiler with a custom plugin that short-circuits.
+
+  Sources are split into shards that each get their own scalac invocation. With more than one worker, the shards
+  run concurrently as separate JVM subprocesses, and their output is merged back in shard order.
+  """
 
   _SCALAC_MAIN = 'scala.tools.nsc.Main'
 
+  # The most sources handed to a single scalac invocation, and the heap that such an invocation needs.
+  _MAX_SHARD_SIZE = 10000
+  _MAX_HEAP_MB = 6144
+  _MIN_HEAP_MB = 1024
+
+  @classmethod
+  def register_scalac_buildgen_options(cls, register):
+    register(
+      '--scalac-workers',
+      default=1,
+      advanced=True,
+      type=int,
+      help='Number of scalac plugin invocations to run at once. With more than one, each shard runs in its own JVM '
+           'subprocess instead of through the task\'s configured execution strategy.',
+    )
+    register(
+      '--scalac-shard-size',
+      advanced=True,
+      type=int,
+      help='The most sources passed to a single scalac invocation. Defaults to splitting the sources evenly across '
+           'the workers, with at most {} sources per shard.'.format(cls._MAX_SHARD_SIZE),
+    )
+    register(
+      '--scalac-heap-size',
+      advanced=True,
+      type=str,
+      help='The max heap (e.g. 4g) of each scalac invocation. Defaults to {0}m when extracting used symbols, as '
+           'every invocation loads the whole symbol whitelist, and otherwise to scaling with the shard size, up to '
+           '{0}m.'.format(cls._MAX_HEAP_MB),
+    )
+
   @classmethod
   def register_scalac_buildgen_jvm_tools(cls, register):
     cls.register_jvm_tool(
@@ -63,13 +106,71 @@ class ScalacBuildgenTaskMixin(JvmToolTaskMixin):
   def _used_symbols_plugin_classpath(self):
     return self.tool_classpath('used-symbols-bootstrap')
 
-  def _extract_exported_symbols(self, sources, java_runner):
-    exported_symbols_by_source = {}
+  def _shard_sources(self, sources, min_heap_mb=_MIN_HEAP_MB):
+    """Returns the sorted sources split into shards, along with the heap size for each shard's JVM."""
+    sources = sorted(sources)
+    workers = max(1, self.get_options().scalac_workers)
+    shard_size = self.get_options().scalac_shard_size
+    if not shard_size:
+      shard_size = min(self._MAX_SHARD_SIZE, max(1, int(math.ceil(len(sources) / workers))))
+    shards = [sources[i:i + shard_size] for i in range(0, len(sources), shard_size)]
+    heap_size = self.get_options().scalac_heap_size
+    if not heap_size:
+      # Scales linearly from the minimum to 6g for a full shard of 10000 sources.
+      heap_mb = min_heap_mb + (self._MAX_HEAP_MB - min_heap_mb) * shard_size // self._MAX_SHARD_SIZE
+      heap_size = '{}m'.format(min(self._MAX_HEAP_MB, heap_mb))
+    return shards, heap_size
+
+  def _subprocess_java_runner(self):
+    """A java_runner that always forks its own JVM, so that concurrent shards do not share a nailgun."""
+    executor = SubprocessExecutor(DistributionLocator.cached())
+
+    def runner(classpath, main, jvm_options, args, workunit_name):
+      return execute_java(
+        classpath=classpath,
+        main=main,
+        jvm_options=jvm_options,
+        args=args,
+        executor=executor,
+        workunit_factory=self.context.new_workunit,
+        workunit_name=workunit_name,
+      )
+    return runner
+
+  def _run_shards(self, extract, shards, java_runner):
+    """Runs extract(shard, java_runner) for every shard and merges the results in shard order."""
+    workers = min(self.get_options().scalac_workers, len(shards))
+    if workers <= 1:
+      results = [extract(shard, java_runner) for shard in shards]
+    else:
+      runner = self._subprocess_java_runner()
+      with self.context.new_workunit(name='scalac-buildgen-shards', labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+        pool = WorkerPool(workunit.parent, self.context.run_tracker, workers)
+        try:
+          results = pool.submit_work_and_wait(Work(extract, [(shard, runner) for shard in shards]))
+        finally:
+          pool.shutdown()
+
+    global_symbol_map = {}
+    for symbols_by_source in results:
+      global_symbol_map.update(symbols_by_source)
+    return global_symbol_map
+
+  @staticmethod
+  def _parse_exported_symbols(source_symbol_json):
+    package = source_symbol_json['package']
+    source = os.path.relpath(source_symbol_json['source'], get_buildroot())
+    return source, {
+      'package': package,
+      'exported_symbols': list(set(source_symbol_json['symbols']) - {package}),
+    }
+
+  def _extract_exported_symbols(self, sources, java_runner, heap_size='6g'):
     bootclasspath = ':'.join(self._compiler_jars)
     full_plugin_cp = self._exported_symbols_plugin_classpath
     plugin_jar, classpath = self._split_out_plugin_jar_from_classpath(full_plugin_cp)
     jvm_options = [
-      '-Xmx6g',
+      '-Xmx{}'.format(heap_size),
       '-Xss4096k',
       '-Xbootclasspath/a:{bootclasspath}'.format(bootclasspath=bootclasspath),
     ]
@@ -82,49 +183,36 @@ class ScalacBuildgenTaskMixin(JvmToolTaskMixin):
     try:
       jvm_options.append('-Dio.fsq.buildgen.plugin.exported.outputDir={0}'
                          .format(output_dir))
-      java_runner(classpath=classpath,
-                  main=self._SCALAC_MAIN,
-                  jvm_options=jvm_options,
-                  args=scalac_args,
-                  workunit_name='extract-exported-scala-symbols')
-      output_files = [os.path.join(output_dir, f) for f in os.listdir(output_dir)]
-      for output_file in output_files:
-        with open(output_file, 'r') as f:
-          source_symbol_json = json.loads(f.read())
-          exported_symbols = source_symbol_json['symbols']
-          package = source_symbol_json['package']
-          source = os.path.relpath(source_symbol_json['source'], get_buildroot())
-          exported_symbols_by_source[source] = {
-            'package': package,
-            'exported_symbols': list(set(exported_symbols) - {package}),
-          }
-
+      with PluginOutputIngester(output_dir, self._parse_exported_symbols) as ingester:
+        java_runner(classpath=classpath,
+                    main=self._SCALAC_MAIN,
+                    jvm_options=jvm_options,
+                    args=scalac_args,
+                    workunit_name='extract-exported-scala-symbols')
+      exported_symbols_by_source = ingester.results
     finally:
       shutil.rmtree(output_dir)
     return exported_symbols_by_source
 
   def map_exported_symbols(self, sources, java_runner):
-    def chunks(sources, chunk_size):
-      for i in xrange(0, len(sources), chunk_size):
-          yield sources[i:i + chunk_size]
-
-    accumulated_sources = set()
-    global_symbol_map = {}
-
-    source_chunks = chunks(sources, 10000)
-    for chunk in source_chunks:
-      symbols_by_source = self._extract_exported_symbols(chunk, java_runner)
-      global_symbol_map.update(symbols_by_source)
-
-    return global_symbol_map
-
-  def _extract_used_symbols(self, sources, whitelist_path, java_runner):
-    used_symbols_by_source = {}
+    shards, heap_size = self._shard_sources(sources)
+    extract = partial(self._extract_exported_symbols, heap_size=heap_size)
+    return self._run_shards(extract, shards, java_runner)
+
+  @staticmethod
+  def _parse_used_symbols(imported_symbols_json):
+    source = os.path.relpath(imported_symbols_json['source'], get_buildroot())
+    return source, {
+      'imported_symbols': strip_root_prefix(imported_symbols_json['imports']),
+      'fully_qualified_names': strip_root_prefix(imported_symbols_json['fully_qualified_names']),
+    }
+
+  def _extract_used_symbols(self, sources, java_runner, whitelist_path, heap_size='6g'):
     bootclasspath = ':'.join(self._compiler_jars)
     full_plugin_cp = self._used_symbols_plugin_classpath
     plugin_jar, classpath = self._split_out_plugin_jar_from_classpath(full_plugin_cp)
     jvm_options = [
-      '-Xmx6g',
+      '-Xmx{}'.format(heap_size),
       '-Xss4096k',
       '-Xbootclasspath/a:{bootclasspath}'.format(bootclasspath=bootclasspath),
       '-Dio.fsq.buildgen.plugin.used.whitelist={0}'.format(whitelist_path),
@@ -138,47 +226,20 @@ class ScalacBuildgenTaskMixin(JvmToolTaskMixin):
     try:
       jvm_options.append('-Dio.fsq.buildgen.plugin.used.outputDir={0}'
                          .format(output_dir))
-      java_runner(classpath=classpath,
-                  main=self._SCALAC_MAIN,
-                  jvm_options=jvm_options,
-                  args=scalac_args,
-                  workunit_name='extract-used-scala-symbols')
-      output_files = [os.path.join(output_dir, f) for f in os.listdir(output_dir)]
-      for output_file in output_files:
-        with open(output_file, 'r') as f:
-          imported_symbols_json = json.loads(f.read())
-          imported_symbols = [
-            re.sub('^_root_\.', '', sym, count=1) for sym in imported_symbols_json['imports']
-          ]
-          fully_qualified_names = [
-            re.sub('^_root_\.', '', name, count=1) for name in imported_symbols_json['fully_qualified_names']
-          ]
-          source = os.path.relpath(imported_symbols_json['source'], get_buildroot())
-          analysis = {
-            'imported_symbols': imported_symbols,
-            'fully_qualified_names': fully_qualified_names,
-          }
-          used_symbols_by_source[source] = analysis
+      with PluginOutputIngester(output_dir, self._parse_used_symbols) as ingester:
+        java_runner(classpath=classpath,
+                    main=self._SCALAC_MAIN,
+                    jvm_options=jvm_options,
+                    args=scalac_args,
+                    workunit_name='extract-used-scala-symbols')
+      used_symbols_by_source = ingester.results
     finally:
       shutil.rmtree(output_dir)
     return used_symbols_by_source
 
-  def map_used_symbols(self, sources, whitelist, java_runner):
-    def chunks(sources, chunk_size):
-      for i in xrange(0, len(sources), chunk_size):
-          yield sources[i:i + chunk_size]
-
-    accumulated_sources = set()
-    global_symbol_map = {}
-
-    source_chunks = chunks(sources, 10000)
-    with tempfile.NamedTemporaryFile() as whitelist_file:
-      whitelist_file.write('\n'.join(symbol.encode('utf-8') for symbol in whitelist))
-      whitelist_file.flush()
-      for chunk in source_chunks:
-        symbols_by_source = self._extract_used_symbols(chunk,
-                                                       whitelist_file.name,
-                                                       java_runner)
-        global_symbol_map.update(symbols_by_source)
-
-    return global_symbol_map
+  def map_used_symbols(self, sources, whitelist_path, java_runner):
+    """Map each source to the symbols it uses, qualified against the newline separated symbols in whitelist_path."""
+    # Every shard's JVM loads the whole whitelist, however few sources it compiles, so keep the 6g heap.
+    shards, heap_size = self._shard_sources(sources, min_heap_mb=self._MAX_HEAP_MB)
+    extract = partial(self._extract_used_symbols, whitelist_path=whitelist_path, heap_size=heap_size)
+    return self._run_shards(extract, shards, java_runner)
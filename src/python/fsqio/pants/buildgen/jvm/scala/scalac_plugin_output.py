@@ -0,0 +1,86 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import threading
+
+from typing import Any, Callable, Dict, Iterable, List, Set, Text, Tuple
+
+
+_ROOT_PREFIX = '_root_.'
+_ROOT_PREFIX_LEN = len(_ROOT_PREFIX)
+
+
+def strip_root_prefix(symbols):
+  # type: (Iterable[Text]) -> List[Text]
+  """Drop the leading `_root_.` that scalac puts on fully qualified symbols."""
+  return [sym[_ROOT_PREFIX_LEN:] if sym.startswith(_ROOT_PREFIX) else sym for sym in symbols]
+
+
+class PluginOutputIngester(object):
+  """Parses the per-source json files that a buildgen scalac plugin writes, while scalac is still running.
+
+  The plugins write each file with a single write of one json object and give no other signal that a file is done,
+  so a file that does not parse yet is left for a later poll. Once scalac exits, a final sweep strictly parses whatever
+  is left, which makes the result identical to reading the directory after the fact.
+
+  Use as a context manager around the scalac invocation:
+
+    with PluginOutputIngester(output_dir, parse) as ingester:
+      java_runner(...)
+    results = ingester.results
+  """
+
+  def __init__(self, output_dir, parse, poll_interval=0.2):
+    # type: (str, Callable[[Dict[Text, Any]], Tuple[Text, Any]], float) -> None
+    """
+    :param output_dir: The directory the plugin writes its per-source files into.
+    :param parse: Maps the decoded json of one file to a (source, analysis) pair.
+    :param poll_interval: Seconds between scans of output_dir while scalac runs.
+    """
+    self._output_dir = output_dir
+    self._parse = parse
+    self._poll_interval = poll_interval
+    self._ingested = set()  # type: Set[str]
+    self._done = threading.Event()
+    self._watcher = None  # type: threading.Thread
+    self.results = {}  # type: Dict[Text, Any]
+
+  def _ingest(self, final):
+    # type: (bool) -> None
+    for name in os.listdir(self._output_dir):
+      if name in self._ingested:
+        continue
+      with open(os.path.join(self._output_dir, name), 'r') as f:
+        content = f.read()
+      try:
+        output_json = json.loads(content)
+      except ValueError:
+        # Still being written by scalac.
+        if final:
+          raise
+        continue
+      source, analysis = self._parse(output_json)
+      self.results[source] = analysis
+      self._ingested.add(name)
+
+  def _watch(self):
+    # type: () -> None
+    while not self._done.wait(self._poll_interval):
+      self._ingest(final=False)
+
+  def __enter__(self):
+    self._watcher = threading.Thread(target=self._watch, name='scalac-plugin-output-watcher')
+    self._watcher.daemon = True
+    self._watcher.start()
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self._done.set()
+    self._watcher.join()
+    if exc_type is None:
+      self._ingest(final=True)
+    return False
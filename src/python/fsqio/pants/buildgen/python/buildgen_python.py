@@ -3,40 +3,76 @@
 
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
+from glob import glob
 from hashlib import sha1
 import json
 import logging
+from multiprocessing import Pool, cpu_count
 import os
 import sysconfig
 from textwrap import dedent
 
+from pants.backend.python.targets.python_target import PythonTarget
 from pants.base.build_environment import get_buildroot
 from pants.base.exceptions import TaskError
+from pants.base.fingerprint_strategy import FingerprintStrategy
 from pants.base.hash_utils import stable_json_hash
 from pants.build_graph.address import Address
+from pants.invalidation.build_invalidator import CacheKey, CacheKeyGenerator
 from pants.util.dirutil import safe_mkdir
 from pants.util.memo import memoized_property
-from typing import Any, DefaultDict, Dict, List, Set, Text, Tuple
+from typing import Any, Dict, List, Set, Text, Tuple
 
 from fsqio.pants.buildgen.core.buildgen_task import BuildgenTask
-from fsqio.pants.buildgen.core.symbol_tree import SymbolTreeNode
-from fsqio.pants.buildgen.core.third_party_map_util import check_manually_defined
+from fsqio.pants.buildgen.core.symbol_tree import CompactSymbolTree, MappedSymbolTree
+from fsqio.pants.buildgen.python.first_party_index import FirstPartySymbolIndex
+from fsqio.pants.buildgen.python.import_cache import PythonImportCache, content_hash
 from fsqio.pants.buildgen.python.source_analysis.python_import_parser import PythonImportParser
 from fsqio.pants.buildgen.python.third_party_map_python import get_venv_map
+from fsqio.pants.buildgen.python.third_party_resolver import ThirdPartyResolver
 
 
 logger = logging.getLogger(__name__)
 
-# TODO(mateo): Make these properties of pluggable, per-lang subsystems.
-_SOURCE_FILE_TO_ADDRESS_MAP = defaultdict(set)  # type: DefaultDict[str, Set[Text]]
-_SYMBOLS_TO_SOURCES_MAP = defaultdict(set)  # type: DefaultDict[str, Set[Text]]
-
 
 class PythonBuildgenError(TaskError):
   """Indicate an unrecognized Python symbol was imported by a source file."""
 
 
+def _collect_imports(source_and_packages):
+  """Parse a single source file and return its lint errors and imports. Runs inside of a worker process.
+
+  Any parse failure returns None so that the serial pass can re-raise it with the owning target for context.
+  """
+  source, first_party_packages = source_and_packages
+  try:
+    errors, python_imports = PythonImportParser(source, first_party_packages).lint_and_collect_imports
+  except Exception:
+    return source, None
+  return source, (errors, python_imports)
+
+
+class SourcePathsFingerprintStrategy(FingerprintStrategy):
+  """Fingerprints a python target by the paths of its sources, which are all its exported symbols derive from.
+
+  See MapPythonExportedSymbols.
+  """
+
+  def compute_fingerprint(self, target):
+    hasher = sha1()
+    hasher.update(target.target_base)
+    for source in sorted(target.sources_relative_to_source_root()):
+      hasher.update(b'\0')
+      hasher.update(source)
+    return hasher.hexdigest()
+
+  def __hash__(self):
+    return 1
+
+  def __eq__(self, other):
+    return isinstance(other, type(self))
+
+
 class BuildgenPython(BuildgenTask):
 
   @classmethod
@@ -112,6 +148,14 @@ class BuildgenPython(BuildgenTask):
       type=list,
       help="Force buildgen to considered these packages as 3rd party and not system packages."
     )
+    register(
+      '--workers',
+      default=cpu_count(),
+      advanced=True,
+      type=int,
+      help="Number of worker processes used to parse the imports of every source before the targets are mapped. "
+           "Set to 1 to parse all sources serially within the pants process."
+    )
 
   @classmethod
   def product_types(cls):
@@ -122,7 +166,7 @@ class BuildgenPython(BuildgenTask):
 
   @classmethod
   def implementation_version(cls):
-    return super(BuildgenPython, cls).implementation_version() + [('BuildgenPython', 2)]
+    return super(BuildgenPython, cls).implementation_version() + [('BuildgenPython', 4)]
 
   @property
   def cache_target_dirs(self):
@@ -184,6 +228,11 @@ class BuildgenPython(BuildgenTask):
       virtualenvs.append(os.path.join(user_env, "site-packages"))
     return [ve for ve in virtualenvs if ve]
 
+  @memoized_property
+  def site_packages_cache_dir(self):
+    # type: () -> str
+    return os.path.join(self.workdir, 'site_packages')
+
   @memoized_property
   def venv_modules(self):
     # The deps are python_requirement_library specs, the reqs are the requirements.txt entries.
@@ -191,7 +240,7 @@ class BuildgenPython(BuildgenTask):
     analysis_hash = self.analysis_hash(reqs)
     analysis_file = os.path.join(self.workdir, 'python-analysis-{}.json'.format(analysis_hash))
     if not os.path.isfile(analysis_file):
-      mapping = get_venv_map(self.python_virtual_envs, deps)
+      mapping = get_venv_map(self.python_virtual_envs, deps, self.site_packages_cache_dir)
       with open(analysis_file, 'wb') as f:
         json.dump(mapping, f)
     else:
@@ -201,7 +250,7 @@ class BuildgenPython(BuildgenTask):
           mapping = json.load(f)
         except Exception:
           logger.debug("Could not read the buildgen analysis file, regenerating: {}.".format(f))
-          mapping = get_venv_map(self.python_virtual_envs, deps)
+          mapping = get_venv_map(self.python_virtual_envs, deps, self.site_packages_cache_dir)
           os.remove(analysis_file)
 
     for override in self.get_options().force_third_party:
@@ -218,16 +267,66 @@ class BuildgenPython(BuildgenTask):
   def symbol_to_target_map(self):
     return self.venv_modules['third_party']
 
+  @memoized_property
+  def third_party_resolver(self):
+    # type: () -> ThirdPartyResolver
+    venv_third_party = {} if self.opt_out_virtualenv_walk else self.symbol_to_target_map
+    return ThirdPartyResolver(venv_third_party, self.get_options().third_party_map)
+
   @memoized_property
   def symbol_to_source_tree(self):
-    # type: () -> SymbolTreeNode
-    tree = SymbolTreeNode()
+    # type: () -> Any
+    # Only the key is needed, so the targets are keyed directly rather than through self.invalidated(), which would
+    # set up results dirs and artifact caching for them.
+    cache_key_generator = CacheKeyGenerator(self.context.options.for_global_scope().cache_key_gen_version,
+                                            self.fingerprint)
+    fingerprint_strategy = SourcePathsFingerprintStrategy()
+    python_targets = self.context.build_graph.targets(lambda t: isinstance(t, PythonTarget))
+    cache_keys = [cache_key_generator.key_for_target(target, fingerprint_strategy=fingerprint_strategy)
+                  for target in python_targets]
+    cache_keys = [cache_key for cache_key in cache_keys if cache_key is not None]
+    tree_hash = CacheKey.combine_cache_keys(cache_keys).hash if cache_keys else 'empty'
+    tree_file = os.path.join(self.workdir, 'python-symbol-tree-{}.bin'.format(tree_hash))
+    tree = MappedSymbolTree.load(tree_file) if os.path.isfile(tree_file) else None
+    if tree is None:
+      python_source_to_exported_symbols = self.context.products.get_data('python_source_to_exported_symbols')
+      tree = CompactSymbolTree()
+      for source, symbols in python_source_to_exported_symbols.items():
+        for symbol in symbols:
+          tree.insert(symbol, source)
+      safe_mkdir(self.workdir)
+      # Only the tree for the current fingerprint is ever read, so drop any older ones.
+      for stale_file in glob(os.path.join(self.workdir, 'python-symbol-tree-*.bin')):
+        os.remove(stale_file)
+      MappedSymbolTree.write(tree, tree_file)
+    return tree
+
+  @memoized_property
+  def first_party_index(self):
+    # type: () -> FirstPartySymbolIndex
+    build_graph = self.context.build_graph
+    source_to_addresses_mapper = self.context.products.get_data('source_to_addresses_mapper')
     python_source_to_exported_symbols = self.context.products.get_data('python_source_to_exported_symbols')
-    for source, symbols in python_source_to_exported_symbols.items():
-      for symbol in symbols:
-        tree.insert(symbol, source)
-    self._symbol_to_source_tree = tree
-    return self._symbol_to_source_tree
+
+    # Map each source file to concrete addresses, tracing codegen back to its concrete target.
+    source_to_addresses = {}
+    for source in python_source_to_exported_symbols:
+      target_addresses = set()
+      for address in source_to_addresses_mapper.target_addresses_for_source(source):
+        concrete = build_graph.get_concrete_derived_from(address)
+        if concrete.type_alias != 'python_binary':
+          target_addresses.add(concrete.address)
+      source_to_addresses[source] = frozenset(target_addresses)
+    return FirstPartySymbolIndex(self.symbol_to_source_tree, python_source_to_exported_symbols, source_to_addresses)
+
+  @memoized_property
+  def import_cache(self):
+    # type: () -> PythonImportCache
+    # The parsed imports depend only on the source content and the parser, so invalidate on the task version.
+    hasher = sha1()
+    hasher.update(str(self.implementation_version()))
+    hasher.update(stable_json_hash(sorted(self.first_party_packages)))
+    return PythonImportCache(self.workdir, hasher.hexdigest())
 
   @memoized_property
   def opt_out_virtualenv_walk(self):
@@ -250,35 +349,98 @@ class BuildgenPython(BuildgenTask):
     hasher.update(str(self.implementation_version()))
     return hasher.hexdigest()
 
-  _source_to_symbols_map = defaultdict(set)  # type: DefaultDict[str, Set[Text]]
+  def __init__(self, *args, **kwargs):
+    super(BuildgenPython, self).__init__(*args, **kwargs)
+    self._source_to_symbols_map = {}  # type: Dict[str, Set[Text]]
+
+  def _used_symbols_from_imports(self, python_imports):
+    # type: (List[Any]) -> Set[Text]
+    imported_symbols = set()
+    for imp in python_imports:
+      prefix = imp.package.split('.')[0]
+      if prefix not in self.ignored_prefixes and prefix not in self.system_modules:
+        if imp.module:
+          for alias in imp.aliases:
+            imported_symbols.add('.'.join([imp.module, alias[0]]))
+        else:
+          for alias in imp.aliases:
+            imported_symbols.add(alias[0])
+    return imported_symbols
 
   def get_used_symbols(self, source):
     # type: (str) -> Set[Text]
     if source not in self._source_to_symbols_map:
-      import_linter = PythonImportParser(source, self.first_party_packages)
-      imported_symbols = set()
-      _, python_imports = import_linter.lint_and_collect_imports
-      for imp in python_imports:
-        prefix = imp.package.split('.')[0]
-        if prefix not in self.ignored_prefixes and prefix not in self.system_modules:
-          if imp.module:
-            for alias in imp.aliases:
-              imported_symbols.add('.'.join([imp.module, alias[0]]))
-          else:
-            for alias in imp.aliases:
-              imported_symbols.add(alias[0])
-        self._source_to_symbols_map[source] = imported_symbols
+      source_hash = content_hash(source)
+      cached = self.import_cache.get(source_hash)
+      if cached is None:
+        import_linter = PythonImportParser(source, self.first_party_packages)
+        errors, python_imports = import_linter.lint_and_collect_imports
+        self.import_cache.put(source_hash, errors, python_imports)
+      else:
+        _, python_imports = cached
+      self._source_to_symbols_map[source] = self._used_symbols_from_imports(python_imports)
     return self._source_to_symbols_map[source]
 
+  def collect_used_symbols(self, targets):
+    """Parse the imports of every source owned by the targets, spread across a pool of worker processes.
+
+    The results are stored in _source_to_symbols_map, so buildgen_target only consults the memoized results.
+    Sources whose content hash is in the import cache are not parsed at all.
+    Sources that fail to parse are left out, to be parsed again (and raise with context) by get_used_symbols.
+    """
+    sources = sorted(set(
+      source for target in targets for source in target.sources_relative_to_buildroot()
+      if source.endswith('.py') and source not in self._source_to_symbols_map
+    ))
+    uncached = {}
+    for source in sources:
+      source_hash = content_hash(source)
+      cached = self.import_cache.get(source_hash)
+      if cached is None:
+        uncached[source] = source_hash
+      else:
+        _, python_imports = cached
+        self._source_to_symbols_map[source] = self._used_symbols_from_imports(python_imports)
+    if not uncached:
+      return
+
+    work = [(source, self.first_party_packages) for source in sorted(uncached)]
+    workers = min(self.get_options().workers, len(work))
+    if workers > 1:
+      pool = Pool(processes=workers)
+      try:
+        results = pool.map(_collect_imports, work, chunksize=max(1, len(work) // (workers * 4)))
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = [_collect_imports(item) for item in work]
+
+    for source, analysis in results:
+      if analysis is not None:
+        errors, python_imports = analysis
+        self.import_cache.put(uncached[source], errors, python_imports)
+        self._source_to_symbols_map[source] = self._used_symbols_from_imports(python_imports)
+
+  def execute(self):
+    safe_mkdir(self.workdir)
+    try:
+      self.collect_used_symbols(self.buildgen_targets())
+      super(BuildgenPython, self).execute()
+    finally:
+      # Entries are keyed by content, so analysis gathered before a failure is still valid for the next run.
+      self.import_cache.write()
+
+  def prepare_buildgen_in_parallel(self, targets):
+    super(BuildgenPython, self).prepare_buildgen_in_parallel(targets)
+    _ = (self.first_party_index, self.third_party_resolver)
+
   def buildgen_target(self, target):
     safe_mkdir(self.workdir)
     source_files = [f for f in target.sources_relative_to_buildroot() if f.endswith('.py')]
-    build_graph = self.context.build_graph
-    source_to_addresses_mapper = self.context.products.get_data('source_to_addresses_mapper')
 
     # Gather symbols imported from first party source files.
     target_used_symbols = set()
-    addresses_used_by_target = set()
     for source_candidate in source_files:
       try:
         used_symbols = self.get_used_symbols(source_candidate)
@@ -293,80 +455,59 @@ class BuildgenPython(BuildgenTask):
           )
         )
       target_used_symbols.update(used_symbols)
-    for symbol in target_used_symbols:
-
-      prefix = symbol.split('.')[0]
-
-      # If the symbol is a first party package, map it to providing source files and memoize the relation.
-      if prefix in self.first_party_packages:
-        if symbol not in _SYMBOLS_TO_SOURCES_MAP:
-          providing_sources = self.symbol_to_source_tree.get(symbol, allow_prefix_imports=True)
-          if not providing_sources:
-            raise Exception(
-              'While python buildgenning {}, encountered a symbol with'
-              ' no providing target.  This probably means the import moved'
-              ' or is misspelled.  It could also mean that there is no BUILD'
-              ' target that owns the source that provides the symbol.'
-              ' Imported symbol: {}'
-              .format(target.address.spec, symbol)
-            )
-          _SYMBOLS_TO_SOURCES_MAP[symbol] = providing_sources
-
-        # Map source file to concrete addresses, tracing codegen back to its concrete target, and cache it.
-        for source in _SYMBOLS_TO_SOURCES_MAP[symbol]:
-          if source not in _SOURCE_FILE_TO_ADDRESS_MAP:
-            target_addresses = set()
-            for address in source_to_addresses_mapper.target_addresses_for_source(source):
-              concrete = build_graph.get_concrete_derived_from(address)
-              if concrete.type_alias != 'python_binary':
-                target_addresses.add(concrete.address)
-            _SOURCE_FILE_TO_ADDRESS_MAP[source].update(target_addresses)
-          addresses_used_by_target.update(_SOURCE_FILE_TO_ADDRESS_MAP[source])
 
+    # First party symbols are mapped to their providing targets all at once.
+    first_party_symbols = set(
+      symbol for symbol in target_used_symbols if symbol.split('.')[0] in self.first_party_packages
+    )
+    addresses_used_by_target, unresolved_symbols = self.first_party_index.resolve(first_party_symbols)
+    if unresolved_symbols and self.check_report is not None:
+      for symbol in sorted(unresolved_symbols):
+        self.check_report.add_unmapped_symbol(target.address.spec, symbol, 'no first party providing target')
+    elif unresolved_symbols:
+      raise Exception(
+        'While python buildgenning {}, encountered a symbol with'
+        ' no providing target.  This probably means the import moved'
+        ' or is misspelled.  It could also mean that there is no BUILD'
+        ' target that owns the source that provides the symbol.'
+        ' Imported symbol: {}'
+        .format(target.address.spec, ', '.join(sorted(unresolved_symbols)))
+      )
+
+    for symbol in target_used_symbols - first_party_symbols:
       # Since the symbol is not first party, it needs to be mapped to a target.
-      else:
-        # The twitter.commons/apache.aurora packages are hopeless to comprehensively map. They have a number of issues:
-        #   * They share common `top_level.txt` and 'namespace_packages.txt' values
-        #   * Heuristics based off the package name are invalid
-        #         * apache.aurora.thrift == gen.apache.aurora.[modules].{1.py, 2.py, 3.py}
-        #         * apache.aurora.thermos == gen.apache.thermos.{a.py, b.py, c.py}
-        #           * how to tell that gen.apache.thermos is not a module of gen.apache.aurora?
-        #   * Consequently:
-        #       * they clobber each other's namespace
-        #       * There is no programmatic way to tell between modules
-        #
-        # The valid imports are trivial to determine but there is no deterministic way to map that to the package name.
-        # Without these, we could entirely rely on the virtualenv introspection but instead third_party_map lives.
-
-        if not self.opt_out_virtualenv_walk:
-          import_map = self.symbol_to_target_map
-          if prefix not in import_map:
-            # Slice the import ever shorter until we either match to a known import or run out of parts.
-            prefix = symbol
-            parts = len(prefix.split('.'))
-            while prefix not in import_map and parts > 1:
-              prefix, _ = prefix.rsplit('.', 1)
-              parts -= 1
-        else:
-          import_map = {}
-
-        # Both of these return a target spec string if there is a match and None otherwise.
-        dep = check_manually_defined(symbol, self.get_options().third_party_map) or import_map.get(prefix)
-        if not dep:
-          msg = dedent(
-            """\
-            While running python buildgen, a symbol was found without a known providing target.
-            Target: {}
-            Symbol: {}
-            """.format(target.address.spec, symbol)
-          )
-          # TODO(mateo): Make this exception fail-slow. Better to gather all bg failures and print at end.
-          if self.get_options().fatal:
-            raise PythonBuildgenError(msg)
-          else:
-            print('{}Ignoring for now since fatal errors are off'.format(msg))
+      # The twitter.commons/apache.aurora packages are hopeless to comprehensively map. They have a number of issues:
+      #   * They share common `top_level.txt` and 'namespace_packages.txt' values
+      #   * Heuristics based off the package name are invalid
+      #         * apache.aurora.thrift == gen.apache.aurora.[modules].{1.py, 2.py, 3.py}
+      #         * apache.aurora.thermos == gen.apache.thermos.{a.py, b.py, c.py}
+      #           * how to tell that gen.apache.thermos is not a module of gen.apache.aurora?
+      #   * Consequently:
+      #       * they clobber each other's namespace
+      #       * There is no programmatic way to tell between modules
+      #
+      # The valid imports are trivial to determine but there is no deterministic way to map that to the package name.
+      # Without these, we could entirely rely on the virtualenv introspection but instead third_party_map lives.
+      dep = self.third_party_resolver.resolve(symbol)
+      if dep == ThirdPartyResolver.SKIP:
+        continue
+      if not dep and self.check_report is not None:
+        self.check_report.add_unmapped_symbol(target.address.spec, symbol, 'no third party providing target')
+      elif not dep:
+        msg = dedent(
+          """\
+          While running python buildgen, a symbol was found without a known providing target.
+          Target: {}
+          Symbol: {}
+          """.format(target.address.spec, symbol)
+        )
+        # TODO(mateo): Make this exception fail-slow. Better to gather all bg failures and print at end.
+        if self.get_options().fatal:
+          raise PythonBuildgenError(msg)
         else:
-          addresses_used_by_target.add(Address.parse(dep))
+          print('{}Ignoring for now since fatal errors are off'.format(msg))
+      else:
+        addresses_used_by_target.add(Address.parse(dep))
 
     # Remove any imports from within the same module.
     filtered_addresses_used_by_target = {
@@ -0,0 +1,57 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Set, Text, Tuple
+
+
+class FirstPartySymbolIndex(object):
+  """Resolves first party python symbols to the concrete addresses of the targets that own their providing sources.
+
+  Every exported symbol is indexed up front. Symbols that are not exported as such (e.g. a function imported from a
+  module, or a package prefix) fall back to the symbol tree and are memoized, so each distinct symbol is resolved at
+  most once per index. An index is built per task run and holds no global state.
+  """
+
+  def __init__(self, symbol_to_source_tree, source_to_exported_symbols, source_to_addresses):
+    # type: (Any, Dict[Text, Iterable[Text]], Dict[Text, FrozenSet[Any]]) -> None
+    """
+    :param symbol_to_source_tree: A symbol tree mapping each exported symbol to its providing sources.
+    :param source_to_exported_symbols: The python_source_to_exported_symbols product the tree was built from.
+    :param source_to_addresses: Maps every source in the product to the concrete addresses that own it.
+    """
+    self._symbol_to_source_tree = symbol_to_source_tree
+    self._source_to_addresses = source_to_addresses
+    symbol_to_addresses = {}  # type: Dict[Text, Set[Any]]
+    for source, symbols in source_to_exported_symbols.items():
+      addresses = source_to_addresses[source]
+      for symbol in symbols:
+        symbol_to_addresses.setdefault(symbol, set()).update(addresses)
+    # A symbol maps to None if no source provides it.
+    self._resolved = {
+      symbol: frozenset(addresses) for symbol, addresses in symbol_to_addresses.items()
+    }  # type: Dict[Text, Optional[FrozenSet[Any]]]
+
+  def _resolve_from_tree(self, symbol):
+    # type: (Text) -> Optional[FrozenSet[Any]]
+    providing_sources = self._symbol_to_source_tree.get(symbol, allow_prefix_imports=True)
+    if not providing_sources:
+      return None
+    return frozenset().union(*(self._source_to_addresses[source] for source in providing_sources))
+
+  def resolve(self, symbols):
+    # type: (Iterable[Text]) -> Tuple[Set[Any], Set[Text]]
+    """Return the addresses that provide the symbols, and the set of symbols that no source provides."""
+    resolved = self._resolved
+    address_sets = []
+    unresolved = set()
+    for symbol in symbols:
+      if symbol not in resolved:
+        resolved[symbol] = self._resolve_from_tree(symbol)
+      addresses = resolved[symbol]
+      if addresses is None:
+        unresolved.add(symbol)
+      else:
+        address_sets.append(addresses)
+    return set().union(*address_sets), unresolved
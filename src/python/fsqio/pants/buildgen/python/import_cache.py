@@ -0,0 +1,109 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+from glob import glob
+from hashlib import sha1
+import json
+import logging
+import os
+
+from typing import Any, Dict, List, Optional, Set, Text, Tuple
+
+from fsqio.pants.buildgen.python.source_analysis.python_import_parser import Import
+
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(source):
+  # type: (str) -> str
+  """Return the sha1 hexdigest of the bytes of a source file."""
+  hasher = sha1()
+  with open(source, 'rb') as f:
+    hasher.update(f.read())
+  return hasher.hexdigest()
+
+
+class PythonImportCache(object):
+  """An on-disk map of source content hashes to the lint errors and imports collected from that content.
+
+  The cache file lives in the buildgen workdir and is keyed by the passed version_hash, so bumping the task's
+  implementation_version (or changing its parser config) starts a fresh cache instead of reading stale analysis.
+  Only the entries looked up by a run are written back, and the cache files of other versions are deleted.
+  """
+
+  def __init__(self, workdir, version_hash):
+    # type: (str, str) -> None
+    self.cache_file = os.path.join(workdir, 'python-imports-{}.json'.format(version_hash))
+    self._loaded = None  # type: Optional[Dict[str, Any]]
+    self._used = set()  # type: Set[str]
+    self._dirty = False
+
+  @staticmethod
+  def _encode(errors, imports):
+    return {
+      'errors': [list(error) for error in errors],
+      'imports': [
+        {'module': imp.module, 'aliases': [list(alias) for alias in imp.aliases], 'comments': list(imp.comments)}
+        for imp in imports
+      ],
+    }
+
+  @staticmethod
+  def _decode(entry):
+    # type: (Dict[str, Any]) -> Tuple[List[Tuple], List[Import]]
+    errors = [tuple(error) for error in entry['errors']]
+    imports = [
+      Import(
+        module=imp['module'],
+        aliases=tuple(tuple(alias) for alias in imp['aliases']),
+        comments=tuple(imp['comments']),
+      )
+      for imp in entry['imports']
+    ]
+    return errors, imports
+
+  @property
+  def _entries(self):
+    # type: () -> Dict[str, Any]
+    if self._loaded is None:
+      self._loaded = {}
+      if os.path.isfile(self.cache_file):
+        with open(self.cache_file, 'r') as f:
+          # A corrupt cache is regenerated rather than failing buildgen.
+          try:
+            self._loaded = json.load(f)
+          except Exception:
+            logger.debug("Could not read the python import cache, regenerating: {}.".format(self.cache_file))
+    return self._loaded
+
+  def get(self, source_hash):
+    # type: (str) -> Optional[Tuple[List[Tuple], List[Import]]]
+    """Return the (errors, imports) recorded for the content hash, or None if it has not been analyzed."""
+    entry = self._entries.get(source_hash)
+    if entry is not None:
+      self._used.add(source_hash)
+    return self._decode(entry) if entry is not None else None
+
+  def put(self, source_hash, errors, imports):
+    # type: (str, List[Tuple], List[Import]) -> None
+    self._entries[source_hash] = self._encode(errors, imports)
+    self._used.add(source_hash)
+    self._dirty = True
+
+  def write(self):
+    # type: () -> None
+    """Persist the entries that this run looked up, if they differ from those on disk."""
+    for stale_file in glob(os.path.join(os.path.dirname(self.cache_file), 'python-imports-*.json')):
+      if stale_file != self.cache_file:
+        os.remove(stale_file)
+    if not self._dirty and len(self._used) == len(self._entries):
+      return
+    self._loaded = {source_hash: self._entries[source_hash] for source_hash in self._used}
+    tmp_file = '{}.tmp'.format(self.cache_file)
+    with open(tmp_file, 'w') as f:
+      json.dump(self._loaded, f)
+    os.rename(tmp_file, self.cache_file)
+    self._dirty = False
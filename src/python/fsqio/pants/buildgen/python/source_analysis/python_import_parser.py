@@ -4,7 +4,9 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import ast
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+import io
+import re
 import tokenize
 
 
@@ -98,11 +100,48 @@ class SourceFileException(Exception):
   """Indicate a problem parsing a source file."""
 
 
-class PythonImportParser(object):
+class _AmbiguousImportRegion(Exception):
+  """The token scanner could not be sure it matched the AST, so the full parse must be used instead."""
+
+
+# The parts of a top-level import statement needed to lint it and build its Import. `names` is a tuple of
+# (name, asname) pairs, `module` and `level` are only meaningful for `from ... import ...` statements.
+ImportStatement = namedtuple('ImportStatement', ['lineno', 'is_from', 'module', 'level', 'names', 'comment_rows'])
+
 
-  def __init__(self, source_path, first_party_packages):
+class PythonImportParser(object):
+  """Lints and collects the top-level imports of a python source file.
+
+  By default only the leading import block is tokenized, which avoids building an AST for the entire module.
+  Anything the scanner cannot match exactly against the AST (decorators, semicolons, imports after code, etc.)
+  falls back to the full ast.parse. Note that the scanner does not validate the syntax past the import block.
+  """
+
+  MSG_IMPORT_NOT_AT_TOP = 'Imports at global scope should only occur at the top of the file.'
+  MSG_INLINE_COMMENT = (
+    'Inline comments on imports are forbidden, as the automatic import linter cannot'
+    ' detect them and will silently stomp them.  If you feel strongly that you need'
+    ' to comment an import, put it directly before the "from ..." or "import ..."'
+    ' line in question, with no extra newlines on either side.'
+  )
+  MSG_MULTIPLE_IMPORTS = 'All "import ..." lines should import exactly one thing.'
+  MSG_RELATIVE_IMPORT = (
+    'Relative imports are forbidden.  Always use fully qualified package names'
+    ' when importing.'
+  )
+  MSG_WILDCARD_IMPORT = (
+    'Wildcard imports are forbidden.  Only import the symbols you need, or import'
+    ' the top level package and use attribute access on it.'
+  )
+
+  # Any top-level `import` or `from` statement after the first line of code means the leading block is not the
+  # whole story. This may match inside of strings, which only costs a fallback to the AST.
+  _LATE_IMPORT_RE = re.compile(r'^(?:import|from)\b|;\s*(?:import|from)\b', re.MULTILINE)
+
+  def __init__(self, source_path, first_party_packages, scan_tokens=True):
     self.source_path = source_path
     self.first_party_packages = first_party_packages
+    self.scan_tokens = scan_tokens
 
   @cached_property
   def source_code(self):
@@ -115,8 +154,7 @@ class PythonImportParser(object):
 
   @cached_property
   def tokens(self):
-     with open(self.source_path, 'rb') as f:
-       return list(tokenize.generate_tokens(f.readline))
+    return list(tokenize.generate_tokens(io.StringIO(self.source_code).readline))
 
   @cached_property
   def tree(self):
@@ -183,75 +221,257 @@ class PythonImportParser(object):
       for token in self.index_to_tokens.get(i, []):
         yield token
 
+  def comments_above(self, lineno):
+    """Returns the comment lines directly above the (1-indexed) line, with no blank lines in between."""
+    comments = []
+    real_code_index = lineno - 1
+    while real_code_index > 0:
+      line = self.source_lines[real_code_index - 1].strip()
+      if not line.startswith('#'):
+        # We've hit something not a comment, so we're done.
+        break
+      # This is a real comment.  Prepend it to the accumulated comments
+      # since we're walking backwards.
+      comments.insert(0, line)
+      # Walk back a line.
+      real_code_index -= 1
+    return comments
+
+  def _import_statements_from_tree(self):
+    statements = []
+    for i, node in enumerate(self.tree.body):
+      if isinstance(node, (ast.Import, ast.ImportFrom)):
+        comment_rows = tuple(
+          token[2][0] for token in self.tokens_in_node_at_index(i) if token[0] == tokenize.COMMENT
+        )
+        names = tuple((alias.name, alias.asname) for alias in node.names)
+        if isinstance(node, ast.Import):
+          statements.append(ImportStatement(node.lineno, False, None, 0, names, comment_rows))
+        else:
+          statements.append(ImportStatement(node.lineno, True, node.module, node.level, names, comment_rows))
+    return self.first_non_import_index, statements
+
+  @staticmethod
+  def _parse_dotted_name(sig, i):
+    parts = []
+    while True:
+      if i >= len(sig) or sig[i][0] != tokenize.NAME:
+        raise _AmbiguousImportRegion()
+      parts.append(sig[i][1])
+      i += 1
+      if i < len(sig) and sig[i][1] == '.':
+        i += 1
+      else:
+        return '.'.join(parts), i
+
+  @classmethod
+  def _parse_import_tokens(cls, sig):
+    """Returns (is_from, module, level, names) parsed from the significant tokens of one import statement."""
+    if sig[0][1] == 'import':
+      names = []
+      i = 1
+      while True:
+        name, i = cls._parse_dotted_name(sig, i)
+        asname = None
+        if i < len(sig) and sig[i][1] == 'as':
+          if i + 1 >= len(sig) or sig[i + 1][0] != tokenize.NAME:
+            raise _AmbiguousImportRegion()
+          asname = sig[i + 1][1]
+          i += 2
+        names.append((name, asname))
+        if i == len(sig):
+          return False, None, 0, tuple(names)
+        if sig[i][1] != ',':
+          raise _AmbiguousImportRegion()
+        i += 1
+
+    level = 0
+    i = 1
+    while i < len(sig) and sig[i][1] in ('.', '...'):
+      level += len(sig[i][1])
+      i += 1
+    module = None
+    if i < len(sig) and sig[i][1] != 'import':
+      module, i = cls._parse_dotted_name(sig, i)
+    if i >= len(sig) or sig[i][1] != 'import':
+      raise _AmbiguousImportRegion()
+    i += 1
+    if i < len(sig) and sig[i][1] == '*':
+      if i + 1 != len(sig):
+        raise _AmbiguousImportRegion()
+      return True, module, level, (('*', None),)
+
+    parenthesized = i < len(sig) and sig[i][1] == '('
+    end = len(sig)
+    if parenthesized:
+      if sig[-1][1] != ')':
+        raise _AmbiguousImportRegion()
+      i += 1
+      end -= 1
+    names = []
+    while i < end:
+      if sig[i][0] != tokenize.NAME:
+        raise _AmbiguousImportRegion()
+      name, asname = sig[i][1], None
+      i += 1
+      if i < end and sig[i][1] == 'as':
+        if i + 1 >= end or sig[i + 1][0] != tokenize.NAME:
+          raise _AmbiguousImportRegion()
+        asname = sig[i + 1][1]
+        i += 2
+      names.append((name, asname))
+      if i < end:
+        if sig[i][1] != ',' or (i + 1 == end and not parenthesized):
+          raise _AmbiguousImportRegion()
+        i += 1
+    if not names:
+      raise _AmbiguousImportRegion()
+    return True, module, level, tuple(names)
+
+  def _scan_import_statements(self):
+    """Tokenize only the leading import block, returning what _import_statements_from_tree would.
+
+    :raises _AmbiguousImportRegion: if the tokens cannot be matched to the AST with certainty.
+    """
+    # Each entry is (start_row, kind, significant_tokens, comment_rows) for one logical line.
+    logical_lines = []
+    first_code_row = None
+    line_tokens = []
+    token_iter = tokenize.generate_tokens(io.StringIO(self.source_code).readline)
+    try:
+      for token in token_iter:
+        tok_type = token[0]
+        if tok_type in (tokenize.INDENT, tokenize.DEDENT, tokenize.ERRORTOKEN):
+          raise _AmbiguousImportRegion()
+        if tok_type == tokenize.ENDMARKER:
+          break
+        if not line_tokens and tok_type in (tokenize.NL, tokenize.COMMENT):
+          if tok_type == tokenize.COMMENT:
+            logical_lines.append((token[2][0], 'comment', [], (token[2][0],)))
+          continue
+        if not line_tokens:
+          # This is the first token of a new statement, decide whether the import block is over.
+          first = token
+          if first[0] == tokenize.NAME and first[1] in ('import', 'from'):
+            pass
+          elif first[0] == tokenize.NAME and first[1] == '__author__':
+            pass
+          elif first[0] == tokenize.STRING:
+            pass
+          elif first[0] == tokenize.NAME:
+            first_code_row = first[2][0]
+            break
+          else:
+            raise _AmbiguousImportRegion()
+        if tok_type == tokenize.OP and token[1] == ';':
+          raise _AmbiguousImportRegion()
+        line_tokens.append(token)
+        if tok_type == tokenize.NEWLINE:
+          sig = [t for t in line_tokens if t[0] not in (tokenize.NL, tokenize.COMMENT, tokenize.NEWLINE)]
+          comment_rows = tuple(t[2][0] for t in line_tokens if t[0] == tokenize.COMMENT)
+          start_row = line_tokens[0][2][0]
+          if sig[0][1] in ('import', 'from'):
+            kind = 'import'
+          elif sig[0][1] == '__author__':
+            if len(sig) < 2 or sig[1][1] != '=':
+              first_code_row = start_row
+              break
+            kind = 'author'
+          elif all(t[0] == tokenize.STRING for t in sig):
+            if any(c in t[1].split(t[1][-1])[0].lower() for t in sig for c in 'bf'):
+              raise _AmbiguousImportRegion()
+            kind = 'docstring'
+          else:
+            raise _AmbiguousImportRegion()
+          logical_lines.append((start_row, kind, sig, comment_rows))
+          line_tokens = []
+    except tokenize.TokenError:
+      raise _AmbiguousImportRegion()
+
+    if first_code_row is not None:
+      rest = '\n'.join(self.source_lines[first_code_row - 1:])
+      if self._LATE_IMPORT_RE.search(rest):
+        raise _AmbiguousImportRegion()
+
+    statements = [line for line in logical_lines if line[1] != 'comment']
+    # The rows of comments that start their own line, in case they trail the final import of the block.
+    standalone_comment_rows = [line[0] for line in logical_lines if line[1] == 'comment']
+
+    if first_code_row is None:
+      first_non_import_index = 0
+    else:
+      first_non_import_index = first_code_row - 1
+      while first_non_import_index > 0 and self.source_lines[first_non_import_index - 1].strip().startswith('#'):
+        first_non_import_index -= 1
+
+    import_statements = []
+    for i, (start_row, kind, sig, comment_rows) in enumerate(statements):
+      if kind != 'import':
+        continue
+      if i + 1 < len(statements):
+        if statements[i + 1][1] == 'docstring':
+          # The AST reports a version dependent lineno for bare strings, leave this to the full parse.
+          raise _AmbiguousImportRegion()
+        first_index_after_node = statements[i + 1][0] - 1
+      elif first_code_row is not None:
+        first_index_after_node = first_code_row - 1
+      else:
+        first_index_after_node = len(self.source_lines)
+      # Same as tokens_in_node_at_index: exclude the comments and whitespace directly above the next node.
+      while first_index_after_node > start_row - 1:
+        line = self.source_lines[first_index_after_node - 1].strip()
+        if line and not line.startswith('#'):
+          break
+        first_index_after_node -= 1
+      node_comment_rows = comment_rows + tuple(
+        row for row in standalone_comment_rows if start_row - 1 <= row - 1 < first_index_after_node
+      )
+      is_from, module, level, names = self._parse_import_tokens(sig)
+      import_statements.append(
+        ImportStatement(start_row, is_from, module, level, names, tuple(sorted(node_comment_rows)))
+      )
+    return first_non_import_index, import_statements
+
   @cached_property
   def lint_and_collect_imports(self):
+    if self.scan_tokens:
+      try:
+        first_non_import_index, statements = self._scan_import_statements()
+      except _AmbiguousImportRegion:
+        first_non_import_index, statements = self._import_statements_from_tree()
+    else:
+      first_non_import_index, statements = self._import_statements_from_tree()
+
     module_to_aliases = defaultdict(set)
     module_to_comments = defaultdict(list)
     bare_imports = set()
     errors = []
-    for i, node in enumerate(self.tree.body):
-      node_comments = []
-      if isinstance(node, (ast.Import, ast.ImportFrom)):
-        if node.lineno > self.first_non_import_index:
-          errors.append((
-            'Imports at global scope should only occur at the top of the file.',
-            node.lineno,
-          ))
-
-        for token in self.tokens_in_node_at_index(i):
-          if token[0] == tokenize.COMMENT:
-            errors.append((
-              'Inline comments on imports are forbidden, as the automatic import linter cannot'
-              ' detect them and will silently stomp them.  If you feel strongly that you need'
-              ' to comment an import, put it directly before the "from ..." or "import ..."'
-              ' line in question, with no extra newlines on either side.',
-              token[2][0],
-              node.lineno,
-            ))
-        # Now we collect any comments directly above this node.
-        real_code_index = node.lineno - 1
-        while real_code_index > 0:
-          line = self.source_lines[real_code_index - 1].strip()
-          if not line.startswith('#'):
-            # We've hit something not a comment, so we're done.
-            break
-          # This is a real comment.  Prepend it to the accumulated comments
-          # since we're walking backwards.
-          node_comments.insert(0, line)
-          # Walk back a line.
-          real_code_index -= 1
-
-      if isinstance(node, ast.Import):
-        if len(node.names) > 1:
-          errors.append((
-            'All "import ..." lines should import exactly one thing.',
-            node.lineno,
-          ))
+    for statement in statements:
+      if statement.lineno > first_non_import_index:
+        errors.append((self.MSG_IMPORT_NOT_AT_TOP, statement.lineno))
+      for comment_row in statement.comment_rows:
+        errors.append((self.MSG_INLINE_COMMENT, comment_row, statement.lineno))
+      node_comments = self.comments_above(statement.lineno)
+
+      if not statement.is_from:
+        if len(statement.names) > 1:
+          errors.append((self.MSG_MULTIPLE_IMPORTS, statement.lineno))
         else:
-          alias = node.names[0]
           bare_imports.add(
             Import(
               module=None,
-              aliases=((alias.name, alias.asname),),
+              aliases=statement.names,
               comments=tuple(node_comments),
             )
           )
-      elif isinstance(node, ast.ImportFrom):
-        if node.level != 0:
-          errors.append((
-            'Relative imports are forbidden.  Always use fully qualified package names'
-            ' when importing.',
-            node.lineno,
-          ))
-        for alias in node.names:
-          if alias.name == '*':
-            errors.append((
-              'Wildcard imports are forbidden.  Only import the symbols you need, or import'
-              ' the top level package and use attribute access on it.',
-              node.lineno,
-            ))
-          module_to_aliases[node.module].add((alias.name, alias.asname))
-        module_to_comments[node.module].extend(node_comments)
+      else:
+        if statement.level != 0:
+          errors.append((self.MSG_RELATIVE_IMPORT, statement.lineno))
+        for alias in statement.names:
+          if alias[0] == '*':
+            errors.append((self.MSG_WILDCARD_IMPORT, statement.lineno))
+          module_to_aliases[statement.module].add(alias)
+        module_to_comments[statement.module].extend(node_comments)
     imports = list(bare_imports)
     for module, aliases in module_to_aliases.items():
       comments = module_to_comments.get(module)
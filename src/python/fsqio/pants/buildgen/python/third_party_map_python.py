@@ -4,13 +4,25 @@
 from __future__ import absolute_import, division, print_function
 
 import distutils.sysconfig
-import glob
+from fnmatch import fnmatchcase
+from hashlib import sha1
+import json
+import logging
 import os
 import pkgutil
 import sys
 import sysconfig
 
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
+
+
+try:
+  from os import scandir
+except ImportError:
+  from scandir import scandir
+
+
+logger = logging.getLogger(__name__)
 
 
 def is_importable(root, name, exts=()):
@@ -25,36 +37,146 @@ def is_importable(root, name, exts=()):
   return False
 
 
-def get_third_party_modules(site_packages_root, dep_map):
+def _read_lines(path):
+  # type: (str) -> Optional[List[str]]
+  try:
+    with open(path, 'r') as f:
+      return [line.strip() for line in f]
+  except IOError:
+    return None
+
+
+def _top_levels_from_record(record_lines):
+  # type: (List[str]) -> List[str]
+  """Derive the top level importable names from the files listed in a dist-info RECORD."""
+  top_levels = set()
+  for line in record_lines:
+    first = line.split(',', 1)[0].split('/', 1)[0]
+    if not first or first == '..' or first.endswith(('-info', '.data')):
+      continue
+    top_levels.add(first.split('.', 1)[0])
+  return sorted(top_levels)
+
+
+class SitePackagesScan(object):
+  """What get_third_party_modules needs to know about one site-packages root, gathered with scandir.
+
+  The top level entries are listed once and the top_level.txt (or, failing that, RECORD) of every dist-info and
+  egg-info directory is read up front. Package directory walks are memoized as they are requested. When a cache_dir is
+  passed, all of this is persisted and reused until the root's mtime or its set of *-info directories changes.
+  """
+
+  def __init__(self, site_packages_root, cache_dir=None):
+    # type: (str, Optional[str]) -> None
+    self.root = site_packages_root
+    self._entries = {entry.name: entry.is_dir() for entry in scandir(site_packages_root)}
+    info_dirs = sorted(name for name, is_dir in self._entries.items() if is_dir and name.endswith('-info'))
+
+    self._cache_file = None  # type: Optional[str]
+    self._dirty = False
+    if cache_dir:
+      root_dir = os.path.join(cache_dir, sha1(site_packages_root.encode('utf-8')).hexdigest())
+      fingerprint = sha1(json.dumps([os.stat(site_packages_root).st_mtime, info_dirs]).encode('utf-8')).hexdigest()
+      self._cache_file = os.path.join(root_dir, '{}.json'.format(fingerprint))
+      if os.path.isfile(self._cache_file):
+        with open(self._cache_file, 'r') as f:
+          try:
+            cached = json.load(f)
+            self._top_levels = cached['top_levels']
+            self._package_dirs = cached['package_dirs']
+            return
+          except Exception:
+            logger.debug("Could not read the site-packages scan, regenerating: {}.".format(self._cache_file))
+
+    self._top_levels = {}  # type: Dict[str, List[str]]
+    for info_dir in info_dirs:
+      info_path = os.path.join(site_packages_root, info_dir)
+      top_levels = _read_lines(os.path.join(info_path, 'top_level.txt'))
+      if top_levels is None:
+        record = _read_lines(os.path.join(info_path, 'RECORD'))
+        top_levels = _top_levels_from_record(record) if record is not None else None
+      if top_levels is not None:
+        self._top_levels[info_dir] = [top for top in top_levels if top]
+    self._package_dirs = {}  # type: Dict[str, List[str]]
+    self._dirty = True
+
+  def all_top_levels(self):
+    # type: () -> List[str]
+    """Return the top level names installed by every distribution under the root."""
+    return sorted(set(top for top_levels in self._top_levels.values() for top in top_levels))
 
-  def walk_module_tree(dep, root, import_path, routes=None):
-    # Recursively walk a file tree, mapping the relpath(root, directory) of every matched directory to the passed dep.
-    if routes is None:
-      routes = {}
-    path = os.path.join(root, import_path)
-    if os.path.isdir(path):
-      for child in os.listdir(path):
-        if not child.startswith('_'):
-          child_path = os.path.join(import_path, child)
-          walk_module_tree(dep, root, child_path, routes)
-      routes[import_path] = dep
-    return routes
+  def top_levels(self, dep):
+    # type: (str) -> List[str]
+    """Return the top level names installed by the distribution with the given name, or [] if it is not found."""
+    pattern = '{}-*-info'.format(dep)
+    for info_dir in sorted(self._top_levels):
+      if fnmatchcase(info_dir, pattern):
+        return self._top_levels[info_dir]
+    return []
 
+  def is_importable(self, name):
+    # type: (str) -> bool
+    if '/' in name:
+      return is_importable(self.root, name)
+    return any(candidate in self._entries for candidate in (name, name + '.py', name + '.so', name + '.pyd'))
+
+  def _walk(self, path, import_path, package_dirs):
+    # type: (str, str, List[str]) -> None
+    package_dirs.append(import_path)
+    for entry in scandir(path):
+      if not entry.name.startswith('_') and entry.is_dir():
+        self._walk(entry.path, os.path.join(import_path, entry.name), package_dirs)
+
+  def package_dirs(self, import_path):
+    # type: (str) -> List[str]
+    """Return import_path and every directory below it that is not hidden behind a leading underscore.
+
+    Returns [] if import_path is not a directory.
+    """
+    if import_path not in self._package_dirs:
+      package_dirs = []  # type: List[str]
+      path = os.path.join(self.root, import_path)
+      if os.path.isdir(path):
+        self._walk(path, import_path, package_dirs)
+      self._package_dirs[import_path] = package_dirs
+      self._dirty = True
+    return self._package_dirs[import_path]
+
+  def write(self):
+    # type: () -> None
+    if not self._cache_file or not self._dirty:
+      return
+    root_dir = os.path.dirname(self._cache_file)
+    # Only the scan for the current fingerprint is ever read, so drop any older ones.
+    if not os.path.isfile(self._cache_file):
+      if os.path.isdir(root_dir):
+        for stale in os.listdir(root_dir):
+          os.remove(os.path.join(root_dir, stale))
+      else:
+        os.makedirs(root_dir)
+    tmp_file = '{}.tmp'.format(self._cache_file)
+    with open(tmp_file, 'w') as f:
+      json.dump({'top_levels': self._top_levels, 'package_dirs': self._package_dirs}, f)
+    os.rename(tmp_file, self._cache_file)
+    self._dirty = False
+
+
+def get_third_party_modules(site_packages_root, dep_map, scan=None):
   allowed_import_prefixes = {}
   import_map = {}
 
   if site_packages_root:
     if not os.path.isdir(site_packages_root):
       raise Exception("There is no site-packages dir at: {}".format(site_packages_root))
+    scan = scan or SitePackagesScan(site_packages_root)
     for dep in dep_map:
 
       if '.' in dep:
         # Treated as top_level or else we risk bringing in their transitive deps or clobbering other valid imports.
         top_level = [dep.replace('.', '/')]
       else:
-        # Parse file distributed with each package that defines the top level dirs or files for each module.
-        globbed_files = list(glob.iglob(os.path.join(site_packages_root, dep + '-*-info', 'top_level.txt')))
-        top_level = map(str.strip, open(list(globbed_files)[0]).readlines()) if globbed_files else []
+        # Use the metadata distributed with each package that defines the top level dirs or files for each module.
+        top_level = scan.top_levels(dep)
       if not top_level:
         # Rarely there's no dist-info or top_level, then we have to accept the PyPi name transformed to valid import.
         _, package_name = dep_map[dep].lower().replace('-', '_').split(':')
@@ -62,9 +184,10 @@ def get_third_party_modules(site_packages_root, dep_map):
 
       for top in top_level:
 
-        if top.startswith('_') or not is_importable(site_packages_root, top):
+        if top.startswith('_') or not scan.is_importable(top):
           continue
-        route = walk_module_tree(dep_map[dep], site_packages_root, top)
+        # Map every directory under the top level to the dep.
+        route = {package_dir: dep_map[dep] for package_dir in scan.package_dirs(top)}
         if not route:
           # Since we know it is importable, that means there is a top-level file with that importable name.
           route = {top: dep_map[dep]}
@@ -79,19 +202,26 @@ def get_third_party_modules(site_packages_root, dep_map):
   return allowed_import_prefixes
 
 
-def get_system_modules():
-  """Return the Python builtins and stdlib top_level import names for a distribution."""
+def _pants_site_packages_roots():
+  # type: () -> List[str]
+  roots = {sysconfig.get_path('purelib'), sysconfig.get_path('platlib')}
+  return sorted(root for root in roots if root and os.path.isdir(root))
+
+
+def get_system_modules(scans=None):
+  """Return the Python builtins and stdlib top_level import names for a distribution.
+
+  :param scans: Maps site-packages roots to an existing SitePackagesScan of them.
+  """
+  scans = scans or {}
 
   # Get list of all loaded source modules.
-  modules = {module for _, module, package in list(pkgutil.iter_modules()) if package is False}
+  modules = {module for _, module, package in pkgutil.iter_modules() if package is False}
 
   # Gather the import names from the site-packages installed in the pants-virtualenv.
-  module_names = set(glob.iglob(os.path.join(sysconfig.get_path('purelib'), '*-*', 'top_level.txt')))
-  module_names.update(glob.iglob(os.path.join(sysconfig.get_path('platlib'), '*-*', 'top_level.txt')))
-  site_packages = [map(str.strip, open(txt).readlines()) for txt in module_names]
-
-  for packages in site_packages:
-    modules -= set(packages)
+  for site_packages_root in _pants_site_packages_roots():
+    scan = scans.get(site_packages_root) or SitePackagesScan(site_packages_root)
+    modules.difference_update(scan.all_top_levels())
 
   # Get the system packages.
   system_modules = set(sys.builtin_module_names)
@@ -100,16 +230,28 @@ def get_system_modules():
   # NOTE(jeffreyc): newer virtualenvs no longer include distutils. Python's distutils behaves differently than
   # virtualenv's. We emulate the old virtualenv behavior by specifying a prefix (virtualenv's distutils overrode
   # `prefix` with `sys.real_path`).
-  _, top_level_libs, _ = list(os.walk(distutils.sysconfig.get_python_lib(standard_lib=True, prefix=sys.real_prefix)))[0]
+  stdlib = distutils.sysconfig.get_python_lib(standard_lib=True, prefix=sys.real_prefix)
+  top_level_libs = [entry.name for entry in scandir(stdlib) if entry.is_dir()]
   return sorted(top_level_libs + list(modules | system_modules))
 
 
 # TODO(mateo): This has outgrown its roots as a simple python script. Productionize into a task or class.
-def get_venv_map(site_packages_roots, dep_map):
+def get_venv_map(site_packages_roots, dep_map, cache_dir=None):
+  """Map the third party imports found under the site-packages roots to the python_requirement_library specs.
+
+  :param cache_dir: If passed, the scan of each site-packages root is cached here between runs.
+  """
+  scans = {
+    root: SitePackagesScan(root, cache_dir)
+    for root in set(_pants_site_packages_roots()) | set(site_packages_roots)
+    if root and os.path.isdir(root)
+  }
   venv_map = {}
-  venv_map['python_modules'] = get_system_modules()
+  venv_map['python_modules'] = get_system_modules(scans)
   site_map = {}
   for site_packages_root in site_packages_roots:
-    site_map.update(get_third_party_modules(site_packages_root, dep_map))
+    site_map.update(get_third_party_modules(site_packages_root, dep_map, scans.get(site_packages_root)))
   venv_map['third_party'] = site_map
+  for scan in scans.values():
+    scan.write()
   return venv_map
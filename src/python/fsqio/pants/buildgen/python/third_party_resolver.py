@@ -0,0 +1,106 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+from typing import Any, Dict, Optional, Text
+
+
+_UNSET = object()
+
+
+class _ResolverNode(object):
+  __slots__ = ('children', 'venv_spec', 'in_manual_map', 'manual_spec', 'manual_default')
+
+  def __init__(self):
+    self.children = {}  # type: Dict[Text, _ResolverNode]
+    self.venv_spec = None  # type: Optional[Text]
+    # True for the nested dicts of the third_party_map, which the manual lookup descends through.
+    self.in_manual_map = False
+    # The value of a third_party_map leaf at this node: a spec, 'SKIP' or None.
+    self.manual_spec = _UNSET  # type: Any
+    self.manual_default = None  # type: Optional[Text]
+
+  def child(self, part):
+    # type: (Text) -> _ResolverNode
+    node = self.children.get(part)
+    if node is None:
+      node = self.children[part] = _ResolverNode()
+    return node
+
+
+class ThirdPartyResolver(object):
+  """Maps third party python symbols to the spec of their providing target.
+
+  A single trie holds both the `third_party` modules found by walking the virtualenvs and the hand-written
+  third_party_map, so each symbol is resolved in one walk over its parts. Results are memoized per symbol.
+
+  The lookup matches the rules buildgen has always used:
+    * A third_party_map entry wins over the virtualenv. Its lookup follows `check_manually_defined`: a leaf maps every
+      symbol below it, and a symbol that leaves the map under a `DEFAULT` key maps to that default.
+    * Otherwise a virtualenv module matching the top-level package is used, and failing that the longest dotted
+      prefix of the symbol that is a virtualenv module.
+  A 'SKIP' from the third_party_map is returned as is, for the caller to ignore the symbol.
+  """
+
+  SKIP = 'SKIP'
+
+  def __init__(self, venv_third_party, third_party_map):
+    # type: (Dict[Text, Text], Dict[Text, Any]) -> None
+    """
+    :param venv_third_party: Maps dotted module names found in the virtualenvs to target specs.
+    :param third_party_map: The nested --third-party-map option.
+    """
+    self._root = _ResolverNode()
+    for module, spec in venv_third_party.items():
+      node = self._root
+      for part in module.split('.'):
+        node = node.child(part)
+      node.venv_spec = spec
+    self._insert_manual_map(self._root, third_party_map)
+    self._resolved = {}  # type: Dict[Text, Optional[Text]]
+
+  def _insert_manual_map(self, node, subtree):
+    # type: (_ResolverNode, Dict[Text, Any]) -> None
+    node.in_manual_map = True
+    for key, value in subtree.items():
+      if key == 'DEFAULT':
+        node.manual_default = value
+      elif isinstance(value, dict):
+        self._insert_manual_map(node.child(key), value)
+      else:
+        node.child(key).manual_spec = value
+
+  def _resolve(self, symbol):
+    # type: (Text) -> Optional[Text]
+    parts = symbol.split('.')
+    node = self._root
+    manual_spec = _UNSET if node.in_manual_map else None
+    top_level_venv_spec = None
+    longest_venv_spec = None
+    for depth, part in enumerate(parts, 1):
+      child = node.children.get(part)
+      if manual_spec is _UNSET:
+        if child is not None and child.manual_spec is not _UNSET:
+          manual_spec = child.manual_spec
+        elif child is None or not child.in_manual_map:
+          manual_spec = node.manual_default
+      if child is None:
+        break
+      node = child
+      if node.venv_spec is not None:
+        if depth == 1:
+          top_level_venv_spec = node.venv_spec
+        else:
+          longest_venv_spec = node.venv_spec
+    if manual_spec is _UNSET:
+      # The symbol ended on a nested dict of the third_party_map.
+      manual_spec = node.manual_default
+    return manual_spec or top_level_venv_spec or longest_venv_spec
+
+  def resolve(self, symbol):
+    # type: (Text) -> Optional[Text]
+    """Return the spec of the target that provides the symbol, 'SKIP', or None if the symbol is unknown."""
+    if symbol not in self._resolved:
+      self._resolved[symbol] = self._resolve(symbol)
+    return self._resolved[symbol]
@@ -3,49 +3,16 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from hashlib import sha1
 import os
-import re
 
 from pants.backend.jvm.targets.scala_library import ScalaLibrary
+from pants.base.build_environment import get_buildroot
+from pants.util.memo import memoized_property
 
 from fsqio.pants.buildgen.core.subsystems.publish_subsystem import PublishSubsystem
 from fsqio.pants.buildgen.jvm.scala.buildgen_scala import BuildgenScala
-
-
-class ThriftDependencyMapper(object):
-  INCLUDE_REGEX = re.compile(r'\w*?include "(?P<include_path>.*?)"\w*$')
-
-  def includes_from_source(self, source):
-    with open(source, 'r') as f:
-      for line in f.readlines():
-        match = self.INCLUDE_REGEX.match(line)
-        if match:
-          yield match.groupdict()['include_path']
-
-  def buildroot_relative_source(self, source):
-    # TODO(pl): Get the source roots for thrift in a more
-    # generic way.  Either look at the entire graph to get
-    # them all, or query a proper SourceRoots API.
-    source_roots = {'src/thrift', 'test/thrift'}
-    found_paths = set()
-    for source_root in source_roots:
-      potential_path = os.path.join(source_root, source)
-      if os.path.exists(potential_path):
-        found_paths.add(potential_path)
-    if len(found_paths) > 1:
-      raise ValueError('Multiple candidate sources were found for thrift include {source}:'
-                       ' {candidates}'.format(source=source,
-                                              candidates=','.join(found_paths)))
-    if not found_paths:
-      raise ValueError('No candidate source found under known source roots for {source}'
-                       .format(source=source))
-    else:
-      return found_paths.pop()
-
-  def target_source_dependencies(self, target):
-    for source in target.sources_relative_to_buildroot():
-      for include in self.includes_from_source(source):
-        yield self.buildroot_relative_source(include)
+from fsqio.pants.buildgen.spindle.thrift_dependency_mapper import ThriftDependencyMapper
 
 
 class BuildgenSpindle(BuildgenScala):
@@ -56,6 +23,17 @@ class BuildgenSpindle(BuildgenScala):
     round_manager.require_data('scala_library_to_used_addresses')
     round_manager.require_data('source_to_addresses_mapper')
 
+  @classmethod
+  def register_options(cls, register):
+    super(BuildgenSpindle, cls).register_options(register)
+    register(
+      '--thrift-source-roots',
+      default=['src/thrift', 'test/thrift'],
+      advanced=True,
+      type=list,
+      help='The buildroot relative source roots that thrift include statements are resolved against.',
+    )
+
   @classmethod
   def product_types(cls):
     return [
@@ -82,8 +60,30 @@ class BuildgenSpindle(BuildgenScala):
   def supported_target_aliases(self):
     return ('spindle_thrift_library', 'scala_record_library')
 
+  @memoized_property
+  def thrift_dependency_mapper(self):
+    # The includes of a thrift file depend only on its content and the include regex, so invalidate on the version.
+    version_hash = sha1(str(self.implementation_version()).encode('utf-8')).hexdigest()
+    return ThriftDependencyMapper(
+      self.get_options().thrift_source_roots,
+      buildroot=get_buildroot(),
+      cache_file=os.path.join(self.workdir, 'thrift-includes-{}.json'.format(version_hash)),
+    )
+
+  def execute(self):
+    try:
+      super(BuildgenSpindle, self).execute()
+    finally:
+      self.thrift_dependency_mapper.write()
+
+  def prepare_buildgen_in_parallel(self, targets):
+    super(BuildgenSpindle, self).prepare_buildgen_in_parallel(targets)
+    # Resolving includes is cheap, and doing it up front keeps the include cache of this run.
+    for target in targets:
+      _ = list(self.thrift_dependency_mapper.target_source_dependencies(target))
+
   def buildgen_target(self, spindle_target):
-    source_dependencies = ThriftDependencyMapper().target_source_dependencies(spindle_target)
+    source_dependencies = self.thrift_dependency_mapper.target_source_dependencies(spindle_target)
     included_addresses = self.included_addresses(source_dependencies, spindle_target)
     synthetic_scala_targets = list(
       t for t in self._concrete_target_to_derivatives[spindle_target]
@@ -0,0 +1,121 @@
+# coding=utf-8
+# Copyright 2014 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+from hashlib import sha1
+import json
+import logging
+import os
+import re
+
+from typing import Dict, Iterable, List, Optional, Set, Text
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThriftDependencyMapper(object):
+  """Maps thrift sources to the buildroot relative paths of the thrift files they include.
+
+  Every file under the thrift source roots is indexed once, so resolving an include is a dict lookup. The includes of
+  each source are read once per run and recorded by the sha1 of its content, and when a cache_file is passed the
+  records of this run's sources are persisted, so unchanged sources are not parsed again on the next run.
+  """
+
+  INCLUDE_REGEX = re.compile(r'\w*?include "(?P<include_path>.*?)"\w*$')
+
+  def __init__(self, source_roots, buildroot='', cache_file=None):
+    # type: (Iterable[str], str, Optional[str]) -> None
+    """
+    :param source_roots: The buildroot relative thrift source roots that includes are resolved against.
+    :param buildroot: The buildroot that the source roots and sources are relative to. Defaults to the cwd.
+    :param cache_file: If passed, the includes found in each source content are persisted here between runs.
+    """
+    self._source_roots = sorted(set(source_roots))
+    self._buildroot = buildroot
+    self._cache_file = cache_file
+    self._thrift_file_index = None  # type: Optional[Dict[str, List[str]]]
+    self._includes_by_hash = None  # type: Optional[Dict[str, List[Text]]]
+    self._includes_by_source = {}  # type: Dict[str, List[Text]]
+    self._used_hashes = set()  # type: Set[str]
+    self._dirty = False
+
+  @property
+  def thrift_file_index(self):
+    # type: () -> Dict[str, List[str]]
+    """Maps paths relative to a source root to every buildroot relative file found at that path."""
+    if self._thrift_file_index is None:
+      index = {}  # type: Dict[str, List[str]]
+      for source_root in self._source_roots:
+        root_dir = os.path.join(self._buildroot, source_root)
+        for dirpath, _, filenames in os.walk(root_dir, followlinks=True):
+          rel_dir = os.path.relpath(dirpath, root_dir)
+          for filename in filenames:
+            rel_path = os.path.normpath(os.path.join(rel_dir, filename))
+            index.setdefault(rel_path, []).append(os.path.join(source_root, rel_path))
+      self._thrift_file_index = index
+    return self._thrift_file_index
+
+  @property
+  def _cached_includes(self):
+    # type: () -> Dict[str, List[Text]]
+    if self._includes_by_hash is None:
+      self._includes_by_hash = {}
+      if self._cache_file and os.path.isfile(self._cache_file):
+        with open(self._cache_file, 'r') as f:
+          # A corrupt cache is regenerated rather than failing buildgen.
+          try:
+            self._includes_by_hash = json.load(f)
+          except Exception:
+            logger.debug("Could not read the thrift include cache, regenerating: {}.".format(self._cache_file))
+    return self._includes_by_hash
+
+  def includes_from_source(self, source):
+    # type: (str) -> List[Text]
+    if source not in self._includes_by_source:
+      with open(os.path.join(self._buildroot, source), 'rb') as f:
+        content = f.read()
+      source_hash = sha1(content).hexdigest()
+      includes = self._cached_includes.get(source_hash)
+      if includes is None:
+        includes = []
+        for line in content.decode('utf-8').splitlines():
+          match = self.INCLUDE_REGEX.match(line)
+          if match:
+            includes.append(match.groupdict()['include_path'])
+        self._cached_includes[source_hash] = includes
+        self._dirty = True
+      self._used_hashes.add(source_hash)
+      self._includes_by_source[source] = includes
+    return self._includes_by_source[source]
+
+  def buildroot_relative_source(self, source):
+    # type: (Text) -> str
+    found_paths = self.thrift_file_index.get(os.path.normpath(source), [])
+    if len(found_paths) > 1:
+      raise ValueError('Multiple candidate sources were found for thrift include {source}:'
+                       ' {candidates}'.format(source=source,
+                                              candidates=','.join(found_paths)))
+    if not found_paths:
+      raise ValueError('No candidate source found under known source roots for {source}'
+                       .format(source=source))
+    else:
+      return found_paths[0]
+
+  def target_source_dependencies(self, target):
+    for source in target.sources_relative_to_buildroot():
+      for include in self.includes_from_source(source):
+        yield self.buildroot_relative_source(include)
+
+  def write(self):
+    # type: () -> None
+    """Persist the includes of the sources read by this run, if they differ from those on disk."""
+    if not self._cache_file or (not self._dirty and len(self._used_hashes) == len(self._cached_includes)):
+      return
+    self._includes_by_hash = {source_hash: self._cached_includes[source_hash] for source_hash in self._used_hashes}
+    tmp_file = '{}.tmp'.format(self._cache_file)
+    with open(tmp_file, 'w') as f:
+      json.dump(self._includes_by_hash, f)
+    os.rename(tmp_file, self._cache_file)
+    self._dirty = False
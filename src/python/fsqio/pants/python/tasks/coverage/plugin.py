@@ -13,7 +13,8 @@ from coverage.misc import join_regex
 from coverage.parser import PythonParser
 from coverage.python import PythonFileReporter
 
-# This is a full copy of the upstream file, minus this comment.
+# This is a copy of the upstream file, plus memoized file reporters and a source index sidecar
+# in place of the inline json map and the filesystem probes.
 # It's needed because PytestPrep looks for this file relative to itself.
 # -- Mathieu
 
@@ -54,22 +55,34 @@ class SimpleFileReporter(PythonFileReporter):
 class ChrootRemappingPlugin(CoveragePlugin):
   """A plugin that knows how to map Pants PEX chroots back to repo source code when reporting."""
 
-  def __init__(self, buildroot, src_chroot_path, src_to_target_base):
+  def __init__(self, buildroot, src_chroot_path, src_index_path):
     super(ChrootRemappingPlugin, self).__init__()
     self._buildroot = buildroot
     self._src_chroot_path = src_chroot_path
-    self._src_to_target_base = src_to_target_base
-    self._target_bases = set(self._src_to_target_base.values())
+    self._src_index_path = src_index_path
+    self._src_to_target_base_map = None
+    self._file_reporters = {}
+
+  @property
+  def _src_to_target_base(self):
+    # The sidecar written by PytestRun holds {target base: [source relative to the target base]}.
+    if self._src_to_target_base_map is None:
+      with open(self._src_index_path, 'r') as fp:
+        index = json.load(fp)
+      self._src_to_target_base_map = {
+        src: target_base for target_base, srcs in index.items() for src in srcs
+      }
+    return self._src_to_target_base_map
 
   def find_executable_files(self, top):
     # coverage uses this to associate files with this plugin.
     # We only want to be associated with the sources we know about.
     if top.startswith(self._src_chroot_path):
-      for dirname, _, filenames in os.walk(top):
-        reldir = os.path.relpath(dirname, self._src_chroot_path)
-        for filename in filenames:
-          if os.path.join(reldir, filename) in self._src_to_target_base:
-            yield os.path.join(dirname, filename)
+      reltop = os.path.relpath(top, self._src_chroot_path)
+      prefix = '' if reltop == os.curdir else reltop + os.sep
+      for src in self._src_to_target_base:
+        if src.startswith(prefix):
+          yield os.path.join(self._src_chroot_path, src)
 
   def file_tracer(self, filename):
     # Note that coverage will only call this on files that we yielded from find_executable_files(),
@@ -83,22 +96,20 @@ class ChrootRemappingPlugin(CoveragePlugin):
         return SimpleFileTracer(filename)
 
   def file_reporter(self, filename):
-    mapped_relpath = self._map_relpath(filename)
-    return SimpleFileReporter(filename, mapped_relpath)
+    # Memoized, so that rendering several reports from one Coverage parses each source once.
+    if filename not in self._file_reporters:
+      mapped_relpath = self._map_relpath(filename)
+      self._file_reporters[filename] = SimpleFileReporter(filename, mapped_relpath)
+    return self._file_reporters[filename]
 
   def _map_relpath(self, filename):
     src = os.path.relpath(filename, self._src_chroot_path)
-    target_base = self._src_to_target_base.get(src) or self._find_target_base(src)
-    return os.path.join(target_base, src) if target_base else filename
-
-  def _find_target_base(self, src):
-    for target_base in self._target_bases:
-      if os.path.isfile(os.path.join(self._buildroot, target_base, src)):
-        return target_base
+    target_base = self._src_to_target_base.get(src)
+    return os.path.join(target_base, src) if target_base is not None else filename
 
 
 def coverage_init(reg, options):
   buildroot = options['buildroot']
   src_chroot_path = options['src_chroot_path']
-  src_to_target_base = json.loads(options['src_to_target_base'])
-  reg.add_file_tracer(ChrootRemappingPlugin(buildroot, src_chroot_path, src_to_target_base))
+  src_index_path = options['src_index_path']
+  reg.add_file_tracer(ChrootRemappingPlugin(buildroot, src_chroot_path, src_index_path))
@@ -0,0 +1,41 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+# fixlint=skip
+
+"""Render several coverage reports from a single load of the coverage data.
+
+Runs as the entry point of the py.test binary, see PytestRun._maybe_emit_coverage_data:
+
+  report.py <rcfile> <format>[=<output path>] ...
+
+Each format is one of `report`, `html` (output is a directory) or `xml` (output is a file). The same Coverage
+instance renders every format, so the data file is read once and, through the ChrootRemappingPlugin's memoized file
+reporters, each source is parsed once.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+
+from coverage import Coverage
+
+
+def main(argv):
+  rcfile = argv[0]
+  cov = Coverage(config_file=rcfile)
+  cov.load()
+  for spec in argv[1:]:
+    fmt, _, output = spec.partition('=')
+    if fmt == 'report':
+      cov.report(ignore_errors=True)
+    elif fmt == 'html':
+      cov.html_report(directory=output, ignore_errors=True)
+    elif fmt == 'xml':
+      cov.xml_report(outfile=output, ignore_errors=True)
+    else:
+      raise ValueError('Unknown coverage report format: {}'.format(fmt))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
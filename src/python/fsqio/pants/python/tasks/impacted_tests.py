@@ -0,0 +1,195 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import ast
+from collections import defaultdict
+import os
+
+from typing import Dict, Iterable, Optional, Set, Text
+
+
+def module_for_source(source_relative_to_source_root):
+  # type: (Text) -> Optional[Text]
+  """The dotted module name that a python source is imported as, or None if it is not a python source."""
+  path, ext = os.path.splitext(source_relative_to_source_root)
+  if ext != '.py':
+    return None
+  if os.path.basename(path) == '__init__':
+    path = os.path.dirname(path)
+  return path.replace(os.sep, '.') or None
+
+
+def imported_symbols(python_imports):
+  # type: (Iterable) -> Set[Text]
+  """The dotted symbols named by the PythonImportParser imports of a source."""
+  symbols = set()
+  for imp in python_imports:
+    for name, _ in imp.aliases:
+      symbols.add('.'.join([imp.module, name]) if imp.module else name)
+  return symbols
+
+
+def source_imported_symbols(content, module, is_package=False):
+  # type: (bytes, Text, bool) -> Set[Text]
+  """The absolute dotted symbols imported anywhere in the python source content, not just at the top level.
+
+  Relative imports are resolved against the package of the source, so a symbol is returned as it would be imported
+  from the source root.
+
+  :param module: The module the source is imported as.
+  :param is_package: Whether the source is the `__init__.py` of the module, which is then its own package.
+  :raises: :class:`SyntaxError` if the content cannot be parsed, or :class:`ValueError` if a relative import
+           reaches above the top-level package.
+  """
+  package = module.split('.') if is_package else module.split('.')[:-1]
+  symbols = set()
+  for node in ast.walk(ast.parse(content)):
+    if isinstance(node, ast.Import):
+      symbols.update(alias.name for alias in node.names)
+    elif isinstance(node, ast.ImportFrom):
+      if node.level:
+        if node.level - 1 >= len(package):
+          raise ValueError('A relative import on line {} of {} reaches above its top-level package.'
+                           .format(node.lineno, module))
+        base = package[:len(package) - (node.level - 1)]
+      else:
+        base = []
+      if node.module:
+        base = base + node.module.split('.')
+      for alias in node.names:
+        symbols.add('.'.join(base + ([] if alias.name == '*' else [alias.name])))
+  symbols.discard('')
+  return symbols
+
+
+class ImportGraph(object):
+  """The file level import graph of a set of python sources, and the sources affected by changes to some of them.
+
+  An imported symbol depends on the source of the longest dotted prefix of it that is a module in the graph, along
+  with the `__init__.py` of every package above that module, since importing a module runs those too.
+  """
+
+  def __init__(self, source_to_module, source_to_symbols):
+    # type: (Dict[Text, Text], Dict[Text, Iterable[Text]]) -> None
+    """
+    :param source_to_module: Maps each buildroot relative source to the module it is imported as.
+    :param source_to_symbols: Maps each buildroot relative source to the symbols it imports.
+    """
+    self._module_to_source = {module: source for source, module in source_to_module.items()}
+    self._dependents = defaultdict(set)  # type: Dict[Text, Set[Text]]
+    for source, symbols in source_to_symbols.items():
+      for dependency in self._dependencies(symbols):
+        if dependency != source:
+          self._dependents[dependency].add(source)
+
+  def _dependencies(self, symbols):
+    # type: (Iterable[Text]) -> Set[Text]
+    dependencies = set()
+    for symbol in symbols:
+      parts = symbol.split('.')
+      for i in range(1, len(parts) + 1):
+        source = self._module_to_source.get('.'.join(parts[:i]))
+        if source is not None:
+          dependencies.add(source)
+    return dependencies
+
+  def dependents(self, source):
+    # type: (Text) -> Set[Text]
+    """The sources that import the given source directly."""
+    return self._dependents.get(source, set())
+
+  def affected_sources(self, changed_sources):
+    # type: (Iterable[Text]) -> Set[Text]
+    """The changed sources, and every source that transitively imports one of them."""
+    affected = set()
+    pending = list(changed_sources)
+    while pending:
+      source = pending.pop()
+      if source not in affected:
+        affected.add(source)
+        pending.extend(self.dependents(source))
+    return affected
+
+
+class UntraceableChangeError(Exception):
+  """Indicates a change whose effect on the tests cannot be traced through the import graph."""
+
+
+# Config files that can change how any test runs.
+_CONFIG_FILES = frozenset(['pants.ini', 'pytest.ini'])
+
+
+def _is_untraceable(changed_file, source_roots, target_dirs, symbol_prefixes):
+  # type: (Text, Set[Text], Set[Text], Set[Text]) -> bool
+  dirname, basename = os.path.split(changed_file)
+  if basename in _CONFIG_FILES:
+    return True
+  if dirname in target_dirs and (basename.startswith('BUILD') or
+                                 (basename.startswith('requirements') and basename.endswith('.txt'))):
+    return True
+  # A python file that is not a source of the closure, but is under one of its source roots, is an added or deleted
+  # module, or one of another project. Only one that the closure imports can affect the tests.
+  for source_root in source_roots:
+    if changed_file.startswith(source_root + os.sep):
+      module = module_for_source(os.path.relpath(changed_file, source_root))
+      if module is not None and module in symbol_prefixes:
+        return True
+  return False
+
+
+def affected_test_sources(
+    changed_files,  # type: Iterable[Text]
+    source_to_module,  # type: Dict[Text, Text]
+    resource_to_sources,  # type: Dict[Text, Set[Text]]
+    test_sources,  # type: Set[Text]
+    source_to_symbols,  # type: Dict[Text, Optional[Set[Text]]]
+    source_roots,  # type: Set[Text]
+    target_dirs,  # type: Set[Text]
+):
+  # type: (...) -> Set[Text]
+  """The test sources affected by the changed files.
+
+  :param changed_files: The buildroot relative changed files.
+  :param source_to_module: Maps each buildroot relative python source of the tests' closure to its module.
+  :param resource_to_sources: Maps each other buildroot relative source of the closure to the python sources of its
+                              target, which a change to it is taken to change.
+  :param test_sources: The buildroot relative test sources.
+  :param source_to_symbols: Maps each python source to the symbols it imports, or to None if they could not be read.
+  :param source_roots: The buildroot relative source roots of the closure's targets.
+  :param target_dirs: The buildroot relative directories of the BUILD files that define the closure's targets.
+  :raises: :class:`UntraceableChangeError` if a changed file can affect the tests other than through the import
+           graph, or if the imports of a source could not be read. Those files are the BUILD and requirements files
+           of the closure's targets, pants.ini and pytest.ini, and python files under the closure's source roots
+           that are not its sources but are imported by it, such as added or deleted modules. Any other changed
+           file is ignored.
+  """
+  unreadable = sorted(source for source, symbols in source_to_symbols.items() if symbols is None)
+  if unreadable:
+    raise UntraceableChangeError('Could not read the imports of {}.'.format(', '.join(unreadable)))
+
+  symbol_prefixes = set()  # type: Set[Text]
+  for symbols in source_to_symbols.values():
+    for symbol in symbols:
+      parts = symbol.split('.')
+      symbol_prefixes.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+
+  changed_sources = set()  # type: Set[Text]
+  for changed_file in changed_files:
+    if changed_file in source_to_module:
+      changed_sources.add(changed_file)
+    elif changed_file in resource_to_sources:
+      changed_sources.update(resource_to_sources[changed_file])
+    elif _is_untraceable(changed_file, source_roots, target_dirs, symbol_prefixes):
+      raise UntraceableChangeError('{} can affect the tests, but not through their imports.'.format(changed_file))
+
+  # A changed conftest.py applies to every test at or below its directory.
+  for conftest in [source for source in changed_sources if os.path.basename(source) == 'conftest.py']:
+    conftest_dir = os.path.dirname(conftest) + os.sep
+    changed_sources.update(source for source in test_sources if source.startswith(conftest_dir))
+
+  graph = ImportGraph(source_to_module, {
+    source: symbols for source, symbols in source_to_symbols.items() if symbols is not None
+  })
+  return graph.affected_sources(changed_sources) & set(test_sources)
@@ -0,0 +1,92 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict, namedtuple
+from xml.etree.ElementTree import ParseError, iterparse
+
+from typing import Any, Dict, Iterable, List, Optional, Text
+
+
+SUCCESS = 'success'
+SKIPPED = 'skipped'
+FAILURE = 'failure'
+ERROR = 'error'
+
+
+class JunitXmlError(Exception):
+  """Indicates a junit xml file that could not be read."""
+
+
+JunitXmlReport = namedtuple('JunitXmlReport', ['failed_files', 'tests_info'])
+JunitXmlReport.__doc__ = """The results read from one junit xml file.
+
+failed_files: The `file` attribute of every failed or errored testcase, in document order. Empty if the first
+  testsuite reports neither failures nor errors.
+tests_info: An OrderedDict of `<classname>.<name>` to the same test info dict that
+  `TestRunnerTaskMixin.parse_test_info` returns: the `time` (or None), the `result_code` and the requested attributes.
+"""
+
+
+def _result_code(testcase):
+  # type: (Any) -> Text
+  outcomes = {child.tag for child in testcase.iter() if child is not testcase}
+  if FAILURE in outcomes:
+    return FAILURE
+  elif ERROR in outcomes:
+    return ERROR
+  elif SKIPPED in outcomes:
+    return SKIPPED
+  return SUCCESS
+
+
+def parse_junit_xml(xml_path, testcase_attributes=()):
+  # type: (str, Iterable[Text]) -> JunitXmlReport
+  """Read the failed tests and the info of every test from a junit xml file in a single streaming pass.
+
+  Each testcase is dropped from the tree as soon as it is read, so memory does not grow with the number of tests.
+
+  :raises: JunitXmlError if the file cannot be parsed or has no testsuite with failures and errors counts.
+  """
+  testcase_attributes = list(testcase_attributes)
+  failed_files = []  # type: List[Text]
+  tests_info = OrderedDict()  # type: Dict[Text, Dict[Text, Any]]
+  suite_counts = None  # type: Optional[Any]
+  parents = []  # type: List[Any]
+  try:
+    for event, elem in iterparse(xml_path, events=('start', 'end')):
+      if event == 'start':
+        if elem.tag == 'testsuite' and suite_counts is None:
+          suite_counts = (elem.get('failures', ''), elem.get('errors', ''))
+        parents.append(elem)
+        continue
+
+      parents.pop()
+      if elem.tag != 'testcase':
+        continue
+      test_info = {}  # type: Dict[Text, Any]
+      try:
+        test_info['time'] = float(elem.get('time'))
+      except (TypeError, ValueError):
+        test_info['time'] = None
+      for attribute in testcase_attributes:
+        test_info[attribute] = elem.get(attribute, '')
+      test_info['result_code'] = _result_code(elem)
+      if test_info['result_code'] in (FAILURE, ERROR):
+        failed_files.append(elem.get('file', ''))
+      tests_info['{}.{}'.format(elem.get('classname', ''), elem.get('name', ''))] = test_info
+
+      elem.clear()
+      if parents:
+        parents[-1].remove(elem)
+  except ParseError as e:
+    raise JunitXmlError(e)
+
+  if suite_counts is None:
+    raise JunitXmlError('There is no <testsuite> element in xml file: {}'.format(xml_path))
+  try:
+    failures, errors = (int(count) for count in suite_counts)
+  except ValueError as e:
+    raise JunitXmlError(e)
+  return JunitXmlReport(failed_files=failed_files if failures or errors else [], tests_info=tests_info)
@@ -0,0 +1,245 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from hashlib import sha1
+import json
+import logging
+import os
+from textwrap import dedent
+import threading
+
+from typing import Any, Dict, List, Optional, Set, Text
+
+
+logger = logging.getLogger(__name__)
+
+
+def collection_cache_key(source, content_digest, environment_digest):
+  # type: (Text, Text, Text) -> Text
+  """The key of a test file's collected tests: its source, its content and everything else that shapes collection.
+
+  The environment digest should cover the py.test binary, its config and the user conftests that apply to the file.
+  """
+  hasher = sha1()
+  for part in (source, content_digest, environment_digest):
+    hasher.update(part.encode('utf-8'))
+    hasher.update(b'\0')
+  return hasher.hexdigest()
+
+
+class PytestCollectionCache(object):
+  """The tests collected from each test file, persisted as json.
+
+  Each entry is the list of `[nodeid suffix, keywords]` of one test file's tests, in collection order, where the
+  nodeid suffix is the nodeid without its leading file path. Safe to record into from concurrent partitions.
+
+  Records are buffered until `write`, which persists only the entries that the run looked up or recorded.
+  """
+
+  def __init__(self, path):
+    # type: (str) -> None
+    self.path = path
+    self._lock = threading.Lock()
+    self._loaded = None  # type: Optional[Dict[Text, List[Any]]]
+    self._used = set()  # type: Set[Text]
+    self._dirty = False
+
+  @property
+  def _entries(self):
+    # type: () -> Dict[Text, List[Any]]
+    if self._loaded is None:
+      self._loaded = {}
+      if os.path.isfile(self.path):
+        with open(self.path, 'r') as f:
+          # A corrupt cache only costs a full collection.
+          try:
+            self._loaded = json.load(f)
+          except Exception:
+            logger.debug("Could not read the collection cache, starting over: {}.".format(self.path))
+    return self._loaded
+
+  def get(self, key):
+    # type: (Text) -> Optional[List[Any]]
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._used.add(key)
+      return entry
+
+  def record(self, entries):
+    # type: (Dict[Text, List[Any]]) -> None
+    """Record the given entries over any earlier ones."""
+    if not entries:
+      return
+    with self._lock:
+      self._entries.update(entries)
+      self._used.update(entries)
+      self._dirty = True
+
+  def write(self):
+    # type: () -> None
+    """Persist the entries that this run looked up or recorded, if they differ from those on disk."""
+    with self._lock:
+      if not self._used or (not self._dirty and len(self._used) == len(self._entries)):
+        return
+      self._loaded = {key: self._entries[key] for key in self._used}
+      tmp_path = '{}.tmp'.format(self.path)
+      with open(tmp_path, 'w') as f:
+        json.dump(self._loaded, f, sort_keys=True)
+      os.rename(tmp_path, self.path)
+      self._dirty = False
+
+
+def read_collection_results(results_path):
+  # type: (str) -> Dict[Text, List[Any]]
+  """Read the entries that the generated conftest recorded, by absolute source chroot path of each test file."""
+  if not os.path.isfile(results_path):
+    return {}
+  with open(results_path, 'r') as f:
+    return json.load(f)
+
+
+def collection_conftest_content(cached_files, results_path):
+  # type: (Optional[List[Any]], Optional[Text]) -> Text
+  """Conftest content that collects from the collection cache, and records the tests it does collect.
+
+  :param cached_files: The `[absolute source chroot path, entry]` of every test file of the run in collection order,
+                       when they are all in the collection cache, else None. A test file that has no test selected
+                       by the shard and `-k` is then left unimported.
+  :param results_path: The file to record the entries of every successfully collected test file to, or None.
+
+  The content also holds the test address helpers that the sharding conftest content uses, and must follow the
+  NodeRenamerPlugin conftest content, whose sources map it uses.
+  """
+  return dedent("""
+
+    ### GENERATED BY PANTS ###
+
+    import json
+    import os
+
+    import pytest
+
+
+    # [absolute source chroot path, [[nodeid suffix, keywords], ...]] of every test file of the run, in collection
+    # order, when they are all in the collection cache, else None.
+    _PANTS_COLLECTION_CACHE = {cached_files!r}
+
+    # The file to record the collected tests of each successfully collected test file to, or None.
+    _PANTS_COLLECTION_RESULTS_PATH = {results_path!r}
+
+
+    def _pants_is_conftest(item):
+      return item.fspath and item.fspath.basename == 'conftest.py'
+
+
+    def _pants_item_address(item):
+      # (buildroot relative source, nodeid suffix), which depends on neither the source chroot nor the rootdir.
+      file_part = item.nodeid.split('::', 1)[0]
+      return NodeRenamerPlugin._SOURCES_MAP.get(str(item.fspath), file_part), item.nodeid[len(file_part):]
+
+
+    def _pants_test_addresses(items):
+      # The addresses of every test of the run in collection order, including those of the unimported test files.
+      if _PANTS_COLLECTION_CACHE is None:
+        return [_pants_item_address(x) for x in items if not _pants_is_conftest(x)]
+      return [(NodeRenamerPlugin._SOURCES_MAP.get(path, path), suffix)
+              for path, entries in _PANTS_COLLECTION_CACHE if os.path.basename(path) != 'conftest.py'
+              for suffix, _ in entries]
+
+
+    def _pants_in_shard(addresses):
+      # Redefined by the sharding conftest content, if any.
+      return [True] * len(addresses)
+
+
+    def _pants_select_shard(config, items, shard, nshards):
+      conftest_items = [x for x in items if _pants_is_conftest(x)]
+      addresses = _pants_test_addresses(items)
+      selected = set(address for address, in_shard in zip(addresses, _pants_in_shard(addresses)) if in_shard)
+      items[:] = [x for x in items if _pants_is_conftest(x) or _pants_item_address(x) in selected]
+      reporter = config.pluginmanager.getplugin('terminalreporter')
+      reporter.write_line('Only executing {{}} of {{}} total tests in shard {{}} of '
+                          '{{}}'.format(len(items), len(addresses) + len(conftest_items), shard, nshards),
+                          bold=True, invert=True, yellow=True)
+
+
+    class _PantsKeywords(object):
+      # py.test's -k semantics: a name in the expression is true if it is a substring of any of the keywords.
+      def __init__(self, keywords):
+        self._keywords = keywords
+
+      def __getitem__(self, name):
+        return any(name in keyword for keyword in self._keywords)
+
+
+    def _pants_keyword_match(config, keywords):
+      expr = (config.getoption('keyword') or '').lstrip()
+      if not expr or expr.endswith(':'):
+        # The `-k name:` form selects by the order of the collected tests, so any test may be selected.
+        return True
+      if expr.startswith('-'):
+        expr = 'not ' + expr[1:]
+      try:
+        return eval(expr, {{}}, _PantsKeywords(keywords))
+      except Exception:
+        # Leave the error, if any, to py.test.
+        return True
+
+
+    class _PantsUncollectedModule(pytest.File):
+      # Stands in for a test file that has no selected test, so that it is not imported.
+      def collect(self):
+        return []
+
+
+    class CollectionCachePlugin(object):
+      def __init__(self, config):
+        self._config = config
+        self._selected_paths = None
+        self._collected_paths = set()
+        self._failed_paths = set()
+
+      def _selected(self):
+        if self._selected_paths is None:
+          tests = [(path, keywords) for path, entries in _PANTS_COLLECTION_CACHE
+                   if os.path.basename(path) != 'conftest.py'
+                   for _, keywords in entries]
+          in_shard = _pants_in_shard(_pants_test_addresses([]))
+          self._selected_paths = set(path for (path, keywords), selected in zip(tests, in_shard)
+                                     if selected and _pants_keyword_match(self._config, keywords))
+        return self._selected_paths
+
+      @pytest.hookimpl(tryfirst=True)
+      def pytest_pycollect_makemodule(self, path, parent):
+        if (_PANTS_COLLECTION_CACHE is not None and path.basename != 'conftest.py'
+            and str(path) not in self._selected()):
+          return _PantsUncollectedModule(path, parent)
+
+      @pytest.hookimpl(hookwrapper=True)
+      def pytest_make_collect_report(self, collector):
+        outcome = yield
+        if _PANTS_COLLECTION_RESULTS_PATH is not None and collector.fspath:
+          report = outcome.get_result()
+          if report.failed:
+            self._failed_paths.add(str(collector.fspath))
+          elif isinstance(collector, pytest.Module):
+            self._collected_paths.add(str(collector.fspath))
+
+      @pytest.hookimpl(tryfirst=True)
+      def pytest_collection_modifyitems(self, session, config, items):
+        # Runs before any test is deselected. Test files with collection errors are not recorded, so that the
+        # errors are reported again by the next run.
+        if _PANTS_COLLECTION_RESULTS_PATH is None:
+          return
+        results = dict((path, []) for path in self._collected_paths - self._failed_paths)
+        for item in items:
+          entries = results.get(str(item.fspath))
+          if entries is not None:
+            file_part = item.nodeid.split('::', 1)[0]
+            entries.append([item.nodeid[len(file_part):], sorted(item.keywords)])
+        with open(_PANTS_COLLECTION_RESULTS_PATH, 'w') as fp:
+          json.dump(results, fp)
+    """.format(cached_files=cached_files, results_path=results_path))
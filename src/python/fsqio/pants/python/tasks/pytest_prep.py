@@ -19,9 +19,11 @@ from pants.backend.python.tasks.python_execution_task_base import PythonExecutio
 from pex.pex_info import PexInfo
 import pkg_resources
 
-# This is pretty much a full copy of upstream. We made two changes:
+# This is pretty much a full copy of upstream. We made four changes:
 # - We add a `requirements` option to the task
 # - We add the contents from that option to the output of `extra_requirements`
+# - We embed a module that renders all coverage reports in one process, see coverage/report.py
+# - We embed a warm py.test worker, see worker/server.py
 # We do this so that we can add extra constraints to pytest dependencies.
 
 
@@ -32,6 +34,8 @@ class PytestPrep(PythonExecutionTaskBase):
     """A `py.test` PEX binary with an embedded default (empty) `pytest.ini` config file."""
 
     _COVERAGE_PLUGIN_MODULE_NAME = '__{}__'.format(__name__.replace('.', '_'))
+    _COVERAGE_REPORT_MODULE_NAME = '__{}_coverage_report__'.format(__name__.replace('.', '_'))
+    _PYTEST_WORKER_MODULE_NAME = '__{}_pytest_worker__'.format(__name__.replace('.', '_'))
 
     def __init__(self, pex):
       self._pex = pex
@@ -60,6 +64,22 @@ class PytestPrep(PythonExecutionTaskBase):
       """
       return cls._COVERAGE_PLUGIN_MODULE_NAME
 
+    @classmethod
+    def coverage_report_module(cls):
+      """Return the name of the coverage reporting module embedded in this py.test binary.
+
+      :rtype: str
+      """
+      return cls._COVERAGE_REPORT_MODULE_NAME
+
+    @classmethod
+    def pytest_worker_module(cls):
+      """Return the name of the warm py.test worker module embedded in this py.test binary.
+
+      :rtype: str
+      """
+      return cls._PYTEST_WORKER_MODULE_NAME
+
   @classmethod
   def register_options(cls, register):
     super(PytestPrep, cls).register_options(register)
@@ -73,7 +93,7 @@ class PytestPrep(PythonExecutionTaskBase):
 
   @classmethod
   def implementation_version(cls):
-    return super(PytestPrep, cls).implementation_version() + [('PytestPrep', 3)]
+    return super(PytestPrep, cls).implementation_version() + [('PytestPrep', 6)]
 
   @classmethod
   def product_types(cls):
@@ -90,6 +110,10 @@ class PytestPrep(PythonExecutionTaskBase):
     yield self.ExtraFile.empty('pytest.ini')
     yield self.ExtraFile(path='{}.py'.format(self.PytestBinary.coverage_plugin_module()),
                          content=pkg_resources.resource_string(__name__, 'coverage/plugin.py'))
+    yield self.ExtraFile(path='{}.py'.format(self.PytestBinary.coverage_report_module()),
+                         content=pkg_resources.resource_string(__name__, 'coverage/report.py'))
+    yield self.ExtraFile(path='{}.py'.format(self.PytestBinary.pytest_worker_module()),
+                         content=pkg_resources.resource_string(__name__, 'worker/server.py'))
 
   def execute(self):
     pex_info = PexInfo.default()
@@ -15,11 +15,15 @@ from __future__ import (
 
 from collections import OrderedDict
 from contextlib import contextmanager
+from hashlib import sha1
 import itertools
 import json
 import os
 import shutil
+import sys
+import tempfile
 from textwrap import dedent
+import threading
 import time
 import traceback
 import uuid
@@ -30,6 +34,7 @@ from pants.base.build_environment import get_buildroot
 from pants.base.exceptions import ErrorWhileTesting, TaskError
 from pants.base.fingerprint_strategy import DefaultFingerprintStrategy
 from pants.base.hash_utils import Sharder
+from pants.base.worker_pool import Work, WorkerPool
 from pants.base.workunit import WorkUnitLabel
 from pants.build_graph.target import Target
 from pants.task.task import Task
@@ -38,13 +43,30 @@ from pants.util.contextutil import environment_as, pushd, temporary_dir, tempora
 from pants.util.dirutil import mergetree, safe_mkdir, safe_mkdir_for
 from pants.util.memo import memoized_method, memoized_property
 from pants.util.objects import datatype
-from pants.util.process_handler import SubprocessProcessHandler
+from pants.util.process_handler import ProcessHandler, SubprocessProcessHandler, subprocess
 from pants.util.strutil import safe_shlex_split
-from pants.util.xml_parser import XmlParser
-from six import StringIO
+from six import StringIO, reraise
 from six.moves import configparser
 
+from fsqio.pants.buildgen.python.import_cache import PythonImportCache, content_hash
+from fsqio.pants.buildgen.python.source_analysis.python_import_parser import Import
+from fsqio.pants.python.tasks.impacted_tests import (
+  UntraceableChangeError,
+  affected_test_sources,
+  imported_symbols,
+  module_for_source,
+  source_imported_symbols,
+)
+from fsqio.pants.python.tasks.junit_xml import JunitXmlError, parse_junit_xml
+from fsqio.pants.python.tasks.pytest_collection_cache import (
+  PytestCollectionCache,
+  collection_cache_key,
+  collection_conftest_content,
+  read_collection_results,
+)
 from fsqio.pants.python.tasks.pytest_prep import PytestPrep
+from fsqio.pants.python.tasks.pytest_timings import PytestTimings, duration_shard_conftest_content, timing_key
+from fsqio.pants.python.tasks.pytest_workers import PytestWorkerError, PytestWorkerPool
 
 from typing import Any
 
@@ -52,6 +74,13 @@ from typing import Any
 # - Change import of PytestPrep to pull fsqio version
 # - Add fixlint and pylint headers
 # - Couple of style fixes to get pep8 passing
+# - Read the junit xml in a single streaming pass, see junit_xml.py
+# - Optionally run partitions concurrently, see --parallelism
+# - Optionally balance shards by test duration, see --test-shard-strategy
+# - Optionally run only the test files affected by a change, see --changed-since
+# - Render all coverage reports in one process, see --coverage-reports
+# - Optionally leave test files with no selected test unimported, see --collection-cache
+# - Optionally run the tests in warm, long-lived py.test workers, see --worker-pool
 # We need this copy as the upstream version imports PytestPrep and
 # uses that import to declare it's required input type. As we
 # redifine PytestPrep this "changes" the input type. So we have to
@@ -86,6 +115,10 @@ class _Workdirs(_WorkDirsBaseClass):
     safe_mkdir(coverage_workdir)
     return coverage_workdir
 
+  @property
+  def coverage_data_file(self):
+    return os.path.join(self.root_dir, '.coverage')
+
   def files(self):
     def files_iter():
       for dir_path, _, file_names in os.walk(self.root_dir):
@@ -94,6 +127,29 @@ class _Workdirs(_WorkDirsBaseClass):
     return list(files_iter())
 
 
+class _PytestWorkerProcessHandler(ProcessHandler):
+  """A `ProcessHandler` for a batch of tests running in a warm py.test worker."""
+
+  def __init__(self, batch, cmd):
+    self._batch = batch
+    self._cmd = cmd
+
+  def wait(self, timeout=None):
+    rc = self._batch.wait(timeout=timeout)
+    if rc is None:
+      raise subprocess.TimeoutExpired(self._cmd, timeout)
+    return rc
+
+  def kill(self):
+    return self._batch.kill()
+
+  def terminate(self):
+    return self._batch.terminate()
+
+  def poll(self):
+    return self._batch.poll()
+
+
 class PytestResult(TestResult):
   _SUCCESS_EXIT_CODES = (
     0,
@@ -112,9 +168,24 @@ class PytestResult(TestResult):
 
 class PytestRun(PartitionedTestRunnerTaskMixin, Task):
 
+  def __init__(self, *args, **kwargs):
+    super(PytestRun, self).__init__(*args, **kwargs)
+    # Spawning a test process changes the cwd of the whole process, so concurrent partitions take turns.
+    self._spawn_lock = threading.Lock()
+    # While partitions run concurrently, maps each partition to the outcome of its run.
+    self._concurrent_partition_runs = None
+
   @classmethod
   def implementation_version(cls):
-    return super(PytestRun, cls).implementation_version() + [('PytestRun', 3)]
+    return super(PytestRun, cls).implementation_version() + [('PytestRun', 4)]
+
+  def execute(self):
+    try:
+      return super(PytestRun, self).execute()
+    finally:
+      # Partitions only buffer what they record, so that the caches are written once per run.
+      self._collection_cache.write()
+      self._recorded_test_timings.write(get_buildroot())
 
   @classmethod
   def register_options(cls, register):
@@ -145,15 +216,57 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
     register('--coverage-output-dir', metavar='<DIR>', default=None,
              help='Directory to emit coverage reports to. '
              'If not specified, a default within dist is used.')
+    register('--coverage-reports', type=list, default=['report', 'html', 'xml'], fingerprint=True,
+             help='The coverage reports to emit, out of report (to the console), html and xml. They are all '
+                  'rendered by one process from a single load of the coverage data.')
 
     register('--test-shard', fingerprint=True,
              help='Subset of tests to run, in the form M/N, 0 <= M < N. For example, 1/3 means '
                   'run tests number 2, 5, 8, 11, ...')
+    register('--test-shard-strategy', choices=['round-robin', 'duration'], default='round-robin',
+             fingerprint=True,
+             help='How --test-shard splits the tests. round-robin deals the collected tests out in order. '
+                  'duration balances the total duration of the shards with the timings of --test-timings-file, '
+                  'and records how long each test took. Tests without a timing are dealt round-robin.')
+    # The content of the file is part of the fingerprint instead, see `fingerprint_strategy`.
+    register('--test-timings-file', metavar='<FILE>', default=None,
+             help='The test timings that --test-shard-strategy=duration balances shards by. Every shard must be '
+                  'given the same file, which is only read, so that the shards agree on the split. The timings '
+                  'each run records go to recorded-test-timings.json in the task workdir instead, and can be '
+                  'gathered into the next snapshot.')
 
     register('--extra-pythonpath', type=list, fingerprint=True, advanced=True,
              help='Add these entries to the PYTHONPATH when running the tests. '
                   'Useful for attaching to debuggers in test code.')
 
+    register('--changed-since', metavar='<GIT REF>', default=None,
+             help='Only run the test files that import, directly or transitively, a python source that changed '
+                  'since this git ref (including uncommitted changes). Every import statement of a source counts, '
+                  'including those inside functions and relative imports, and they are cached by source content '
+                  'between runs. Every test runs if a changed file can affect the tests other than through their '
+                  'imports (a BUILD or requirements file of their targets, pants.ini, pytest.ini, or an added or '
+                  'deleted module that they import), or if the imports of a source cannot be read. Other changed '
+                  'files are ignored. Results of these runs are never cached.')
+
+    register('--collection-cache', type=bool, default=False,
+             help='Cache the tests collected from each test file, by the content of the file, its conftests and the '
+                  'py.test binary. When --test-shard or -k deselects tests, a test file with none of its cached '
+                  'tests selected is then not imported. Test files missing from the cache are collected first, on '
+                  'their own.')
+
+    register('--worker-pool', type=bool, default=False,
+             help='Run the tests in long-lived py.test workers, which bootstrap the py.test binary and import '
+                  'py.test and its plugins once, then run each batch of test files in a fork. Workers are kept '
+                  'between runs for the same py.test binary and source chroot, and are stopped once either changes. '
+                  'Ignored with --profile, --pdb or --trace.')
+    register('--worker-idle-timeout', type=int, default=600, advanced=True,
+             help='Seconds after which a py.test worker with no tests to run exits.')
+
+    register('--parallelism', type=int, default=1,
+             help='Run up to this many partitions (see --fast) at once, each in its own pytest process. '
+                  'Results are still reported and exposed in partition order, as with serial runs. '
+                  'Ignored with --fail-fast.')
+
   @classmethod
   def supports_passthru_args(cls):
     return True
@@ -209,7 +322,7 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
 
   # N.B.: Extracted for tests.
   @classmethod
-  def _add_plugin_config(cls, cp, src_chroot_path, src_to_target_base):
+  def _add_plugin_config(cls, cp, src_chroot_path, src_index_path):
     # We use a coverage plugin to map PEX chroot source paths back to their original repo paths for
     # report output.
     plugin_module = PytestPrep.PytestBinary.coverage_plugin_module()
@@ -219,13 +332,24 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
     cp.add_section(plugin_module)
     cp.set(plugin_module, 'buildroot', get_buildroot())
     cp.set(plugin_module, 'src_chroot_path', src_chroot_path)
-    cp.set(plugin_module, 'src_to_target_base', json.dumps(src_to_target_base))
+    cp.set(plugin_module, 'src_index_path', src_index_path)
 
-  def _generate_coverage_config(self, src_to_target_base):
+  @staticmethod
+  def _write_src_index(fp, src_to_target_base):
+    # The plugin's index of the sources it remaps, grouped by target base so that each target base is
+    # written once: {target base: [source relative to the target base]}.
+    index = OrderedDict()
+    for src, target_base in sorted(src_to_target_base.items()):
+      index.setdefault(target_base, []).append(src)
+    json.dump(index, fp, separators=(',', ':'))
+
+  def _generate_coverage_config(self, src_index_path, data_file):
     cp = configparser.SafeConfigParser()
     cp.readfp(StringIO(self.DEFAULT_COVERAGE_CONFIG))
+    # Each partition gets its own data file, so that partitions can run at the same time.
+    cp.set('run', 'data_file', data_file)
 
-    self._add_plugin_config(cp, self._source_chroot_path, src_to_target_base)
+    self._add_plugin_config(cp, self._source_chroot_path, src_index_path)
 
     # See the debug options here: http://nedbatchelder.com/code/coverage/cmd.html#cmd-run-debug
     if self._debug:
@@ -260,11 +384,15 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
 
   @contextmanager
   def _cov_setup(self, workdirs, coverage_morfs, src_to_target_base):
-    cp = self._generate_coverage_config(src_to_target_base=src_to_target_base)
-    # Note that it's important to put the tmpfile under the workdir, because pytest
+    # Note that it's important to put the tmpfiles under the workdir, because pytest
     # uses all arguments that look like paths to compute its rootdir, and we want
     # it to pick the buildroot.
-    with temporary_file(root_dir=workdirs.root_dir) as fp:
+    with temporary_file(root_dir=workdirs.root_dir) as index_fp, \
+         temporary_file(root_dir=workdirs.root_dir) as fp:
+      self._write_src_index(index_fp, src_to_target_base)
+      index_fp.close()
+      cp = self._generate_coverage_config(src_index_path=index_fp.name,
+                                          data_file=workdirs.coverage_data_file)
       cp.write(fp)
       fp.close()
       coverage_rc = fp.name
@@ -284,6 +412,9 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
       yield []
       return
 
+    # Reject bad report formats now, rather than after the tests have run.
+    report_specs = self._coverage_report_specs(workdirs)
+
     pex_src_root = os.path.relpath(self._source_chroot_path, get_buildroot())
 
     src_to_target_base = {}
@@ -354,32 +485,67 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
       try:
         yield args
       finally:
-        env = {
-          'PEX_MODULE': 'coverage.cmdline:main'
-        }
-
-        def coverage_run(subcommand, arguments):
-          return self._pex_run(pex,
-                               workunit_name='coverage-{}'.format(subcommand),
-                               args=[subcommand] + arguments,
-                               env=env)
-
-        # The '.coverage' data file is output in the CWD of the test run above; so we make sure to
-        # look for it there.
-        with self._maybe_run_in_chroot():
-          # On failures or timeouts, the .coverage file won't be written.
-          if not os.path.exists('.coverage'):
-            self.context.log.warn('No .coverage file was found! Skipping coverage reporting.')
-          else:
-            coverage_run('report', ['-i', '--rcfile', coverage_rc])
-
-            coverage_workdir = workdirs.coverage_path
-            coverage_run('html', ['-i', '--rcfile', coverage_rc, '-d', coverage_workdir])
-
-            coverage_xml = os.path.join(coverage_workdir, 'coverage.xml')
-            coverage_run('xml', ['-i', '--rcfile', coverage_rc, '-o', coverage_xml])
-
-  def _get_shard_conftest_content(self):
+        # On failures or timeouts, the .coverage file won't be written.
+        if not os.path.exists(workdirs.coverage_data_file):
+          self.context.log.warn('No .coverage file was found! Skipping coverage reporting.')
+        else:
+          self._emit_coverage_reports(pex, report_specs, coverage_rc)
+
+  def _coverage_report_specs(self, workdirs):
+    coverage_workdir = workdirs.coverage_path
+    outputs = {
+      'report': None,
+      'html': coverage_workdir,
+      'xml': os.path.join(coverage_workdir, 'coverage.xml'),
+    }
+    report_specs = []
+    for fmt in self.get_options().coverage_reports:
+      if fmt not in outputs:
+        raise TaskError('Unknown --coverage-reports format {}, expected one of: {}'
+                        .format(fmt, ', '.join(sorted(outputs))))
+      report_specs.append(fmt if outputs[fmt] is None else '{}={}'.format(fmt, outputs[fmt]))
+    return report_specs
+
+  def _emit_coverage_reports(self, pex, report_specs, coverage_rc):
+    if report_specs:
+      env = {
+        'PEX_MODULE': PytestPrep.PytestBinary.coverage_report_module(),
+      }
+      self._pex_run(pex, workunit_name='coverage-report', args=[coverage_rc] + report_specs, env=env)
+
+  @memoized_property
+  def _test_timings_snapshot(self):
+    timings_file = self.get_options().test_timings_file
+    if timings_file is None:
+      return None
+    timings_file = os.path.join(get_buildroot(), timings_file)
+    if not os.path.isfile(timings_file):
+      raise TaskError('The --test-timings-file does not exist: {}'.format(timings_file))
+    return PytestTimings(timings_file)
+
+  @memoized_property
+  def _recorded_test_timings(self):
+    return PytestTimings(os.path.join(self.workdir, 'recorded-test-timings.json'))
+
+  def _shards_by_duration(self):
+    if self.get_options().test_shard_strategy != 'duration':
+      return False
+    shard_spec = self.get_options().test_shard
+    try:
+      return shard_spec is not None and Sharder(shard_spec).nshards > 1
+    except Sharder.InvalidShardSpec as e:
+      raise self.InvalidShardSpecification(e)
+
+  def _record_test_timings(self, tests, sources_map, pytest_rootdir):
+    timings = {}
+    for _, _, test_info in tests:
+      if test_info['time'] is not None:
+        test_file = test_info['file']
+        source = sources_map.get(os.path.join(pytest_rootdir, test_file), test_file)
+        timings[timing_key(source, test_file, test_info['classname'], test_info['name'])] = test_info['time']
+    self._recorded_test_timings.record(timings)
+
+  def _get_shard_conftest_content(self, sources_map):
     shard_spec = self.get_options().test_shard
     if shard_spec is None:
       return ''
@@ -388,31 +554,27 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
       sharder = Sharder(shard_spec)
       if sharder.nshards < 2:
         return ''
+      if self.get_options().test_shard_strategy == 'duration':
+        snapshot = self._test_timings_snapshot
+        timings = snapshot.timings_for_sources(sources_map.values()) if snapshot else {}
+        return duration_shard_conftest_content(sharder.shard, sharder.nshards, timings)
       return dedent("""
 
         ### GENERATED BY PANTS ###
 
+        def _pants_in_shard(addresses):
+          return [i % {nshards} == {shard} for i in range(len(addresses))]
+
         def pytest_report_header(config):
           return 'shard: {shard} of {nshards} (0-based shard numbering)'
 
         def pytest_collection_modifyitems(session, config, items):
-          total_count = len(items)
-          removed = 0
-          def is_conftest(itm):
-            return itm.fspath and itm.fspath.basename == 'conftest.py'
-          for i, item in enumerate(list(x for x in items if not is_conftest(x))):
-            if i % {nshards} != {shard}:
-              del items[i - removed]
-              removed += 1
-          reporter = config.pluginmanager.getplugin('terminalreporter')
-          reporter.write_line('Only executing {{}} of {{}} total tests in shard {shard} of '
-                              '{nshards}'.format(total_count - removed, total_count),
-                              bold=True, invert=True, yellow=True)
+          _pants_select_shard(config, items, {shard}, {nshards})
         """.format(shard=sharder.shard, nshards=sharder.nshards))
     except Sharder.InvalidShardSpec as e:
       raise self.InvalidShardSpecification(e)
 
-  def _get_conftest_content(self, sources_map, rootdir_comm_path):
+  def _get_conftest_content(self, sources_map, rootdir_comm_path, cached_files=None, collection_results_path=None):
     # A conftest hook to modify the console output, replacing the chroot-based
     # source paths with the source-tree based ones, which are more readable to the end user.
     # Note that python stringifies a dict to its source representation, so we can use sources_map
@@ -471,14 +633,16 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
           fp.write(rootdir)
 
         config.pluginmanager.register(NodeRenamerPlugin(rootdir), 'pants_test_renamer')
+        config.pluginmanager.register(CollectionCachePlugin(config), 'pants_collection_cache')
 
     """.format(sources_map=dict(sources_map), rootdir_comm_path=rootdir_comm_path))
+    collection_content = collection_conftest_content(cached_files, collection_results_path)
     # Add in the sharding conftest, if any.
-    shard_conftest_content = self._get_shard_conftest_content()
-    return (console_output_conftest_content + shard_conftest_content).encode('utf8')
+    shard_conftest_content = self._get_shard_conftest_content(sources_map)
+    return (console_output_conftest_content + collection_content + shard_conftest_content).encode('utf8')
 
   @contextmanager
-  def _conftest(self, sources_map):
+  def _conftest(self, sources_map, cached_files=None):
     """Creates a conftest.py to customize our pytest run."""
     # Note that it's important to put the tmpdir under the workdir, because pytest
     # uses all arguments that look like paths to compute its rootdir, and we want
@@ -490,50 +654,156 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
         with open(rootdir_comm_path, 'r') as fp:
           return fp.read()
 
+      collection_results_path = None
+      if self.get_options().collection_cache:
+        collection_results_path = os.path.join(conftest_dir, 'collection.json')
+
       conftest_content = self._get_conftest_content(sources_map,
-                                                    rootdir_comm_path=rootdir_comm_path)
+                                                    rootdir_comm_path=rootdir_comm_path,
+                                                    cached_files=cached_files,
+                                                    collection_results_path=collection_results_path)
 
       conftest = os.path.join(conftest_dir, 'conftest.py')
       with open(conftest, 'w') as fp:
         fp.write(conftest_content)
       yield conftest, get_pytest_rootdir
 
+      if collection_results_path:
+        self._record_collection(sources_map, collection_results_path)
+
+  @memoized_property
+  def _collection_cache(self):
+    return PytestCollectionCache(os.path.join(self.workdir, 'collection-cache.json'))
+
+  @memoized_property
+  def _collection_environment_digest(self):
+    pytest_binary = self.context.products.get_data(PytestPrep.PytestBinary)
+    hasher = sha1()
+    hasher.update(pytest_binary.pex.path().encode('utf-8'))
+    hasher.update(content_hash(pytest_binary.config_path).encode('utf-8'))
+    return hasher.hexdigest()
+
+  @memoized_method
+  def _conftests_digest(self, chroot_dir):
+    # The digest of the user conftests in the given source chroot dir and above, which all apply to its test files.
+    hasher = sha1()
+    if chroot_dir != self._source_chroot_path and chroot_dir.startswith(self._source_chroot_path):
+      hasher.update(self._conftests_digest(os.path.dirname(chroot_dir)).encode('utf-8'))
+    conftest = os.path.join(chroot_dir, 'conftest.py')
+    if os.path.isfile(conftest):
+      hasher.update(content_hash(conftest).encode('utf-8'))
+    return hasher.hexdigest()
+
+  @memoized_method
+  def _collection_cache_key(self, chroot_path, source):
+    environment_digest = '{}:{}'.format(self._collection_environment_digest,
+                                        self._conftests_digest(os.path.dirname(chroot_path)))
+    return collection_cache_key(source, content_hash(chroot_path), environment_digest)
+
+  def _record_collection(self, sources_map, collection_results_path):
+    results = read_collection_results(collection_results_path)
+    self._collection_cache.record({
+      self._collection_cache_key(path, sources_map[path]): entries
+      for path, entries in results.items() if path in sources_map
+    })
+
+  def _collection_can_deselect(self):
+    shard_spec = self.get_options().test_shard
+    if shard_spec is not None:
+      try:
+        if Sharder(shard_spec).nshards > 1:
+          return True
+      except Sharder.InvalidShardSpec as e:
+        raise self.InvalidShardSpecification(e)
+    args = list(self.get_passthru_args())
+    for opt in self.get_options().options or ():
+      args.extend(safe_shlex_split(opt))
+    return any(arg.startswith('-k') for arg in args)
+
+  def _cached_collection(self, sources_map):
+    """Return the collection cache entry of every test file, or None to collect them all.
+
+    When the collection can deselect test files, the test files missing from the cache are collected first, on their
+    own, so that the run then only imports the test files with a selected test.
+    """
+    if not self.get_options().collection_cache or not self._collection_can_deselect():
+      return None
+
+    def missing_files():
+      return OrderedDict((path, source) for path, source in sources_map.items()
+                         if self._collection_cache.get(self._collection_cache_key(path, source)) is None)
+
+    missing = missing_files()
+    if missing:
+      self._collect_only(missing)
+      missing = missing_files()
+      if missing:
+        # Most likely collection errors, which the run will report.
+        return None
+    return [
+      [path, self._collection_cache.get(self._collection_cache_key(path, source))]
+      for path, source in sources_map.items()
+    ]
+
+  def _collect_only(self, sources_map):
+    pytest_binary = self.context.products.get_data(PytestPrep.PytestBinary)
+    with self._conftest(sources_map) as (conftest, _):
+      args = ['-c', pytest_binary.config_path,
+              '--confcutdir', get_buildroot(),
+              '--continue-on-collection-errors',
+              '--collect-only', '-q']
+      for opt in self.get_options().options or ():
+        args.extend(safe_shlex_split(opt))
+      args.extend(self.get_passthru_args())
+      args.append(conftest)
+      args.extend(sources_map.keys())
+      env = {}
+      extra_pythonpath = self.get_options().extra_pythonpath
+      if extra_pythonpath:
+        env['PYTHONPATH'] = os.pathsep.join(extra_pythonpath)
+      self._pex_run(pytest_binary.pex, workunit_name='collect', args=args, env=env)
+
   @contextmanager
   def _test_runner(self, workdirs, test_targets, sources_map):
     pytest_binary = self.context.products.get_data(PytestPrep.PytestBinary)
-    with self._conftest(sources_map) as (conftest, get_pytest_rootdir):
+    cached_files = self._cached_collection(sources_map)
+    with self._conftest(sources_map, cached_files=cached_files) as (conftest, get_pytest_rootdir):
       with self._maybe_emit_coverage_data(workdirs,
                                           test_targets,
                                           pytest_binary.pex) as coverage_args:
         yield pytest_binary, [conftest] + coverage_args, get_pytest_rootdir
 
+  def _pytest_env(self):
+    env = dict(os.environ)
+
+    # Ensure we don't leak source files or undeclared 3rdparty requirements into the py.test PEX
+    # environment.
+    pythonpath = env.pop('PYTHONPATH', None)
+    if pythonpath:
+      self.context.log.warn('scrubbed PYTHONPATH={} from py.test environment'.format(pythonpath))
+    # But allow this back door for users who do want to force something onto the test pythonpath,
+    # e.g., modules required during a debugging session.
+    extra_pythonpath = self.get_options().extra_pythonpath
+    if extra_pythonpath:
+      env['PYTHONPATH'] = os.pathsep.join(extra_pythonpath)
+
+    # The pytest runner we use accepts a --pdb argument that will launch an interactive pdb
+    # session on any test failure.  In order to support use of this pass-through flag we must
+    # turn off stdin buffering that otherwise occurs.  Setting the PYTHONUNBUFFERED env var to
+    # any value achieves this in python2.7.  We'll need a different solution when we support
+    # running pants under CPython 3 which does not unbuffer stdin using this trick.
+    env['PYTHONUNBUFFERED'] = '1'
+
+    # pytest uses py.io.terminalwriter for output. That class detects the terminal
+    # width and attempts to use all of it. However we capture and indent the console
+    # output, leading to weird-looking line wraps. So we trick the detection code
+    # into thinking the terminal window is narrower than it is.
+    env['COLUMNS'] = str(int(os.environ.get('COLUMNS', 80)) - 30)
+    return env
+
   def _do_run_tests_with_args(self, pex, args):
     try:
-      env = dict(os.environ)
-
-      # Ensure we don't leak source files or undeclared 3rdparty requirements into the py.test PEX
-      # environment.
-      pythonpath = env.pop('PYTHONPATH', None)
-      if pythonpath:
-        self.context.log.warn('scrubbed PYTHONPATH={} from py.test environment'.format(pythonpath))
-      # But allow this back door for users who do want to force something onto the test pythonpath,
-      # e.g., modules required during a debugging session.
-      extra_pythonpath = self.get_options().extra_pythonpath
-      if extra_pythonpath:
-        env['PYTHONPATH'] = os.pathsep.join(extra_pythonpath)
-
-      # The pytest runner we use accepts a --pdb argument that will launch an interactive pdb
-      # session on any test failure.  In order to support use of this pass-through flag we must
-      # turn off stdin buffering that otherwise occurs.  Setting the PYTHONUNBUFFERED env var to
-      # any value achieves this in python2.7.  We'll need a different solution when we support
-      # running pants under CPython 3 which does not unbuffer stdin using this trick.
-      env['PYTHONUNBUFFERED'] = '1'
-
-      # pytest uses py.io.terminalwriter for output. That class detects the terminal
-      # width and attempts to use all of it. However we capture and indent the console
-      # output, leading to weird-looking line wraps. So we trick the detection code
-      # into thinking the terminal window is narrower than it is.
-      env['COLUMNS'] = str(int(os.environ.get('COLUMNS', 80)) - 30)
+      env = self._pytest_env()
 
       profile = self.get_options().profile
       if profile:
@@ -542,7 +812,8 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
       with self.context.new_workunit(name='run',
                                      cmd=pex.cmdline(args),
                                      labels=[WorkUnitLabel.TOOL, WorkUnitLabel.TEST]) as workunit:
-        rc = self._spawn_and_wait(pex, workunit=workunit, args=args, setsid=True, env=env)
+        rc = self._spawn_and_wait(pex, workunit=workunit, args=args, setsid=True, env=env,
+                                  use_worker=self._use_worker_pool(args))
         return PytestResult.rc(rc)
     except ErrorWhileTesting:
       # _spawn_and_wait wraps the test runner in a timeout, so it could
@@ -572,38 +843,33 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
 
     return relsrc_to_target
 
-  def _get_failed_targets_from_junitxml(self, junitxml, targets, pytest_rootdir):
+  def _process_junitxml(self, junitxml, targets, pytest_rootdir):
+    """Returns the failed targets and the (target, test name, test info) of every test in the junit xml.
+
+    The xml is read in one streaming pass, and each test's file is mapped to its target through a single map.
+    """
     relsrc_to_target = self._map_relsrc_to_targets(targets)
     buildroot_relpath = os.path.relpath(pytest_rootdir, get_buildroot())
+    file_to_target = {}
 
-    # Now find the sources that contained failing tests.
-    failed_targets = set()
+    def target_for_file(pytest_relpath):
+      # The file attribute is always relative to the py.test rootdir.
+      if pytest_relpath not in file_to_target:
+        relsrc = os.path.join(buildroot_relpath, pytest_relpath)
+        file_to_target[pytest_relpath] = relsrc_to_target.get(relsrc)
+      return file_to_target[pytest_relpath]
 
     try:
-      xml = XmlParser.from_file(junitxml)
-      failures = int(xml.get_attribute('testsuite', 'failures'))
-      errors = int(xml.get_attribute('testsuite', 'errors'))
-      if failures or errors:
-        for testcase in xml.parsed.getElementsByTagName('testcase'):
-          test_failed = testcase.getElementsByTagName('failure')
-          test_errored = testcase.getElementsByTagName('error')
-          if test_failed or test_errored:
-            # The file attribute is always relative to the py.test rootdir.
-            pytest_relpath = testcase.getAttribute('file')
-            relsrc = os.path.join(buildroot_relpath, pytest_relpath)
-            failed_target = relsrc_to_target.get(relsrc)
-            failed_targets.add(failed_target)
-    except (XmlParser.XmlError, ValueError) as e:
+      report = parse_junit_xml(junitxml, ['file', 'name', 'classname'])
+    except JunitXmlError as e:
       raise TaskError('Error parsing xml file at {}: {}'.format(junitxml, e))
 
-    return failed_targets
-
-  def _get_target_from_test(self, test_info, targets, pytest_rootdir):
-    relsrc_to_target = self._map_relsrc_to_targets(targets)
-    buildroot_relpath = os.path.relpath(pytest_rootdir, get_buildroot())
-    pytest_relpath = test_info['file']
-    relsrc = os.path.join(buildroot_relpath, pytest_relpath)
-    return relsrc_to_target.get(relsrc)
+    failed_targets = {target_for_file(pytest_relpath) for pytest_relpath in report.failed_files}
+    tests = [
+      (target_for_file(test_info['file']), test_name, test_info)
+      for test_name, test_info in report.tests_info.items()
+    ]
+    return failed_targets, tests
 
   @contextmanager
   def partitions(self, per_target, all_targets, test_targets):
@@ -618,12 +884,73 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
     workdir = self.workdir
 
     def iter_partitions_with_args():
-      for partition in iter_partitions():
-        workdirs = _Workdirs.for_partition(workdir, partition)
-        args = (workdirs,)
+      partitions_with_args = [
+        (partition, (_Workdirs.for_partition(workdir, partition),)) for partition in iter_partitions()
+      ]
+      parallelism = min(self.get_options().parallelism, len(partitions_with_args))
+      if parallelism > 1 and not self.get_options().fail_fast:
+        self._run_partitions_concurrently(partitions_with_args, parallelism)
+      for partition, args in partitions_with_args:
         yield partition, args
 
-    yield iter_partitions_with_args
+    try:
+      yield iter_partitions_with_args
+    finally:
+      self._concurrent_partition_runs = None
+
+  def _run_partitions_concurrently(self, partitions_with_args, parallelism):
+    """Runs every partition at once, up to parallelism at a time.
+
+    The outcome of each run is held until the partition's turn in `_run_partition`, so that results are reported and
+    exposed in the same order as when partitions run one after the other.
+    """
+    self._concurrent_partition_runs = {}
+    # Resolve these once, before the workers race to memoize them.
+    _ = (
+      self._source_chroot_path,
+      self.context.products.get_data(PytestPrep.PytestBinary),
+      self._test_timings_snapshot,
+      self._recorded_test_timings,
+      self._changed_test_sources,
+      self._collection_cache,
+    )
+    if self.get_options().worker_pool:
+      self._worker_pool(self.context.products.get_data(PytestPrep.PytestBinary).pex)
+
+    def run_partition(partition, args):
+      run = {'exposures': []}
+      self._concurrent_partition_runs[partition] = run
+      try:
+        run['result'] = super(PytestRun, self)._run_partition(False, partition, *args)
+      except Exception:
+        run['exc_info'] = sys.exc_info()
+
+    def run_partitions():
+      with self.context.new_workunit(name='partitions', labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+        pool = WorkerPool(workunit.parent, self.context.run_tracker, parallelism)
+        try:
+          pool.submit_work_and_wait(Work(run_partition, partitions_with_args))
+        finally:
+          pool.shutdown()
+
+    if self.get_options().coverage is None:
+      run_partitions()
+    else:
+      # Scrub the coverage environment once for all of the runs, so that one run finishing cannot restore it while
+      # another is spawning.
+      with self._scrub_cov_env_vars():
+        run_partitions()
+
+  def _run_partition(self, fail_fast, test_targets, *args):
+    runs = self._concurrent_partition_runs
+    if runs is None or test_targets not in runs:
+      return super(PytestRun, self)._run_partition(fail_fast, test_targets, *args)
+    run = runs.pop(test_targets)
+    for exposure in run['exposures']:
+      self._expose_results(*exposure)
+    if 'exc_info' in run:
+      reraise(*run['exc_info'])
+    return run['result']
 
   # TODO(John Sirois): Its probably worth generalizing a means to mark certain options or target
   # attributes as making results un-cacheable. See: https://github.com/pantsbuild/pants/issues/4748
@@ -631,11 +958,36 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
     def compute_fingerprint(self, target):
       return uuid.uuid4()
 
+  class TimingsFingerprintStrategy(DefaultFingerprintStrategy):
+    """Fingerprints targets along with the timings snapshot that their tests are sharded by."""
+
+    def __init__(self, timings_digest):
+      self._timings_digest = timings_digest
+
+    def compute_fingerprint(self, target):
+      hasher = sha1()
+      hasher.update(target.payload.fingerprint().encode('utf-8'))
+      hasher.update(self._timings_digest.encode('utf-8'))
+      return hasher.hexdigest()
+
+    def __hash__(self):
+      return hash((type(self), self._timings_digest))
+
+    def __eq__(self, other):
+      return type(self) == type(other) and self._timings_digest == other._timings_digest
+
   def fingerprint_strategy(self):
     if self.get_options().profile:
       # A profile is machine-specific and we assume anyone wanting a profile wants to run it here
       # and now and not accept some old result, even if on the same inputs.
       return self.NeverCacheFingerprintStrategy()
+    elif self.get_options().changed_since:
+      # Only some of each target's tests run, so a green run says nothing about the whole target.
+      return self.NeverCacheFingerprintStrategy()
+    elif self._shards_by_duration():
+      # Which tests are in the shard depends on the timings snapshot, so a change to it must invalidate.
+      snapshot = self._test_timings_snapshot
+      return self.TimingsFingerprintStrategy(snapshot.digest() if snapshot else '')
     else:
       return None  # Accept the default fingerprint strategy.
 
@@ -644,13 +996,97 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
       return self._run_pytest(fail_fast, tuple(test_targets), workdirs)
     finally:
       # Unconditionally pluck any results that an end user might need to interact with from the
-      # workdir to the locations they expect.
-      self._expose_results(test_targets, workdirs)
+      # workdir to the locations they expect. Concurrent runs do this in partition order, once each has finished.
+      runs = self._concurrent_partition_runs
+      if runs is not None and workdirs.partition in runs:
+        runs[workdirs.partition]['exposures'].append((test_targets, workdirs))
+      else:
+        self._expose_results(test_targets, workdirs)
 
   @memoized_property
   def result_class(self):
     return PytestResult
 
+  @memoized_property
+  def _import_cache(self):
+    # The imports of a source only depend on its content and the parser.
+    version_hash = sha1(str(self.implementation_version()).encode('utf-8')).hexdigest()
+    return PythonImportCache(self.workdir, version_hash)
+
+  def _imported_symbols(self, source, module):
+    # Relative imports are resolved against the module, so it is part of the key along with the content.
+    source_key = sha1('{}:{}'.format(content_hash(source), module).encode('utf-8')).hexdigest()
+    cached = self._import_cache.get(source_key)
+    if cached is None:
+      try:
+        with open(source, 'rb') as f:
+          symbols = source_imported_symbols(f.read(), module, os.path.basename(source) == '__init__.py')
+      except (SyntaxError, ValueError) as e:
+        # The changes cannot be traced through this source, so every test runs.
+        self.context.log.warn('Could not read the imports of {}: {}'.format(source, e))
+        return None
+      # Cached as a plain `import` of every symbol.
+      self._import_cache.put(source_key, [], [Import(aliases=[(symbol, None) for symbol in symbols])])
+      return symbols
+    _, python_imports = cached
+    return imported_symbols(python_imports)
+
+  @memoized_property
+  def _changed_test_sources(self):
+    """The buildroot relative test sources affected by the changes since --changed-since, or None to run them all."""
+    changed_since = self.get_options().changed_since
+    if not changed_since:
+      return None
+    scm = self.context.scm
+    if scm is None:
+      raise TaskError('--changed-since requires the buildroot to be in a git repository.')
+    changed_files = set(scm.changed_files(from_commit=changed_since,
+                                          include_untracked=True,
+                                          relative_to=get_buildroot()))
+
+    test_targets = self._get_test_targets()
+    source_to_module = {}
+    resource_to_sources = {}
+    test_sources = set()
+    source_roots = set()
+    target_dirs = set()
+    for target in Target.closure_for_targets(test_targets):
+      target_dirs.add(target.address.spec_path)
+      if target.has_sources():
+        source_roots.add(target.target_base)
+      python_sources = {
+        os.path.join(target.target_base, source) for source in target.sources_relative_to_source_root()
+        if module_for_source(source) is not None
+      }
+      for source in target.sources_relative_to_source_root():
+        buildroot_source = os.path.join(target.target_base, source)
+        module = module_for_source(source)
+        if module is not None:
+          source_to_module[buildroot_source] = module
+        else:
+          # A changed resource or data file has no imports to follow, so treat it as a change to every
+          # python source of its target.
+          resource_to_sources[buildroot_source] = python_sources
+        if isinstance(target, PythonTests):
+          test_sources.add(buildroot_source)
+
+    try:
+      source_to_symbols = {
+        source: self._imported_symbols(source, module) for source, module in sorted(source_to_module.items())
+      }
+    finally:
+      self._import_cache.write()
+    try:
+      changed_test_sources = affected_test_sources(changed_files, source_to_module, resource_to_sources,
+                                                   test_sources, source_to_symbols, source_roots, target_dirs)
+    except UntraceableChangeError as e:
+      self.context.log.info('Running every test, as the changes since {} cannot all be traced: {}'
+                            .format(changed_since, e))
+      return None
+    self.context.log.info('{} of {} test sources are affected by changes since {}.'
+                          .format(len(changed_test_sources), len(test_sources), changed_since))
+    return changed_test_sources
+
   def collect_files(self, workdirs):
     return workdirs.files()
 
@@ -681,9 +1117,12 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
 
     # Absolute path to chrooted test file -> Path to original test file relative to the buildroot.
     sources_map = OrderedDict()
+    changed_test_sources = self._changed_test_sources
     for t in test_targets:
       for p in t.sources_relative_to_source_root():
-        sources_map[os.path.join(self._source_chroot_path, p)] = os.path.join(t.target_base, p)
+        source = os.path.join(t.target_base, p)
+        if changed_test_sources is None or source in changed_test_sources:
+          sources_map[os.path.join(self._source_chroot_path, p)] = source
 
     if not sources_map:
       return PytestResult.rc(0)
@@ -726,8 +1165,7 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
       if os.path.exists(junitxml_path):
         os.unlink(junitxml_path)
 
-      with self._maybe_run_in_chroot():
-        result = self._do_run_tests_with_args(pytest_binary.pex, args)
+      result = self._do_run_tests_with_args(pytest_binary.pex, args)
 
       # There was a problem prior to test execution preventing junit xml file creation so just let
       # the failure result bubble.
@@ -735,19 +1173,10 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
         return result
 
       pytest_rootdir = get_pytest_rootdir()
-      failed_targets = self._get_failed_targets_from_junitxml(junitxml_path,
-                                                              test_targets,
-                                                              pytest_rootdir)
-
-      def parse_error_handler(parse_error):
-        # Simple error handler to pass to xml parsing function.
-        raise TaskError('Error parsing xml file at {}: {}'
-                        .format(parse_error.xml_path, parse_error.cause))
-
-      all_tests_info = self.parse_test_info(junitxml_path, parse_error_handler,
-                                            ['file', 'name', 'classname'])
-      for test_name, test_info in all_tests_info.items():
-        test_target = self._get_target_from_test(test_info, test_targets, pytest_rootdir)
+      failed_targets, tests = self._process_junitxml(junitxml_path, test_targets, pytest_rootdir)
+      if self.get_options().test_shard_strategy == 'duration':
+        self._record_test_timings(tests, sources_map, pytest_rootdir)
+      for test_target, test_name, test_info in tests:
         self.report_all_info_for_single_test(self.options_scope, test_target, test_name, test_info)
 
       return result.with_failed_targets(failed_targets)
@@ -771,13 +1200,62 @@ class PytestRun(PartitionedTestRunnerTaskMixin, Task):
     else:
       yield
 
-  def _spawn(self, pex, workunit, args, setsid=False, env=None):
+  def _use_worker_pool(self, args):
+    # Profiles are of the interpreter process, and the workers run the tests without a terminal.
+    interactive_args = ('--pdb', '--trace')
+    return (self.get_options().worker_pool and not self.get_options().profile
+            and not any(arg in interactive_args for arg in args))
+
+  @memoized_method
+  def _worker_pool(self, pex):
+    # The key covers everything that the workers import from before running a batch. The test sources are
+    # only imported by the forked batches, but the chroot is on the sys.path of the workers.
+    hasher = sha1()
+    for part in (pex.path(), content_hash(os.path.join(pex.path(), 'PEX-INFO')), self._source_chroot_path,
+                 os.pathsep.join(self.get_options().extra_pythonpath or ())):
+      hasher.update(part.encode('utf-8'))
+      hasher.update(b'\0')
+    # Unix socket paths are short, so the workers live under the temp dir, by workdir. The pool checks that every
+    # directory below the temp dir is private to this user before it binds or connects.
+    private_root = os.path.join(tempfile.gettempdir(), 'pants-pytest-workers-{}'.format(os.getuid()))
+    pool_dir = os.path.join(private_root, sha1(self.workdir.encode('utf-8')).hexdigest()[:12])
+
+    def start_worker(socket_path, log_path):
+      env = self._pytest_env()
+      env['PEX_MODULE'] = PytestPrep.PytestBinary.pytest_worker_module()
+      args = [socket_path, str(self.get_options().worker_idle_timeout)]
+      # The worker is in its own session, so that it outlives this run.
+      with open(log_path, 'a') as log, open(os.devnull, 'r') as devnull:
+        with self._spawn_lock, self._maybe_run_in_chroot():
+          return pex.run(args, with_chroot=False, blocking=False, setsid=True, env=env,
+                         stdin=devnull, stdout=log, stderr=log)
+
+    try:
+      pool = PytestWorkerPool(pool_dir, hasher.hexdigest()[:16], max(1, self.get_options().parallelism),
+                              start_worker, private_root=private_root)
+      pool.recycle_stale_workers()
+    except PytestWorkerError as e:
+      raise TaskError('Failed to set up the py.test workers: {}'.format(e))
+    return pool
+
+  def _spawn(self, pex, workunit, args, setsid=False, env=None, use_worker=False):
     env = env or {}
-    process = pex.run(args,
-                      with_chroot=False,  # We handle chrooting ourselves.
-                      blocking=False,
-                      setsid=setsid,
-                      env=env,
-                      stdout=workunit.output('stdout'),
-                      stderr=workunit.output('stderr'))
+    if use_worker:
+      cwd = self._source_chroot_path if self.run_tests_in_chroot else get_buildroot()
+      try:
+        batch = self._worker_pool(pex).submit(args, cwd=cwd, env=env,
+                                              stdout=workunit.output('stdout'),
+                                              stderr=workunit.output('stderr'))
+      except PytestWorkerError as e:
+        raise TaskError('Failed to run the tests in a py.test worker: {}'.format(e))
+      return _PytestWorkerProcessHandler(batch, pex.cmdline(args))
+    # The process inherits the cwd, so it is only changed for the spawn, and one spawn at a time.
+    with self._spawn_lock, self._maybe_run_in_chroot():
+      process = pex.run(args,
+                        with_chroot=False,  # We handle chrooting ourselves.
+                        blocking=False,
+                        setsid=setsid,
+                        env=env,
+                        stdout=workunit.output('stdout'),
+                        stderr=workunit.output('stderr'))
     return SubprocessProcessHandler(process)
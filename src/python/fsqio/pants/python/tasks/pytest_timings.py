@@ -0,0 +1,170 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from hashlib import sha1
+import json
+import logging
+import os
+import re
+from textwrap import dedent
+import threading
+
+from typing import Any, Dict, Iterable, Optional, Text
+
+
+logger = logging.getLogger(__name__)
+
+
+def timing_key(source, test_file, classname, name):
+  # type: (Text, Text, Text, Text) -> Text
+  """The key of a junit xml testcase in the timing database.
+
+  The key is `<buildroot relative source>::<dotted path of the test within the file>`, which the generated conftest
+  computes the same way from a collected item's nodeid. Unlike the nodeid it does not depend on the source chroot.
+  """
+  # py.test's junit xml classname is the file path, with / as . and without .py, followed by any enclosing classes.
+  file_prefix = re.sub(r'\.py$', '', test_file).replace('/', '.')
+  test_path = classname[len(file_prefix) + 1:] if classname.startswith(file_prefix + '.') else ''
+  return '{}::{}'.format(source, '.'.join(part for part in (test_path, name) if part))
+
+
+class PytestTimings(object):
+  """The last recorded duration, in seconds, of every test, persisted as json.
+
+  The database is read once, so a database that is only read is a frozen snapshot, whatever is recorded to its file
+  since. Safe to record into from concurrent partitions. Records are buffered until `write`.
+  """
+
+  def __init__(self, path):
+    # type: (str) -> None
+    self.path = path
+    self._lock = threading.Lock()
+    self._loaded = None  # type: Optional[Dict[Text, float]]
+    self._digest = None  # type: Optional[Text]
+    self._dirty = False
+
+  def _load(self):
+    content = b''
+    if os.path.isfile(self.path):
+      with open(self.path, 'rb') as f:
+        content = f.read()
+    self._digest = sha1(content).hexdigest()
+    self._loaded = {}
+    if content:
+      # A corrupt database only costs the balance of the next sharded run.
+      try:
+        self._loaded = json.loads(content.decode('utf-8'))
+      except Exception:
+        logger.debug("Could not read the test timings, starting over: {}.".format(self.path))
+
+  @property
+  def _timings(self):
+    # type: () -> Dict[Text, float]
+    if self._loaded is None:
+      self._load()
+    return self._loaded
+
+  def digest(self):
+    # type: () -> Text
+    """Return the digest of the snapshot that the timings are read from."""
+    with self._lock:
+      if self._loaded is None:
+        self._load()
+      return self._digest
+
+  def timings_for_sources(self, sources):
+    # type: (Iterable[Text]) -> Dict[Text, float]
+    """Return a snapshot of the timings of the tests in the given buildroot relative sources."""
+    sources = set(sources)
+    with self._lock:
+      return {key: seconds for key, seconds in self._timings.items() if key.split('::', 1)[0] in sources}
+
+  def record(self, timings):
+    # type: (Dict[Text, float]) -> None
+    """Record the given timings over any earlier ones."""
+    if not timings:
+      return
+    with self._lock:
+      self._timings.update(timings)
+      self._dirty = True
+
+  def write(self, buildroot):
+    # type: (Text) -> None
+    """Persist the recorded timings, dropping those of the sources that no longer exist under the buildroot."""
+    with self._lock:
+      if not self._dirty:
+        return
+      existing = {}  # type: Dict[Text, bool]
+      for key in list(self._loaded):
+        source = key.split('::', 1)[0]
+        if source not in existing:
+          existing[source] = os.path.isfile(os.path.join(buildroot, source))
+        if not existing[source]:
+          del self._loaded[key]
+      tmp_path = '{}.tmp'.format(self.path)
+      with open(tmp_path, 'w') as f:
+        json.dump(self._loaded, f, sort_keys=True)
+      os.rename(tmp_path, self.path)
+      self._dirty = False
+
+
+def duration_shard_conftest_content(shard, nshards, timings):
+  # type: (int, int, Dict[Text, float]) -> Text
+  """Conftest content that keeps only the tests of one shard, with shards balanced by the given timings.
+
+  The tests with a timing are assigned longest first, each to the shard with the least total time so far (LPT
+  scheduling). Tests without a timing are then dealt round-robin in collection order. The layout only depends on the
+  collected tests and the timings snapshot, so every shard computes the same one.
+
+  The content must follow the collection conftest content, whose test address helpers it uses.
+  """
+  return dedent("""
+
+    ### GENERATED BY PANTS ###
+
+    import heapq
+
+
+    # Map from timing key -> seconds, the snapshot this run's shards are balanced by.
+    _PANTS_TEST_TIMINGS = {timings!r}
+
+
+    def _pants_timing_key(address):
+      # The same key as fsqio.pants.python.tasks.pytest_timings.timing_key computes from the junit xml.
+      source, suffix = address
+      path, bracket, params = suffix.partition('[')
+      parts = [part for part in path.split('::') if part and part != '()']
+      if parts:
+        parts[-1] += bracket + params
+      return '{{}}::{{}}'.format(source, '.'.join(parts))
+
+
+    def _pants_assign_shards(keys, timings, nshards):
+      shards = [None] * len(keys)
+      timed = sorted((i for i, key in enumerate(keys) if key in timings),
+                     key=lambda i: (-timings[keys[i]], keys[i], i))
+      loads = [(0.0, shard) for shard in range(nshards)]
+      for i in timed:
+        load, shard = heapq.heappop(loads)
+        shards[i] = shard
+        heapq.heappush(loads, (load + timings[keys[i]], shard))
+      untimed = [i for i, key in enumerate(keys) if key not in timings]
+      for n, i in enumerate(untimed):
+        shards[i] = n % nshards
+      return shards
+
+
+    def _pants_in_shard(addresses):
+      keys = [_pants_timing_key(address) for address in addresses]
+      return [shard == {shard} for shard in _pants_assign_shards(keys, _PANTS_TEST_TIMINGS, {nshards})]
+
+
+    def pytest_report_header(config):
+      return 'shard: {shard} of {nshards} (0-based shard numbering, balanced by duration)'
+
+
+    def pytest_collection_modifyitems(session, config, items):
+      _pants_select_shard(config, items, {shard}, {nshards})
+    """.format(shard=shard, nshards=nshards, timings=timings))
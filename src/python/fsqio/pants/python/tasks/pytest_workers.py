@@ -0,0 +1,288 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import errno
+import fcntl
+import json
+import os
+import select
+import shutil
+import signal
+import socket
+import stat
+import time
+
+from typing import Any, Callable, Dict, List, Optional, Text
+
+
+class PytestWorkerError(Exception):
+  """Indicates that a py.test worker could not be started or reached."""
+
+
+def ensure_private_dir(path):
+  # type: (str) -> None
+  """Create the directory if need be, and check that it is the current user's alone.
+
+  The workers' sockets take the full test environment and report pass or fail, so no other user may be able to
+  replace them, or any directory above them up to one that is sticky, like the temp dir.
+
+  :raises: :class:`PytestWorkerError` if the directory is not a directory, is owned by another user or can be
+           accessed by anyone else (mode other than 0700).
+  """
+  try:
+    os.mkdir(path, 0o700)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      raise
+  st = os.lstat(path)
+  if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+    raise PytestWorkerError('Refusing to run py.test workers in {}: it must be a directory owned by the current '
+                            'user, with mode 0700.'.format(path))
+
+
+class PytestWorkerBatch(object):
+  """A batch of tests running in a py.test worker, which stands in for the process the batch would otherwise run in.
+
+  The batch holds its worker until it is done. While it waits, the output of the tests is copied to the given sinks.
+  """
+
+  _TICK_SECONDS = 0.1
+
+  def __init__(self, conn, lock_file, output_tails):
+    self._conn = conn
+    self._lock_file = lock_file
+    self._output_tails = output_tails
+    self._buffer = b''
+    self._returncode = None  # type: Optional[int]
+    self._done = False
+    self.pid = self._read_message(timeout=None)['pid']
+
+  def _read_message(self, timeout):
+    # type: (Optional[float]) -> Optional[Dict[Text, Any]]
+    deadline = None if timeout is None else time.time() + timeout
+    while b'\n' not in self._buffer:
+      remaining = None if deadline is None else max(0, deadline - time.time())
+      readable, _, _ = select.select([self._conn], [], [], remaining)
+      if not readable:
+        return None
+      chunk = self._conn.recv(65536)
+      if not chunk:
+        raise PytestWorkerError('The py.test worker hung up.')
+      self._buffer += chunk
+    line, self._buffer = self._buffer.split(b'\n', 1)
+    return json.loads(line.decode('utf-8'))
+
+  def _copy_output(self):
+    for tail, sink in self._output_tails:
+      data = tail.read()
+      if data:
+        sink.write(data)
+        sink.flush()
+
+  def _finish(self):
+    if not self._done:
+      self._done = True
+      self._copy_output()
+      for tail, _ in self._output_tails:
+        tail.close()
+      self._conn.close()
+      fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+      self._lock_file.close()
+
+  def wait(self, timeout=None):
+    # type: (Optional[float]) -> Optional[int]
+    """Wait for the batch to finish, and return its exit code, or None if it is still running after the timeout."""
+    deadline = None if timeout is None else time.time() + timeout
+    while self._returncode is None and not self._done:
+      tick = self._TICK_SECONDS if deadline is None else min(self._TICK_SECONDS, max(0, deadline - time.time()))
+      message = self._read_message(timeout=tick)
+      if message is not None:
+        self._returncode = message['rc']
+        self._finish()
+      else:
+        self._copy_output()
+        if deadline is not None and time.time() >= deadline:
+          return None
+    return self._returncode
+
+  def poll(self):
+    # type: () -> Optional[int]
+    return self.wait(timeout=0)
+
+  def _signal(self, signum):
+    if not self._done:
+      try:
+        os.kill(self.pid, signum)
+      except OSError as e:
+        if e.errno != errno.ESRCH:
+          raise
+      # The worker reaps the batch and carries on serving, the batch just lets go of it.
+      self._finish()
+
+  def terminate(self):
+    self._signal(signal.SIGTERM)
+
+  def kill(self):
+    self._signal(signal.SIGKILL)
+
+
+class PytestWorkerPool(object):
+  """Long-lived py.test workers for one py.test binary and source chroot, shared by concurrent and later runs.
+
+  Workers live in `<pool dir>/<key>/`, one slot per worker: `<slot>.sock` is the socket the worker serves,
+  `<slot>.lock` is held by whoever has a batch running in the worker, and `<slot>.log` is the worker's own output.
+  The key must change whenever the py.test binary or the source chroot do, and the workers of every other key are
+  stopped as they fall idle.
+  """
+
+  def __init__(self, pool_dir, key, size, start_worker, start_timeout=60.0, private_root=None):
+    # type: (str, Text, int, Callable[[str, str], Any], float, Optional[str]) -> None
+    """
+    :param pool_dir: The directory to keep the workers of every key in. Socket paths are short, so it should be too.
+                     It and every directory between it and the private root are created if need be, and must be the
+                     current user's alone, see `ensure_private_dir`.
+    :param key: Identifies the py.test binary and source chroot that the workers run.
+    :param size: The most workers to keep for the key.
+    :param start_worker: Starts a worker serving the given socket path, with its output going to the given log path,
+                         and returns its process.
+    :param start_timeout: Seconds to wait for a new worker to serve its socket.
+    :param private_root: The topmost directory that must be private, by default the pool dir. Its parent should
+                         only be writable by the current user, or be sticky.
+    """
+    self._pool_dir = pool_dir
+    self._key = key
+    self._key_dir = os.path.join(pool_dir, key)
+    self._size = size
+    self._start_worker = start_worker
+    self._start_timeout = start_timeout
+    private_root = private_root or pool_dir
+    relpath = os.path.relpath(pool_dir, private_root)
+    if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+      raise ValueError('The pool dir {} is not under the private root {}.'.format(pool_dir, private_root))
+    self._private_dirs = [private_root]
+    for part in relpath.split(os.sep) if relpath != os.curdir else ():
+      self._private_dirs.append(os.path.join(self._private_dirs[-1], part))
+    self._private_dirs.append(self._key_dir)
+    self._check_private_dirs()
+
+  def _check_private_dirs(self):
+    # Checked again before every connect or start, in case a directory was swapped out since.
+    for path in self._private_dirs:
+      ensure_private_dir(path)
+
+  def _path(self, slot, ext, key_dir=None):
+    return os.path.join(key_dir or self._key_dir, '{}.{}'.format(slot, ext))
+
+  @staticmethod
+  def _try_lock(lock_path):
+    lock_file = open(lock_path, 'a')
+    try:
+      fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as e:
+      lock_file.close()
+      if e.errno in (errno.EAGAIN, errno.EACCES):
+        return None
+      raise
+    return lock_file
+
+  @staticmethod
+  def _try_connect(socket_path):
+    if not os.path.exists(socket_path):
+      return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      conn.connect(socket_path)
+    except socket.error:
+      conn.close()
+      return None
+    return conn
+
+  @staticmethod
+  def _send(conn, message):
+    conn.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+  def recycle_stale_workers(self):
+    """Stop the idle workers of every other key, and remove the keys that are left without workers."""
+    for key in os.listdir(self._pool_dir):
+      key_dir = os.path.join(self._pool_dir, key)
+      if key == self._key or not os.path.isdir(key_dir):
+        continue
+      ensure_private_dir(key_dir)
+      busy = False
+      for lock_name in (name for name in os.listdir(key_dir) if name.endswith('.lock')):
+        slot = lock_name[:-len('.lock')]
+        lock_file = self._try_lock(os.path.join(key_dir, lock_name))
+        if lock_file is None:
+          busy = True
+          continue
+        try:
+          conn = self._try_connect(self._path(slot, 'sock', key_dir))
+          if conn is not None:
+            try:
+              self._send(conn, {'exit': True})
+            finally:
+              conn.close()
+        finally:
+          lock_file.close()
+      if not busy:
+        shutil.rmtree(key_dir, ignore_errors=True)
+
+  def _acquire_slot(self):
+    while True:
+      for slot in range(self._size):
+        lock_file = self._try_lock(self._path(slot, 'lock'))
+        if lock_file is not None:
+          return slot, lock_file
+      time.sleep(PytestWorkerBatch._TICK_SECONDS)
+
+  def _start(self, slot):
+    self._check_private_dirs()
+    socket_path = self._path(slot, 'sock')
+    log_path = self._path(slot, 'log')
+    process = self._start_worker(socket_path, log_path)
+    deadline = time.time() + self._start_timeout
+    while True:
+      conn = self._try_connect(socket_path)
+      if conn is not None:
+        return conn
+      if process.poll() is not None:
+        raise PytestWorkerError('The py.test worker exited on start with {}, see {}.'.format(process.poll(), log_path))
+      if time.time() > deadline:
+        process.kill()
+        raise PytestWorkerError('The py.test worker did not start within {} seconds, see {}.'
+                                .format(self._start_timeout, log_path))
+      time.sleep(0.05)
+
+  def submit(self, args, cwd, env, stdout, stderr):
+    # type: (List[Text], Text, Dict[Text, Text], Any, Any) -> PytestWorkerBatch
+    """Run py.test with the given args, cwd and environment in a worker, starting the worker if need be.
+
+    :param stdout: The sink to copy the output of the tests to.
+    :param stderr: The sink to copy the errors of the tests to.
+    """
+    self._check_private_dirs()
+    slot, lock_file = self._acquire_slot()
+    try:
+      outputs = [self._path(slot, 'stdout'), self._path(slot, 'stderr')]
+      request = {'args': args, 'cwd': cwd, 'env': env, 'stdout': outputs[0], 'stderr': outputs[1]}
+      # A running worker may hang up on the first request if it just fell idle, in which case it is started anew.
+      conn = self._try_connect(self._path(slot, 'sock'))
+      for attempt in (conn, None):
+        conn = attempt or self._start(slot)
+        for output in outputs:
+          open(output, 'w').close()
+        output_tails = [(open(outputs[0], 'rb'), stdout), (open(outputs[1], 'rb'), stderr)]
+        try:
+          self._send(conn, request)
+          return PytestWorkerBatch(conn, lock_file, output_tails)
+        except (PytestWorkerError, socket.error):
+          conn.close()
+          for tail, _ in output_tails:
+            tail.close()
+          if attempt is None:
+            raise
+    except BaseException:
+      lock_file.close()
+      raise
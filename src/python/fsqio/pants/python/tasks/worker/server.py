@@ -0,0 +1,135 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+# fixlint=skip
+
+"""A warm py.test worker, run as the entry point of the py.test binary, see PytestRun --worker-pool:
+
+  server.py <socket path> <idle timeout seconds>
+
+The worker imports py.test and its plugins once, then serves batches of tests over a unix socket, one connection
+per batch. A batch is a json request line of `{"args", "cwd", "env", "stdout", "stderr"}`, and runs `pytest.main`
+in a forked child, so that no test module or conftest outlives its batch. The worker replies with a `{"pid"}` line
+once the child is forked and a `{"rc"}` line once it exits. A `{"exit": true}` request stops the worker, and so
+does going without a batch for the idle timeout.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from contextlib import closing
+import json
+import os
+import select
+import socket
+import sys
+import traceback
+
+import pytest
+
+
+def _warm_up():
+  # Import the py.test plugins that every run loads, so that the forked children inherit them.
+  try:
+    import pkg_resources
+  except ImportError:
+    return
+  for entry_point in pkg_resources.iter_entry_points('pytest11'):
+    try:
+      entry_point.load()
+    except Exception:
+      traceback.print_exc()
+
+
+def _run_batch(request):
+  sys.stdout.flush()
+  sys.stderr.flush()
+  pid = os.fork()
+  if pid:
+    return pid
+
+  rc = 1
+  try:
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    for fd, path in ((1, request['stdout']), (2, request['stderr'])):
+      output = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+      os.dup2(output, fd)
+      os.close(output)
+    rc = int(pytest.main(request['args']))
+  except SystemExit as e:
+    rc = e.code if isinstance(e.code, int) else 1
+  except BaseException:
+    traceback.print_exc()
+  finally:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(rc)
+
+
+def _exit_code(status):
+  return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+
+def _reply(conn, message):
+  conn.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def _read_request(conn):
+  data = b''
+  while not data.endswith(b'\n'):
+    chunk = conn.recv(65536)
+    if not chunk:
+      return None
+    data += chunk
+  return json.loads(data.decode('utf-8'))
+
+
+def serve(socket_path, idle_timeout):
+  if os.path.exists(socket_path):
+    os.unlink(socket_path)
+  server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  server.bind(socket_path)
+  socket_inode = os.stat(socket_path).st_ino
+  server.listen(8)
+  try:
+    while True:
+      readable, _, _ = select.select([server], [], [], idle_timeout)
+      if not readable:
+        return
+      conn, _ = server.accept()
+      with closing(conn):
+        request = _read_request(conn)
+        if request is None:
+          continue
+        if request.get('exit'):
+          return
+        pid = _run_batch(request)
+        # The client is gone if it gave up on the batch, which is no reason to stop serving.
+        try:
+          _reply(conn, {'pid': pid})
+        except socket.error:
+          pass
+        _, status = os.waitpid(pid, 0)
+        try:
+          _reply(conn, {'rc': _exit_code(status)})
+        except socket.error:
+          pass
+  finally:
+    server.close()
+    # Leave the socket alone if a replacement worker has bound it since.
+    if os.path.exists(socket_path) and os.stat(socket_path).st_ino == socket_inode:
+      os.unlink(socket_path)
+
+
+def main(argv):
+  socket_path, idle_timeout = argv[0], float(argv[1])
+  _warm_up()
+  serve(socket_path, idle_timeout)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
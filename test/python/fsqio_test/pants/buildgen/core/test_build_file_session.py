@@ -0,0 +1,92 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+from textwrap import dedent
+import unittest
+
+from pants.build_graph.address import Address, BuildFileAddress
+from pants.util.contextutil import pushd, temporary_dir
+from pants.util.dirutil import safe_file_dump, safe_mkdir
+
+from fsqio.pants.buildgen.core.build_file_manipulator import BuildFileSession
+
+
+class TestBuildFileSession(unittest.TestCase):
+
+  BUILD_FILE = dedent("""\
+    python_library(
+      name = 'a',
+      dependencies = [
+        'src/old:x',
+      ],
+    )
+
+    python_library(
+      name = 'b',
+    )
+    """)
+
+  def test_edits_to_every_target_are_written_once(self):
+    with temporary_dir() as buildroot, pushd(buildroot):
+      safe_mkdir('src/foo')
+      safe_file_dump('src/foo/BUILD', self.BUILD_FILE)
+      session = BuildFileSession()
+      for name, dep in (('b', Address.parse('src/foo:a')), ('a', Address.parse('src/new:y'))):
+        manipulator = session.load(BuildFileAddress(rel_path='src/foo/BUILD', target_name=name), ['python_library'])
+        manipulator.clear_unforced_dependencies()
+        manipulator.add_dependency(dep)
+
+      # Nothing is written until the whole session is.
+      with open('src/foo/BUILD', 'r') as f:
+        self.assertEqual(self.BUILD_FILE, f.read())
+      session.write(dry_run=False, use_colors=False)
+
+      with open(os.path.join(buildroot, 'src/foo/BUILD'), 'r') as f:
+        self.assertEqual(
+          dedent("""\
+            python_library(
+              name = 'a',
+              dependencies = [
+                'src/new:y',
+              ],
+            )
+
+            python_library(
+              name = 'b',
+              dependencies = [
+                ':a',
+              ],
+            )
+            """),
+          f.read(),
+        )
+
+  def test_loading_a_target_again_keeps_its_edits(self):
+    with temporary_dir() as buildroot, pushd(buildroot):
+      safe_mkdir('src/foo')
+      safe_file_dump('src/foo/BUILD', self.BUILD_FILE)
+      session = BuildFileSession()
+      address = BuildFileAddress(rel_path='src/foo/BUILD', target_name='b')
+      first = session.load(address, ['python_library'])
+      first.add_dependency(Address.parse('src/foo:a'))
+      second = session.load(address, ['python_library'])
+      self.assertIs(first, second)
+      second.add_dependency(Address.parse('src/new:y'))
+      session.write(dry_run=False, use_colors=False)
+
+      with open(os.path.join(buildroot, 'src/foo/BUILD'), 'r') as f:
+        self.assertIn(
+          dedent("""\
+            python_library(
+              name = 'b',
+              dependencies = [
+                ':a',
+                'src/new:y',
+              ],
+            )
+            """),
+          f.read(),
+        )
@@ -0,0 +1,79 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.buildgen.core.buildgen_report import BuildgenReport
+
+
+class TestBuildgenReport(unittest.TestCase):
+
+  def setUp(self):
+    self.report_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.report_dir)
+
+  def _read(self, filename):
+    with io.open(os.path.join(self.report_dir, filename), 'r', encoding='utf-8') as f:
+      return f.read()
+
+  def test_merges_every_task_in_the_run(self):
+    scala = BuildgenReport(self.report_dir, 'buildgen.scala', 'run-1')
+    scala.add_diff('src/jvm/BUILD', ['--- src/jvm/BUILD', '+++ src/jvm/BUILD', '-old', '+new'])
+    scala.add_unmapped_symbol('src/jvm:lib', 'io.fsq.Missing', 'no providing target')
+    scala.write()
+
+    python = BuildgenReport(self.report_dir, 'buildgen.python', 'run-1')
+    python.add_diff('src/jvm/BUILD', ['--- src/jvm/BUILD', '+++ src/jvm/BUILD', '-py', '+thon'])
+    python.add_unmapped_symbol('src/python:lib', 'missing.module', 'no third party providing target')
+    merged_path = python.write()
+
+    merged = json.loads(self._read('buildgen-report.json'))
+    self.assertEqual(os.path.join(self.report_dir, 'buildgen-report.json'), merged_path)
+    self.assertEqual(['buildgen.python', 'buildgen.scala'], merged['tasks'])
+    # Both tasks' diffs of the shared BUILD file are kept.
+    self.assertEqual(
+      [('buildgen.python', 'src/jvm/BUILD'), ('buildgen.scala', 'src/jvm/BUILD')],
+      [(d['task'], d['path']) for d in merged['diffs']],
+    )
+    self.assertEqual(
+      ['missing.module', 'io.fsq.Missing'],
+      [u['symbol'] for u in merged['unmapped_symbols']],
+    )
+    self.assertIn('+thon\n', self._read('buildgen-report.diff'))
+    self.assertIn('+new\n', self._read('buildgen-report.diff'))
+
+  def test_drops_reports_from_earlier_runs(self):
+    stale = BuildgenReport(self.report_dir, 'buildgen.scala', 'run-1')
+    stale.add_unmapped_symbol('src/jvm:lib', 'io.fsq.Missing', 'no providing target')
+    stale.write()
+
+    current = BuildgenReport(self.report_dir, 'buildgen.python', 'run-2')
+    self.assertFalse(current.has_problems)
+    current.write()
+
+    merged = json.loads(self._read('buildgen-report.json'))
+    self.assertEqual(['buildgen.python'], merged['tasks'])
+    self.assertEqual([], merged['unmapped_symbols'])
+    self.assertFalse(os.path.exists(os.path.join(self.report_dir, 'buildgen-task-buildgen.scala.json')))
+
+  def test_ignores_foreign_and_stale_format_files(self):
+    with io.open(os.path.join(self.report_dir, 'notes.json'), 'w', encoding='utf-8') as f:
+      f.write('{"unrelated": true}')
+    with io.open(os.path.join(self.report_dir, 'buildgen-task-old.json'), 'w', encoding='utf-8') as f:
+      f.write('{"diffs": {}}')
+
+    BuildgenReport(self.report_dir, 'buildgen.python', 'run-1').write()
+
+    merged = json.loads(self._read('buildgen-report.json'))
+    self.assertEqual(['buildgen.python'], merged['tasks'])
+    self.assertTrue(os.path.exists(os.path.join(self.report_dir, 'notes.json')))
+    self.assertFalse(os.path.exists(os.path.join(self.report_dir, 'buildgen-task-old.json')))
@@ -0,0 +1,96 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.buildgen.core.symbol_tree import CompactSymbolTree, MappedSymbolTree, SymbolTreeNode
+
+
+class TestCompactSymbolTree(unittest.TestCase):
+
+  SYMBOLS = [
+    ('io.fsq.common.Foo', 'src/io/fsq/common/Foo.scala'),
+    ('io.fsq.common.Foo.Nested', 'src/io/fsq/common/Foo.scala'),
+    ('io.fsq.common.Bar', 'src/io/fsq/common/Bar.scala'),
+    ('io.fsq.common', 'src/io/fsq/common/package.scala'),
+    ('io.fsq.other.Baz', 'src/io/fsq/other/Baz.scala'),
+    ('io.fsq.other.Baz', 'src/io/fsq/other/BazCompanion.scala'),
+    ('fsqio.pants.buildgen.core.symbol_tree', 'src/python/fsqio/pants/buildgen/core/symbol_tree.py'),
+  ]
+
+  LOOKUPS = [
+    'io.fsq.common.Foo',
+    'io.fsq.common.Foo.method',
+    'io.fsq.common._',
+    'io.fsq._',
+    'io.fsq',
+    'io.fsq.other.Baz',
+    'io.fsq.missing.Qux',
+    'fsqio.pants.buildgen',
+    'fsqio.pants.buildgen.core.symbol_tree.SymbolTreeNode',
+    'java.util.List',
+    '_',
+  ]
+
+  def _trees(self):
+    reference = SymbolTreeNode()
+    compact = CompactSymbolTree()
+    for symbol, source in self.SYMBOLS:
+      reference.insert(symbol, source)
+      compact.insert(symbol, source)
+    return reference, compact
+
+  def test_get_matches_symbol_tree_node(self):
+    reference, compact = self._trees()
+    for kwargs in ({}, {'allow_prefix_imports': True}, {'exact': True}):
+      for symbol in self.LOOKUPS:
+        self.assertEqual(reference.get(symbol, **kwargs), compact.get(symbol, **kwargs), (symbol, kwargs))
+    self.assertEqual(reference.flattened_subtree(), compact.flattened_subtree())
+
+  def test_mapped_tree_matches_symbol_tree_node(self):
+    reference, compact = self._trees()
+    tmpdir = tempfile.mkdtemp()
+    try:
+      tree_file = os.path.join(tmpdir, 'tree.bin')
+      MappedSymbolTree.write(compact, tree_file)
+      mapped = MappedSymbolTree.load(tree_file)
+      for kwargs in ({}, {'allow_prefix_imports': True}, {'exact': True}):
+        for symbol in self.LOOKUPS:
+          self.assertEqual(reference.get(symbol, **kwargs), mapped.get(symbol, **kwargs), (symbol, kwargs))
+      self.assertEqual(reference.flattened_subtree(), mapped.flattened_subtree())
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_mapped_tree_rejects_other_files(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      not_a_tree = os.path.join(tmpdir, 'tree.bin')
+      with open(not_a_tree, 'wb') as f:
+        f.write(b'not a symbol tree')
+      self.assertIsNone(MappedSymbolTree.load(not_a_tree))
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_insert_invalidates_flattened_cache(self):
+    _, compact = self._trees()
+    before = compact.get('io.fsq._')
+    compact.insert('io.fsq.other.New', 'src/io/fsq/other/New.scala')
+    self.assertEqual(before | {'src/io/fsq/other/New.scala'}, compact.get('io.fsq._'))
+    self.assertIn('src/io/fsq/other/New.scala', compact.flattened_subtree())
+
+  def test_exclusive_flags(self):
+    _, compact = self._trees()
+    with self.assertRaises(ValueError):
+      compact.get('io.fsq', allow_prefix_imports=True, exact=True)
+
+  def test_render_matches_symbol_tree_node(self):
+    reference, compact = SymbolTreeNode(), CompactSymbolTree()
+    for tree in (reference, compact):
+      tree.insert('a.b', 'ab.scala')
+      tree.insert('a', 'a.scala')
+    self.assertEqual(reference.render(), compact.render())
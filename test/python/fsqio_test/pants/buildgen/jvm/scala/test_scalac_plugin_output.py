@@ -0,0 +1,49 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.buildgen.jvm.scala.scalac_plugin_output import PluginOutputIngester, strip_root_prefix
+
+
+def _parse(output_json):
+  return output_json['source'], output_json['symbols']
+
+
+class TestScalacPluginOutput(unittest.TestCase):
+
+  def setUp(self):
+    self.output_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.output_dir)
+
+  def _write(self, name, content):
+    with open(os.path.join(self.output_dir, name), 'w') as f:
+      f.write(content)
+
+  def test_strip_root_prefix(self):
+    self.assertEqual(
+      ['foo.Bar', 'baz', 'foo._root_.Qux', '_root_'],
+      strip_root_prefix(['_root_.foo.Bar', 'baz', '_root_.foo._root_.Qux', '_root_']),
+    )
+
+  def test_ingests_files_written_while_running(self):
+    with PluginOutputIngester(self.output_dir, _parse, poll_interval=0.01) as ingester:
+      self._write('a', json.dumps({'source': 'a.scala', 'symbols': ['a']}))
+      # A file that is only partly written is picked up once it is complete.
+      payload = json.dumps({'source': 'b.scala', 'symbols': ['b']})
+      self._write('b', payload[:len(payload) // 2])
+      self._write('b', payload)
+    self.assertEqual({'a.scala': ['a'], 'b.scala': ['b']}, ingester.results)
+
+  def test_incomplete_file_after_exit_raises(self):
+    with self.assertRaises(ValueError):
+      with PluginOutputIngester(self.output_dir, _parse, poll_interval=0.01):
+        self._write('a', '{"source": "a.scala", ')
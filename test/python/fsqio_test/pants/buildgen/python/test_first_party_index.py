@@ -0,0 +1,49 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+from fsqio.pants.buildgen.core.symbol_tree import CompactSymbolTree
+from fsqio.pants.buildgen.python.first_party_index import FirstPartySymbolIndex
+
+
+class TestFirstPartySymbolIndex(unittest.TestCase):
+
+  def setUp(self):
+    source_to_exported_symbols = {
+      'src/foo/bar.py': ['foo.bar'],
+      'src/foo/baz.py': ['foo.baz'],
+      'src/foo/gen/baz.py': ['foo.baz'],
+    }
+    tree = CompactSymbolTree()
+    for source, symbols in source_to_exported_symbols.items():
+      for symbol in symbols:
+        tree.insert(symbol, source)
+    source_to_addresses = {
+      'src/foo/bar.py': frozenset(['src/foo:bar']),
+      'src/foo/baz.py': frozenset(['src/foo:baz']),
+      'src/foo/gen/baz.py': frozenset(['src/foo:baz-gen']),
+    }
+    self.index = FirstPartySymbolIndex(tree, source_to_exported_symbols, source_to_addresses)
+
+  def test_exported_symbols(self):
+    self.assertEqual(
+      ({'src/foo:bar', 'src/foo:baz', 'src/foo:baz-gen'}, set()),
+      self.index.resolve(['foo.bar', 'foo.baz']),
+    )
+
+  def test_symbols_within_a_module(self):
+    self.assertEqual(({'src/foo:bar'}, set()), self.index.resolve(['foo.bar.some_function']))
+
+  def test_package_prefix(self):
+    self.assertEqual(
+      ({'src/foo:bar', 'src/foo:baz', 'src/foo:baz-gen'}, set()),
+      self.index.resolve(['foo']),
+    )
+
+  def test_unresolved_symbols(self):
+    self.assertEqual((set(), {'qux.quux'}), self.index.resolve(['qux.quux']))
+    # The miss is memoized, and reported again on later lookups.
+    self.assertEqual(({'src/foo:bar'}, {'qux.quux'}), self.index.resolve(['qux.quux', 'foo.bar']))
@@ -0,0 +1,51 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.buildgen.python.import_cache import PythonImportCache
+from fsqio.pants.buildgen.python.source_analysis.python_import_parser import Import
+
+
+class TestPythonImportCache(unittest.TestCase):
+
+  def setUp(self):
+    self.workdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.workdir)
+
+  def _cached_hashes(self, cache):
+    with open(cache.cache_file, 'r') as f:
+      return sorted(json.load(f))
+
+  def test_keeps_only_entries_used_by_the_run(self):
+    cache = PythonImportCache(self.workdir, 'v1')
+    cache.put('a', [], [Import(aliases=[('foo.bar', None)])])
+    cache.put('b', [], [])
+    cache.write()
+    self.assertEqual(['a', 'b'], self._cached_hashes(cache))
+
+    cache = PythonImportCache(self.workdir, 'v1')
+    errors, imports = cache.get('a')
+    self.assertEqual([], errors)
+    self.assertEqual((('foo.bar', None),), imports[0].aliases)
+    cache.write()
+    self.assertEqual(['a'], self._cached_hashes(cache))
+    self.assertEqual(['python-imports-v1.json'], os.listdir(self.workdir))
+
+  def test_removes_cache_files_of_other_versions(self):
+    old_cache = PythonImportCache(self.workdir, 'v1')
+    old_cache.put('a', [], [])
+    old_cache.write()
+
+    cache = PythonImportCache(self.workdir, 'v2')
+    self.assertIsNone(cache.get('a'))
+    cache.write()
+    self.assertEqual([], os.listdir(self.workdir))
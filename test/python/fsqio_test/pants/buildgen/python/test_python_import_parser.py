@@ -0,0 +1,89 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+from textwrap import dedent
+import unittest
+
+from fsqio.pants.buildgen.python.source_analysis.python_import_parser import (
+  PythonImportParser,
+  _AmbiguousImportRegion,
+)
+
+
+class TestPythonImportParser(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _parser(self, source, scan_tokens=True):
+    path = os.path.join(self.tmpdir, 'source.py')
+    with open(path, 'w') as f:
+      f.write(dedent(source))
+    return PythonImportParser(path, (), scan_tokens=scan_tokens)
+
+  def _normalized(self, parser):
+    errors, imports = parser.lint_and_collect_imports
+    return sorted(errors), sorted((imp.module or '', imp.aliases, imp.comments) for imp in imports)
+
+  def assert_scan_matches_ast(self, source):
+    scanner = self._parser(source)
+    # Make sure the fast path was actually taken, rather than falling back to the AST.
+    scanner._scan_import_statements()
+    self.assertEqual(self._normalized(scanner), self._normalized(self._parser(source, scan_tokens=False)))
+
+  def test_import_block(self):
+    self.assert_scan_matches_ast("""\
+      # coding=utf-8
+      \"\"\"A module docstring.\"\"\"
+
+      from __future__ import absolute_import
+
+      # A comment above os.
+      import os
+      import os.path as osp
+      from collections import (
+        defaultdict,
+        namedtuple as nt,
+      )
+      from fsqio.util import memo
+
+
+      def foo():
+        import json
+    """)
+
+  def test_lint_errors(self):
+    self.assert_scan_matches_ast("""\
+      import os, sys
+      from . import sibling
+      from ..parent.module import thing  # An inline comment.
+      from wild import *
+      __author__ = 'someone'
+    """)
+
+  def test_imports_only(self):
+    # With no code after the imports, every import is reported as not at the top of the file.
+    self.assert_scan_matches_ast("""\
+      import os
+      from sys import path
+    """)
+
+  def test_falls_back_to_ast(self):
+    for source in (
+      'import os\n\nx = 1\nimport sys\n',
+      'import os; import sys\n',
+      '@decorator\ndef foo():\n  pass\n',
+      'import os\n"""A string after an import."""\n',
+    ):
+      parser = self._parser(source)
+      with self.assertRaises(_AmbiguousImportRegion):
+        parser._scan_import_statements()
+      self.assertEqual(self._normalized(parser), self._normalized(self._parser(source, scan_tokens=False)))
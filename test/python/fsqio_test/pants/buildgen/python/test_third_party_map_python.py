@@ -0,0 +1,71 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.buildgen.python.third_party_map_python import SitePackagesScan, get_third_party_modules
+
+
+class TestThirdPartyMapPython(unittest.TestCase):
+
+  def setUp(self):
+    self.site_packages = tempfile.mkdtemp()
+    self.cache_dir = tempfile.mkdtemp()
+    self._touch('requests/__init__.py')
+    self._touch('requests/packages/urllib3/__init__.py')
+    self._touch('requests/_internal/__init__.py')
+    self._touch('requests-2.18.4.dist-info/top_level.txt', 'requests\n')
+    self._touch('six.py')
+    self._touch('six-1.11.0.dist-info/RECORD', 'six.py,sha256=abc,100\nsix-1.11.0.dist-info/RECORD,,\n')
+    self._touch('yaml/__init__.py')
+    self.dep_map = {
+      'requests': '3rdparty/python:requests',
+      'six': '3rdparty/python:six',
+      'PyYAML': '3rdparty/python:PyYAML',
+    }
+
+  def tearDown(self):
+    shutil.rmtree(self.site_packages)
+    shutil.rmtree(self.cache_dir)
+
+  def _touch(self, relpath, content=''):
+    path = os.path.join(self.site_packages, relpath)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(content)
+
+  def test_get_third_party_modules(self):
+    # PyYAML has no metadata, and its fallback import name of `pyyaml` is not installed.
+    self.assertEqual(
+      {
+        'requests': '3rdparty/python:requests',
+        'requests.packages': '3rdparty/python:requests',
+        'requests.packages.urllib3': '3rdparty/python:requests',
+        'six': '3rdparty/python:six',
+      },
+      get_third_party_modules(self.site_packages, self.dep_map),
+    )
+
+  def test_scan_is_cached_until_the_root_changes(self):
+    scan = SitePackagesScan(self.site_packages, self.cache_dir)
+    get_third_party_modules(self.site_packages, self.dep_map, scan)
+    scan.write()
+
+    # The cached walk is reused, even though the package tree has since changed beneath the root.
+    self._touch('requests/adapters/__init__.py')
+    scan = SitePackagesScan(self.site_packages, self.cache_dir)
+    cached = get_third_party_modules(self.site_packages, self.dep_map, scan)
+    self.assertNotIn('requests.adapters', cached)
+
+    # Installing a distribution changes the root, which starts a new scan.
+    self._touch('PyYAML-3.12.dist-info/top_level.txt', 'yaml\n')
+    scan = SitePackagesScan(self.site_packages, self.cache_dir)
+    rescanned = get_third_party_modules(self.site_packages, self.dep_map, scan)
+    self.assertEqual('3rdparty/python:requests', rescanned['requests.adapters'])
+    self.assertEqual('3rdparty/python:PyYAML', rescanned['yaml'])
@@ -0,0 +1,58 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+
+import unittest
+
+from fsqio.pants.buildgen.python.third_party_resolver import ThirdPartyResolver
+
+
+class TestThirdPartyResolver(unittest.TestCase):
+
+  def setUp(self):
+    venv_third_party = {
+      'requests': '3rdparty/python:requests',
+      'google.protobuf': '3rdparty/python:protobuf',
+      'google.protobuf.internal': '3rdparty/python:protobuf-internal',
+      'twitter.common.dirutil': '3rdparty/python:twitter.common.dirutil',
+      'boto': '3rdparty/python:boto',
+    }
+    third_party_map = {
+      'twitter': {
+        'common': {
+          'log': '3rdparty/python:twitter.common.log',
+        },
+        'finagle': {
+          'memcached': 'SKIP',
+          'DEFAULT': '3rdparty/python:finagle',
+        },
+      },
+      'boto': None,
+      'yaml': '3rdparty/python:PyYAML',
+    }
+    self.resolver = ThirdPartyResolver(venv_third_party, third_party_map)
+
+  def test_third_party_map(self):
+    self.assertEqual('3rdparty/python:PyYAML', self.resolver.resolve('yaml.constructor'))
+    self.assertEqual('3rdparty/python:twitter.common.log', self.resolver.resolve('twitter.common.log.debug'))
+
+  def test_third_party_map_default(self):
+    self.assertEqual('3rdparty/python:finagle', self.resolver.resolve('twitter.finagle.thrift'))
+    self.assertEqual('3rdparty/python:finagle', self.resolver.resolve('twitter.finagle'))
+
+  def test_skip(self):
+    self.assertEqual(ThirdPartyResolver.SKIP, self.resolver.resolve('twitter.finagle.memcached.Client'))
+
+  def test_falls_back_to_the_virtualenv(self):
+    self.assertEqual('3rdparty/python:boto', self.resolver.resolve('boto.s3'))
+    self.assertEqual('3rdparty/python:twitter.common.dirutil', self.resolver.resolve('twitter.common.dirutil.safe_mkdir'))
+
+  def test_virtualenv_top_level_then_longest_prefix(self):
+    self.assertEqual('3rdparty/python:requests', self.resolver.resolve('requests.adapters.HTTPAdapter'))
+    self.assertEqual('3rdparty/python:protobuf', self.resolver.resolve('google.protobuf.message'))
+    self.assertEqual('3rdparty/python:protobuf-internal', self.resolver.resolve('google.protobuf.internal.encoder'))
+
+  def test_unknown(self):
+    self.assertIsNone(self.resolver.resolve('google.cloud'))
+    self.assertIsNone(self.resolver.resolve('twitter.common.collections'))
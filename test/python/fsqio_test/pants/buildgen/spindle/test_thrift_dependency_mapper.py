@@ -0,0 +1,101 @@
+# coding=utf-8
+# Copyright 2018 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.buildgen.spindle.thrift_dependency_mapper import ThriftDependencyMapper
+
+
+class TestThriftDependencyMapper(unittest.TestCase):
+
+  def setUp(self):
+    self.buildroot = tempfile.mkdtemp()
+    self.cache_file = os.path.join(self.buildroot, 'thrift-includes.json')
+    self._write('src/thrift/io/fsq/common.thrift', 'struct Common {}\n')
+    self._write('test/thrift/io/fsq/fixtures.thrift', 'struct Fixture {}\n')
+    self._write(
+      'src/thrift/io/fsq/user.thrift',
+      'namespace java io.fsq.user\n'
+      'include "io/fsq/common.thrift"\n'
+      'include "io/fsq/fixtures.thrift"\n',
+    )
+
+  def tearDown(self):
+    shutil.rmtree(self.buildroot)
+
+  def _write(self, rel_path, content):
+    path = os.path.join(self.buildroot, rel_path)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(content)
+
+  def _mapper(self, source_roots=('src/thrift', 'test/thrift')):
+    return ThriftDependencyMapper(source_roots, buildroot=self.buildroot, cache_file=self.cache_file)
+
+  def test_resolves_includes_against_every_source_root(self):
+    mapper = self._mapper()
+    self.assertEqual(
+      ['io/fsq/common.thrift', 'io/fsq/fixtures.thrift'],
+      mapper.includes_from_source('src/thrift/io/fsq/user.thrift'),
+    )
+    self.assertEqual('src/thrift/io/fsq/common.thrift', mapper.buildroot_relative_source('io/fsq/common.thrift'))
+    self.assertEqual('test/thrift/io/fsq/fixtures.thrift', mapper.buildroot_relative_source('io/fsq/fixtures.thrift'))
+
+  def test_source_roots_come_from_the_caller(self):
+    mapper = self._mapper(source_roots=['src/thrift'])
+    with self.assertRaises(ValueError):
+      mapper.buildroot_relative_source('io/fsq/fixtures.thrift')
+
+  def test_ambiguous_include_raises(self):
+    self._write('test/thrift/io/fsq/common.thrift', 'struct Common {}\n')
+    with self.assertRaises(ValueError):
+      self._mapper().buildroot_relative_source('io/fsq/common.thrift')
+
+  def test_includes_are_cached_by_content(self):
+    mapper = self._mapper()
+    mapper.includes_from_source('src/thrift/io/fsq/user.thrift')
+    mapper.write()
+    self.assertTrue(os.path.isfile(self.cache_file))
+
+    # An identical file elsewhere is answered from the persisted cache without being parsed.
+    with open(os.path.join(self.buildroot, 'src/thrift/io/fsq/user.thrift'), 'r') as f:
+      self._write('src/thrift/io/fsq/copy.thrift', f.read())
+    cached_mapper = self._mapper()
+    cached_mapper.INCLUDE_REGEX = None
+    self.assertEqual(
+      ['io/fsq/common.thrift', 'io/fsq/fixtures.thrift'],
+      cached_mapper.includes_from_source('src/thrift/io/fsq/copy.thrift'),
+    )
+
+    # Changed content is parsed again.
+    self._write('src/thrift/io/fsq/user.thrift', 'include "io/fsq/common.thrift"\n')
+    self.assertEqual(['io/fsq/common.thrift'], self._mapper().includes_from_source('src/thrift/io/fsq/user.thrift'))
+
+  def test_cache_keeps_only_sources_read_by_the_run(self):
+    mapper = self._mapper()
+    mapper.includes_from_source('src/thrift/io/fsq/user.thrift')
+    mapper.includes_from_source('src/thrift/io/fsq/common.thrift')
+    mapper.write()
+
+    mapper = self._mapper()
+    mapper.includes_from_source('src/thrift/io/fsq/user.thrift')
+    mapper.write()
+    cached_mapper = self._mapper()
+    cached_mapper.INCLUDE_REGEX = None
+    self.assertEqual(
+      ['io/fsq/common.thrift', 'io/fsq/fixtures.thrift'],
+      cached_mapper.includes_from_source('src/thrift/io/fsq/user.thrift'),
+    )
+    with self.assertRaises(AttributeError):
+      cached_mapper.includes_from_source('src/thrift/io/fsq/common.thrift')
+
+  def test_follows_symlinked_dirs(self):
+    os.symlink(os.path.join(self.buildroot, 'test/thrift/io/fsq'), os.path.join(self.buildroot, 'src/thrift/linked'))
+    self.assertEqual('src/thrift/linked/fixtures.thrift',
+                     self._mapper(source_roots=['src/thrift']).buildroot_relative_source('linked/fixtures.thrift'))
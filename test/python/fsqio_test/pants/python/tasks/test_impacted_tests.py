@@ -0,0 +1,125 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from textwrap import dedent
+import unittest
+
+from fsqio.pants.buildgen.python.source_analysis.python_import_parser import Import
+from fsqio.pants.python.tasks.impacted_tests import (
+  ImportGraph,
+  UntraceableChangeError,
+  affected_test_sources,
+  imported_symbols,
+  module_for_source,
+  source_imported_symbols,
+)
+
+
+class TestImpactedTests(unittest.TestCase):
+
+  SOURCES = {
+    'src/python/fsq/__init__.py': 'fsq',
+    'src/python/fsq/util.py': 'fsq.util',
+    'src/python/fsq/db/__init__.py': 'fsq.db',
+    'src/python/fsq/db/client.py': 'fsq.db.client',
+    'test/python/fsq/util_test.py': 'fsq_test.util_test',
+    'test/python/fsq/client_test.py': 'fsq_test.client_test',
+  }
+
+  def _graph(self):
+    return ImportGraph(self.SOURCES, {
+      'src/python/fsq/db/client.py': {'fsq.util.retry', 'requests'},
+      'test/python/fsq/util_test.py': {'fsq.util'},
+      'test/python/fsq/client_test.py': {'fsq.db.client.Client'},
+    })
+
+  def test_module_for_source(self):
+    self.assertEqual('fsq.db.client', module_for_source('fsq/db/client.py'))
+    self.assertEqual('fsq.db', module_for_source('fsq/db/__init__.py'))
+    self.assertEqual(None, module_for_source('fsq/db/schema.json'))
+
+  def test_imported_symbols(self):
+    imports = [Import(module=None, aliases=(('os.path', None),)), Import(module='fsq.db', aliases=(('client', 'c'),))]
+    self.assertEqual({'os.path', 'fsq.db.client'}, imported_symbols(imports))
+
+  def test_source_imported_symbols_include_nested_and_relative_imports(self):
+    content = dedent("""
+      import os.path
+      from . import sibling
+      from .pkg import thing
+      from .. import util
+
+      def test_x():
+        from fsq.db import client
+        import json as j
+    """).encode('utf-8')
+    self.assertEqual(
+      {'os.path', 'fsq_test.db.sibling', 'fsq_test.db.pkg.thing', 'fsq_test.util', 'fsq.db.client', 'json'},
+      source_imported_symbols(content, 'fsq_test.db.client_test'),
+    )
+    self.assertEqual({'fsq.db.client', 'fsq.db.schema'},
+                     source_imported_symbols(b'from . import client\nfrom .schema import *\n', 'fsq.db', True))
+    with self.assertRaises(ValueError):
+      source_imported_symbols(b'from ... import util\n', 'fsq.db.client')
+
+  def test_affected_sources_are_transitive(self):
+    graph = self._graph()
+    self.assertEqual(
+      {'src/python/fsq/util.py', 'src/python/fsq/db/client.py',
+       'test/python/fsq/util_test.py', 'test/python/fsq/client_test.py'},
+      graph.affected_sources(['src/python/fsq/util.py']),
+    )
+    self.assertEqual(
+      {'src/python/fsq/db/client.py', 'test/python/fsq/client_test.py'},
+      graph.affected_sources(['src/python/fsq/db/client.py']),
+    )
+
+  def test_package_inits_are_dependencies(self):
+    affected = self._graph().affected_sources(['src/python/fsq/db/__init__.py'])
+    self.assertIn('test/python/fsq/client_test.py', affected)
+    self.assertNotIn('test/python/fsq/util_test.py', affected)
+
+  def _affected(self, changed_files, unreadable=()):
+    source_to_symbols = {
+      'src/python/fsq/__init__.py': set(),
+      'src/python/fsq/util.py': set(),
+      'src/python/fsq/db/__init__.py': set(),
+      'src/python/fsq/db/client.py': {'fsq.util.retry', 'fsq.removed'},
+      'test/python/fsq/util_test.py': {'fsq.util'},
+      'test/python/fsq/client_test.py': {'fsq.db.client.Client'},
+    }
+    source_to_symbols.update((source, None) for source in unreadable)
+    return affected_test_sources(
+      changed_files,
+      self.SOURCES,
+      {'src/python/fsq/db/schema.json': {'src/python/fsq/db/__init__.py', 'src/python/fsq/db/client.py'}},
+      {'test/python/fsq/util_test.py', 'test/python/fsq/client_test.py'},
+      source_to_symbols,
+      {'src/python', 'test/python'},
+      {'src/python/fsq', 'src/python/fsq/db', 'test/python/fsq', '3rdparty/python'},
+    )
+
+  def test_affected_test_sources(self):
+    self.assertEqual({'test/python/fsq/client_test.py'}, self._affected(['src/python/fsq/db/schema.json']))
+    self.assertEqual(
+      {'test/python/fsq/util_test.py', 'test/python/fsq/client_test.py'},
+      self._affected(['src/python/fsq/util.py']),
+    )
+
+  def test_untraceable_changes_select_every_test(self):
+    for changed_file in ('src/python/fsq/removed.py', 'src/python/fsq/BUILD', '3rdparty/python/requirements.txt',
+                         '3rdparty/python/BUILD', 'pants.ini', 'pytest.ini'):
+      with self.assertRaises(UntraceableChangeError):
+        self._affected(['src/python/fsq/util.py', changed_file])
+    with self.assertRaises(UntraceableChangeError):
+      self._affected(['src/python/fsq/util.py'], unreadable=['src/python/fsq/db/client.py'])
+
+  def test_changes_outside_the_tests_are_ignored(self):
+    self.assertEqual(
+      {'test/python/fsq/util_test.py', 'test/python/fsq/client_test.py'},
+      self._affected(['src/python/fsq/util.py', 'README.md', 'src/jvm/fsq/Client.scala', 'src/python/other/BUILD',
+                      'src/python/other/main.py', 'src/python/fsq/unused.py', 'other/python/fsq/util.py']),
+    )
+    self.assertEqual(set(), self._affected(['README.md', 'src/python/fsq/db/README.md']))
@@ -0,0 +1,72 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.python.tasks.junit_xml import JunitXmlError, parse_junit_xml
+
+
+class TestParseJunitXml(unittest.TestCase):
+
+  XML = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites>
+  <testsuite errors="{errors}" failures="{failures}" name="pytest" skipped="1" tests="4" time="0.5">
+    <testcase classname="test.a_test" file="test/a_test.py" line="3" name="test_pass" time="0.1"/>
+    <testcase classname="test.a_test" file="test/a_test.py" line="7" name="test_fail" time="0.2">
+      <failure message="assert False">trace</failure>
+    </testcase>
+    <testcase classname="test.b_test" file="test/b_test.py" line="1" name="test_error" time="bogus">
+      <error message="fixture">trace</error>
+    </testcase>
+    <testcase classname="test.b_test" file="test/b_test.py" line="9" name="test_skip" time="0.0">
+      <skipped message="skip"/>
+    </testcase>
+  </testsuite>
+</testsuites>
+"""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _xml(self, content):
+    path = os.path.join(self.tmpdir, 'TEST-junit.xml')
+    with open(path, 'w') as f:
+      f.write(content)
+    return path
+
+  def test_reads_failures_and_test_info(self):
+    report = parse_junit_xml(self._xml(self.XML.format(errors=1, failures=1)), ['file', 'name', 'classname'])
+    self.assertEqual(['test/a_test.py', 'test/b_test.py'], report.failed_files)
+    self.assertEqual(
+      ['test.a_test.test_pass', 'test.a_test.test_fail', 'test.b_test.test_error', 'test.b_test.test_skip'],
+      list(report.tests_info),
+    )
+    self.assertEqual(
+      {'time': 0.2, 'result_code': 'failure', 'file': 'test/a_test.py', 'name': 'test_fail', 'classname': 'test.a_test'},
+      report.tests_info['test.a_test.test_fail'],
+    )
+    self.assertEqual(None, report.tests_info['test.b_test.test_error']['time'])
+    self.assertEqual('error', report.tests_info['test.b_test.test_error']['result_code'])
+    self.assertEqual('skipped', report.tests_info['test.b_test.test_skip']['result_code'])
+    self.assertEqual('success', report.tests_info['test.a_test.test_pass']['result_code'])
+
+  def test_failures_follow_the_testsuite_counts(self):
+    report = parse_junit_xml(self._xml(self.XML.format(errors=0, failures=0)))
+    self.assertEqual([], report.failed_files)
+    self.assertEqual('failure', report.tests_info['test.a_test.test_fail']['result_code'])
+
+  def test_bad_xml_raises(self):
+    with self.assertRaises(JunitXmlError):
+      parse_junit_xml(self._xml('<testsuite failures="0" errors="0"><testcase'))
+    with self.assertRaises(JunitXmlError):
+      parse_junit_xml(self._xml('<testsuites/>'))
+    with self.assertRaises(JunitXmlError):
+      parse_junit_xml(self._xml(self.XML.format(errors='', failures=0)))
@@ -0,0 +1,107 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.python.tasks.pytest_collection_cache import (
+  PytestCollectionCache,
+  collection_cache_key,
+  collection_conftest_content,
+)
+from fsqio.pants.python.tasks.pytest_timings import duration_shard_conftest_content
+
+
+class FakeConfig(object):
+  def __init__(self, keyword):
+    self.keyword = keyword
+
+  def getoption(self, name):
+    return {'keyword': self.keyword}[name]
+
+
+class TestPytestCollectionCache(unittest.TestCase):
+
+  SOURCES_MAP = {
+    '/chroot/a_test.py': 'test/python/a_test.py',
+    '/chroot/b_test.py': 'test/python/b_test.py',
+    '/chroot/conftest.py': 'test/python/conftest.py',
+  }
+  CACHED_FILES = [
+    ['/chroot/a_test.py', [['::test_one', ['a_test.py', 'test_one']],
+                           ['::test_two', ['a_test.py', 'slow', 'test_two']]]],
+    ['/chroot/conftest.py', []],
+    ['/chroot/b_test.py', [['::TestB::()::test_three', ['TestB', 'b_test.py', 'test_three']]]],
+  ]
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _plugin(self, keyword, shard=None, nshards=None):
+    class NodeRenamerPlugin(object):
+      _SOURCES_MAP = self.SOURCES_MAP
+    namespace = {'NodeRenamerPlugin': NodeRenamerPlugin}
+    exec(collection_conftest_content(self.CACHED_FILES, None), namespace)
+    if shard is not None:
+      exec(duration_shard_conftest_content(shard, nshards, {}), namespace)
+    return namespace['CollectionCachePlugin'](FakeConfig(keyword))
+
+  def test_key_covers_source_content_and_environment(self):
+    key = collection_cache_key('test/python/a_test.py', 'content', 'env')
+    self.assertEqual(key, collection_cache_key('test/python/a_test.py', 'content', 'env'))
+    self.assertNotEqual(key, collection_cache_key('test/python/b_test.py', 'content', 'env'))
+    self.assertNotEqual(key, collection_cache_key('test/python/a_test.py', 'changed', 'env'))
+    self.assertNotEqual(key, collection_cache_key('test/python/a_test.py', 'content', 'changed'))
+
+  def test_records_and_reads_entries(self):
+    path = os.path.join(self.tmpdir, 'collection-cache.json')
+    cache = PytestCollectionCache(path)
+    cache.record({'key1': [['::test_one', ['test_one']]], 'key2': []})
+    self.assertFalse(os.path.exists(path))
+    cache.write()
+    cache = PytestCollectionCache(path)
+    self.assertEqual([['::test_one', ['test_one']]], cache.get('key1'))
+    cache.record({'key2': [['::test_two', ['test_two']]]})
+    cache.write()
+    cache = PytestCollectionCache(path)
+    self.assertEqual([['::test_one', ['test_one']]], cache.get('key1'))
+    self.assertEqual([['::test_two', ['test_two']]], cache.get('key2'))
+    self.assertIsNone(cache.get('key3'))
+
+  def test_keeps_only_entries_used_by_the_run(self):
+    path = os.path.join(self.tmpdir, 'collection-cache.json')
+    cache = PytestCollectionCache(path)
+    cache.record({'key1': [], 'key2': []})
+    cache.write()
+    cache = PytestCollectionCache(path)
+    cache.write()
+    self.assertEqual([], PytestCollectionCache(path).get('key1'))
+    cache.get('key2')
+    cache.record({'key3': []})
+    cache.write()
+    cache = PytestCollectionCache(path)
+    self.assertIsNone(cache.get('key1'))
+    self.assertEqual([], cache.get('key2'))
+    self.assertEqual([], cache.get('key3'))
+
+  def test_selects_files_by_keyword(self):
+    self.assertEqual({'/chroot/a_test.py', '/chroot/b_test.py'}, self._plugin('')._selected())
+    self.assertEqual({'/chroot/a_test.py'}, self._plugin('slow')._selected())
+    self.assertEqual({'/chroot/a_test.py'}, self._plugin('-TestB')._selected())
+    self.assertEqual({'/chroot/b_test.py'}, self._plugin('TestB and not slow')._selected())
+    # Forms that cannot be matched against the cache select everything.
+    self.assertEqual({'/chroot/a_test.py', '/chroot/b_test.py'}, self._plugin('test_one:')._selected())
+    self.assertEqual({'/chroot/a_test.py', '/chroot/b_test.py'}, self._plugin('not (')._selected())
+
+  def test_selects_files_by_shard(self):
+    # Without timings, the three tests are dealt round-robin over the two shards: test_one and test_three to shard 0.
+    self.assertEqual({'/chroot/a_test.py', '/chroot/b_test.py'}, self._plugin('', 0, 2)._selected())
+    self.assertEqual({'/chroot/a_test.py'}, self._plugin('', 1, 2)._selected())
+    self.assertEqual({'/chroot/a_test.py'}, self._plugin('test_one', 0, 2)._selected())
@@ -0,0 +1,146 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+from textwrap import dedent
+
+from pants.backend.python.tasks.gather_sources import GatherSources
+from pants.backend.python.tasks.resolve_requirements import ResolveRequirements
+from pants.backend.python.tasks.select_interpreter import SelectInterpreter
+from pants.base.exceptions import ErrorWhileTesting, TaskError
+from pants.util.contextutil import temporary_dir
+from pants_test.backend.python.tasks.python_task_test_base import PythonTaskTestBase
+
+from fsqio.pants.python.tasks.pytest_prep import PytestPrep
+from fsqio.pants.python.tasks.pytest_run import PytestRun
+
+
+class PytestRunPartitionsTest(PythonTaskTestBase):
+
+  @classmethod
+  def task_type(cls):
+    return PytestRun
+
+  def setUp(self):
+    super(PytestRunPartitionsTest, self).setUp()
+
+    self.create_file('lib/core.py', dedent("""
+      def one():
+        return 1
+
+      def two():
+        return 2
+    """))
+    self.add_to_build_file('lib', 'python_library(name="core", sources=["core.py"])')
+
+    for name, content in (
+      ('green', 'from lib import core\n\ndef test_one():\n  assert 1 == core.one()\n'),
+      ('red', 'from lib import core\n\ndef test_two():\n  assert 1 == core.two()\n'),
+      ('green2', 'from lib import core\n\ndef test_two():\n  assert 2 == core.two()\n'),
+    ):
+      self.create_file('tests/test_{}.py'.format(name), content)
+      self.add_to_build_file('tests', dedent("""
+        python_tests(
+          name='{name}',
+          sources=['test_{name}.py'],
+          dependencies=['lib:core'],
+        )
+      """.format(name=name)))
+
+    # A test target whose conftest leaves an unreadable junit xml behind, so that its run raises a TaskError once its
+    # tests ran, as an unexpected failure would.
+    self.create_file('broken/conftest.py', dedent("""
+      def pytest_unconfigure(config):
+        with open(config.option.xmlpath, 'w') as fp:
+          fp.write('<testsuite')
+    """))
+    self.create_file('broken/test_broken.py', 'def test_broken():\n  pass\n')
+    self.add_to_build_file('broken', dedent("""
+      python_tests(
+        name='broken',
+        sources=['conftest.py', 'test_broken.py'],
+      )
+    """))
+
+    self.green = self.target('tests:green')
+    self.red = self.target('tests:red')
+    self.green2 = self.target('tests:green2')
+    self.broken = self.target('broken:broken')
+    self.targets = [self.green, self.red, self.green2]
+
+  def _prepare_test_run(self, targets, options):
+    test_options = {
+      'colors': False,
+      'level': 'info',
+      'fast': False,
+    }
+    test_options.update(options)
+
+    # The easiest way to create the products that PytestRun requires is to execute the tasks that produce them.
+    si_task_type = self.synthesize_task_subtype(SelectInterpreter, 'si_scope')
+    rr_task_type = self.synthesize_task_subtype(ResolveRequirements, 'rr_scope')
+    gs_task_type = self.synthesize_task_subtype(GatherSources, 'gs_scope')
+    pp_task_type = self.synthesize_task_subtype(PytestPrep, 'pp_scope')
+    self.set_options(**test_options)
+    context = self.context(for_task_types=[si_task_type, rr_task_type, gs_task_type, pp_task_type],
+                           target_roots=targets)
+    si_task_type(context, os.path.join(self.pants_workdir, 'si')).execute()
+    rr_task_type(context, os.path.join(self.pants_workdir, 'rr')).execute()
+    gs_task_type(context, os.path.join(self.pants_workdir, 'gs')).execute()
+    pp_task_type(context, os.path.join(self.pants_workdir, 'pp')).execute()
+    return context
+
+  def _run(self, targets, **options):
+    """Run the tests in the given targets, and return the exception the run raised, if any, and the junit xml and
+    coverage files that it exposed.
+    """
+    with temporary_dir() as junit_xml_dir:
+      options.update(junit_xml_dir=junit_xml_dir, coverage='auto')
+      context = self._prepare_test_run(targets, options)
+      coverage_dir = os.path.join(context.options.for_global_scope().pants_distdir, 'coverage')
+      if os.path.isdir(coverage_dir):
+        shutil.rmtree(coverage_dir)
+
+      error = None
+      try:
+        self.create_task(context).execute()
+      except TaskError as e:
+        error = e
+
+      coverage_files = []
+      for root, _, files in os.walk(coverage_dir):
+        coverage_files.extend(os.path.relpath(os.path.join(root, f), coverage_dir) for f in files)
+      return error, sorted(os.listdir(junit_xml_dir)), sorted(coverage_files)
+
+  def test_concurrent_partitions_match_a_serial_run(self):
+    serial_error, serial_junit_files, serial_coverage_files = self._run(self.targets, parallelism=1)
+    error, junit_files, coverage_files = self._run(self.targets, parallelism=2)
+
+    self.assertIsInstance(serial_error, ErrorWhileTesting)
+    self.assertIsInstance(error, ErrorWhileTesting)
+    self.assertEqual({self.red}, set(serial_error.failed_targets))
+    self.assertEqual({self.red}, set(error.failed_targets))
+    self.assertEqual(str(serial_error), str(error))
+
+    self.assertEqual(3, len(junit_files))
+    self.assertEqual(serial_junit_files, junit_files)
+    self.assertTrue(coverage_files)
+    self.assertEqual(serial_coverage_files, coverage_files)
+
+  def test_partition_exception_is_raised_in_order(self):
+    targets = [self.green, self.broken, self.green2]
+    serial_error, serial_junit_files, serial_coverage_files = self._run(targets, parallelism=1)
+    error, junit_files, coverage_files = self._run(targets, parallelism=3)
+
+    self.assertIsInstance(error, TaskError)
+    self.assertNotIsInstance(error, ErrorWhileTesting)
+    self.assertTrue(str(error).startswith('Error parsing xml file at '))
+    self.assertEqual(str(serial_error), str(error))
+    # The last partition ran alongside the others, but the task stops at the failed one, as a serial run does.
+    self.assertEqual(2, len(junit_files))
+    self.assertFalse(any('green2' in junit_file for junit_file in junit_files))
+    self.assertEqual(serial_junit_files, junit_files)
+    self.assertEqual(serial_coverage_files, coverage_files)
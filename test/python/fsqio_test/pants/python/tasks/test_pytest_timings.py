@@ -0,0 +1,103 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fsqio.pants.python.tasks.pytest_collection_cache import collection_conftest_content
+from fsqio.pants.python.tasks.pytest_timings import PytestTimings, duration_shard_conftest_content, timing_key
+
+
+class FakeItem(object):
+  def __init__(self, nodeid, fspath):
+    self.nodeid = nodeid
+    self.fspath = fspath
+
+
+class TestPytestTimings(unittest.TestCase):
+
+  CHROOT_FILE = '/chroot/io/fsq/a_test.py'
+  SOURCES_MAP = {CHROOT_FILE: 'test/python/io/fsq/a_test.py'}
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _conftest(self, shard, nshards, timings):
+    class NodeRenamerPlugin(object):
+      _SOURCES_MAP = self.SOURCES_MAP
+    namespace = {'NodeRenamerPlugin': NodeRenamerPlugin}
+    exec(collection_conftest_content(None, None), namespace)
+    exec(duration_shard_conftest_content(shard, nshards, timings), namespace)
+    return namespace
+
+  def test_junit_and_collected_keys_agree(self):
+    conftest = self._conftest(0, 2, {})
+    cases = [
+      ('chroot/io/fsq/a_test.py::test_top', 'chroot.io.fsq.a_test', 'test_top'),
+      ('chroot/io/fsq/a_test.py::TestA::()::test_method', 'chroot.io.fsq.a_test.TestA', 'test_method'),
+      ('chroot/io/fsq/a_test.py::TestA::test_param[a::b.c]', 'chroot.io.fsq.a_test.TestA', 'test_param[a::b.c]'),
+    ]
+    for nodeid, classname, name in cases:
+      item = FakeItem(nodeid, self.CHROOT_FILE)
+      self.assertEqual(
+        timing_key('test/python/io/fsq/a_test.py', 'chroot/io/fsq/a_test.py', classname, name),
+        conftest['_pants_timing_key'](conftest['_pants_item_address'](item)),
+      )
+
+  def test_longest_processing_time_then_round_robin(self):
+    assign = self._conftest(0, 2, {})['_pants_assign_shards']
+    keys = ['a', 'b', 'c', 'd', 'new1', 'new2', 'new3']
+    timings = {'a': 1.0, 'b': 5.0, 'c': 3.0, 'd': 3.0}
+    # b (5s) then c (3s) open the two shards, d joins c (6s) and a joins b (6s). The new tests are dealt in order.
+    self.assertEqual([0, 0, 1, 1, 0, 1, 0], assign(keys, timings, 2))
+    # The layout does not depend on collection order.
+    shards = dict(zip(reversed(keys[:4]), assign(list(reversed(keys[:4])), timings, 2)))
+    self.assertEqual({'a': 0, 'b': 0, 'c': 1, 'd': 1}, shards)
+
+  def _record(self, path, timings):
+    timings_db = PytestTimings(path)
+    timings_db.record(timings)
+    timings_db.write(self.tmpdir)
+
+  def _create_sources(self, *sources):
+    os.makedirs(os.path.join(self.tmpdir, 'src'))
+    for source in sources:
+      with open(os.path.join(self.tmpdir, source), 'w') as f:
+        f.write('')
+
+  def test_records_and_filters_timings_by_source(self):
+    self._create_sources('src/a_test.py', 'src/b_test.py')
+    path = os.path.join(self.tmpdir, 'timings.json')
+    self._record(path, {'src/a_test.py::test_one': 1.5, 'src/b_test.py::test_two': 2.0})
+    self._record(path, {'src/a_test.py::test_one': 0.5})
+    self.assertEqual({'src/a_test.py::test_one': 0.5}, PytestTimings(path).timings_for_sources(['src/a_test.py']))
+
+  def test_writes_once_and_drops_deleted_sources(self):
+    self._create_sources('src/a_test.py')
+    path = os.path.join(self.tmpdir, 'timings.json')
+    timings_db = PytestTimings(path)
+    timings_db.record({'src/a_test.py::test_one': 1.5, 'src/deleted_test.py::test_two': 2.0})
+    self.assertFalse(os.path.exists(path))
+    timings_db.write(self.tmpdir)
+    self.assertEqual(
+      {'src/a_test.py::test_one': 1.5},
+      PytestTimings(path).timings_for_sources(['src/a_test.py', 'src/deleted_test.py']),
+    )
+
+  def test_snapshot_is_frozen_once_read(self):
+    self._create_sources('src/a_test.py')
+    path = os.path.join(self.tmpdir, 'timings.json')
+    self._record(path, {'src/a_test.py::test_one': 1.5})
+    snapshot = PytestTimings(path)
+    digest = snapshot.digest()
+    self._record(path, {'src/a_test.py::test_one': 0.5})
+    self.assertEqual({'src/a_test.py::test_one': 1.5}, snapshot.timings_for_sources(['src/a_test.py']))
+    self.assertEqual(digest, snapshot.digest())
+    self.assertNotEqual(digest, PytestTimings(path).digest())
@@ -0,0 +1,105 @@
+# coding=utf-8
+# Copyright 2019 Foursquare Labs Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from textwrap import dedent
+import time
+import unittest
+
+import pkg_resources
+
+from fsqio.pants.python.tasks.pytest_workers import PytestWorkerError, PytestWorkerPool
+
+
+class TestPytestWorkerPool(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.pool_dir = os.path.join(self.tmpdir, 'pool')
+    self.server = pkg_resources.resource_filename('fsqio.pants.python.tasks', 'worker/server.py')
+    self.workers = []
+    self.test_file = os.path.join(self.tmpdir, 'test_sample.py')
+    with open(self.test_file, 'w') as fp:
+      fp.write(dedent("""
+        def test_pass():
+          print('ran test_pass')
+
+        def test_fail():
+          assert False
+      """))
+
+  def tearDown(self):
+    for worker in self.workers:
+      if worker.poll() is None:
+        worker.kill()
+      worker.wait()
+    shutil.rmtree(self.tmpdir)
+
+  def _start_worker(self, socket_path, log_path):
+    with open(log_path, 'a') as log:
+      worker = subprocess.Popen([sys.executable, self.server, socket_path, '60'], stdout=log, stderr=log)
+    self.workers.append(worker)
+    return worker
+
+  def _run(self, pool, args):
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    batch = pool.submit(args, cwd=self.tmpdir, env=dict(os.environ), stdout=stdout, stderr=stderr)
+    return batch.wait(timeout=60), stdout.getvalue().decode('utf-8')
+
+  def test_runs_batches_in_one_warm_worker(self):
+    pool = PytestWorkerPool(self.pool_dir, 'key1', 1, self._start_worker)
+    junitxml = os.path.join(self.tmpdir, 'TEST-sample.xml')
+    rc, output = self._run(pool, ['-s', '-p', 'no:cacheprovider', '--junitxml', junitxml, self.test_file])
+    self.assertEqual(1, rc)
+    self.assertIn('ran test_pass', output)
+    self.assertTrue(os.path.isfile(junitxml))
+
+    rc, _ = self._run(pool, ['-p', 'no:cacheprovider', '-k', 'test_pass', self.test_file])
+    self.assertEqual(0, rc)
+    self.assertEqual(1, len(self.workers))
+
+  def test_recycles_the_workers_of_other_keys(self):
+    old_pool = PytestWorkerPool(self.pool_dir, 'old', 1, self._start_worker)
+    self._run(old_pool, ['-p', 'no:cacheprovider', '--collect-only', self.test_file])
+    old_worker = self.workers[0]
+
+    PytestWorkerPool(self.pool_dir, 'new', 1, self._start_worker).recycle_stale_workers()
+    deadline = time.time() + 30
+    while old_worker.poll() is None and time.time() < deadline:
+      time.sleep(0.05)
+    self.assertEqual(0, old_worker.poll())
+    self.assertEqual(['new'], os.listdir(self.pool_dir))
+
+  def test_terminating_a_batch_keeps_the_worker(self):
+    pool = PytestWorkerPool(self.pool_dir, 'key1', 1, self._start_worker)
+    slow_test_file = os.path.join(self.tmpdir, 'test_slow.py')
+    with open(slow_test_file, 'w') as fp:
+      fp.write('import time\n\ndef test_slow():\n  time.sleep(60)\n')
+    batch = pool.submit(['-p', 'no:cacheprovider', slow_test_file], cwd=self.tmpdir, env=dict(os.environ),
+                        stdout=io.BytesIO(), stderr=io.BytesIO())
+    self.assertIsNone(batch.wait(timeout=0.5))
+    batch.terminate()
+
+    rc, _ = self._run(pool, ['-p', 'no:cacheprovider', '-k', 'test_pass', self.test_file])
+    self.assertEqual(0, rc)
+    self.assertEqual(1, len(self.workers))
+
+  def test_refuses_directories_other_users_can_write(self):
+    os.mkdir(self.pool_dir, 0o700)
+    os.chmod(self.pool_dir, 0o777)
+    with self.assertRaises(PytestWorkerError):
+      PytestWorkerPool(self.pool_dir, 'key1', 1, self._start_worker)
+
+    os.chmod(self.pool_dir, 0o700)
+    nested_pool_dir = os.path.join(self.pool_dir, 'workdir')
+    os.mkdir(nested_pool_dir, 0o755)
+    with self.assertRaises(PytestWorkerError):
+      PytestWorkerPool(nested_pool_dir, 'key1', 1, self._start_worker, private_root=self.pool_dir)
+    self.assertEqual([], self.workers)